@@ -1,168 +1,684 @@
 '''
 splitMerge.py
 (do an external merge sort)
+
+Each (docId, docId) pair is packed into one uint64 key, lower id in the
+high 32 bits (see idIntern.packPair), so the keys sort numerically like
+the pairs.  The chunks (runs) are raw little-endian uint64 keys, sorted
+and distinct, with no header: the merge reads them a block of keys at a
+time, and only the final output is text again.
+The text input is parsed, and the runs sorted, merged and deduplicated,
+a block at a time with list/set/sort builtins rather than per pair.
+
+With numWorkers > 1 the input is split into byte ranges (see
+paymentCache.findRanges), each made into runs by its own process.  Every
+chunk read by a merge is read ahead by a background thread (see
+inputStream.BlockPrefetcher), so the merge does not wait on each read.
+
+sortFile runs the whole job with a manifest (see Manifest) of the runs
+and merge outputs it has finished, so that a job restarted after a crash
+picks up where it stopped instead of re-partitioning the input.
 '''
 
 import os
+import sys
 import math
+import json
+import struct
 import itertools
+import multiprocessing
+from array import array
+from bisect import bisect_right
+from itertools import izip
 from subprocess import call
 
+# Shared modules (inputStream.py, edgeWriter.py) live in data/, one level up.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import inputStream
+import edgeWriter
+from idIntern import PAIR_SHIFT, PAIR_MASK
+from paymentCache import fileHash, findRanges
+
+UINT64 = 'L' # array typecode of a key (Python 2's array has no 'Q')
+assert array(UINT64).itemsize == 8, "64-bit longs required (array typecode 'L')"
+KEY_BYTES = 8
+RUN_BLOCK_KEYS = 1 << 16 # keys read or written at a time
+PARSE_BYTES = 1 << 18 # input text parsed at a time
+RUN_MEMORY_BYTES = 1 << 28 # default memory budget of run generation
+POOL_KEY_BYTES = 40 # memory per key held: a python int and its list slot
+CHUNK_COMMENT = "doctorId   doctorId" # header line of the output
+MERGE_FAN_IN = 64 # most chunks open at once in a merge pass
+PREFETCH_BLOCKS = 2 # blocks read ahead per chunk in a merge (double buffering)
+MANIFEST_VERSION = 2
+
+
+'''
+Write a chunk file: keyBlocks, an iterable of blocks (sequences) of
+sorted distinct packed pair keys, as raw little-endian uint64s.
+chunk, the file name (or a new ChunkWriter).
+Returns the number of keys written.
+'''
+def writeChunk(chunk, keyBlocks):
+   if not isinstance(chunk, ChunkWriter):
+      chunk = ChunkWriter(chunk)
+   for block in keyBlocks:
+      chunk.write(array(UINT64, block))
+   return chunk.close()
 
 
 '''
-Write a line in a tab file (like gnuplot takes as input).
+The sorted distinct keys of an array of packed pair keys.
 '''
-def writeTab(fout, x, y, z=None):
-   fout.write(str(x))
-   fout.write('\t')
-   fout.write(str(y))
-   if z is not None:
-      fout.write('\t')
-      fout.write(str(z))   
-   fout.write('\n')
+def sortedDistinct(keys):
+   return array(UINT64, sorted(set(keys)))
 
 
 '''
-Write out a chunk into fout, the set of (docID, docID) tuples in partSet,
-with a tab between them.  Also add a header comment line to the file.
+The packed pair keys of data, whole "docId docId" lines of text.
 '''
-def writeChunk(fout, partSet):
-   print "Writing chunk "+str(fout.name)
-   fout.write("# doctorId   doctorId\n")
-   for s in sorted(partSet):
-      writeTab(fout, s[0], s[1])
+def packLines(data):
+   ids = map(int, data.split())
+   numLines = data.count('\n') + (0 if data.endswith('\n') else 1)
+   if len(ids) != 2 * numLines:
+      raise ValueError("expected two doctor ids per line")
+   if len(ids) > 0 and (min(ids) < 0 or max(ids) > PAIR_MASK):
+      raise ValueError("doctor ids do not fit a packed pair")
+   return array(UINT64, [(a << PAIR_SHIFT) | b if a <= b else (b << PAIR_SHIFT) | a
+                         for a, b in izip(ids[0::2], ids[1::2])])
 
    
+'''
+The packed pair keys of wholefileN, less its first line (assumed to be a
+header), in blocks (arrays) of about PARSE_BYTES of input.
+skipKeys, the number of lines (keys) to skip first: they are counted,
+not parsed.
+start, end, a byte range of whole lines to read instead (see
+paymentCache.findRanges; a compressed file is one range).
+'''
+def inputKeyBlocks(wholefileN, skipKeys=0, start=0, end=None):
+   wholeFileBytes = os.stat(wholefileN).st_size
+   if end is None or inputStream.isCompressed(wholefileN):
+      end = wholeFileBytes
+   # wholefileN may be compressed (see inputStream.py); fin.tell() is then
+   # the compressed offset, which is what wholeFileBytes measures.
+   fin = inputStream.openInput(wholefileN)
+   with fin:
+      if start == 0:
+         fin.readline() # skip header/comment line
+      else:
+         fin.seek(start)
+      numPairs = 0
+      rest = "" # a partial line, carried to the next block
+      while True:
+         # (For a compressed file tell() does not count the data read.)
+         n = PARSE_BYTES if end == wholeFileBytes else min(PARSE_BYTES, end - fin.tell())
+         data = fin.read(n) if n > 0 else ""
+         last = len(data) == 0
+         data = rest + data
+         cut = len(data) if last else data.rfind('\n') + 1
+         data, rest = data[:cut], data[cut:]
+         if len(data) > 0 and skipKeys > 0:
+            numLines = data.count('\n') + (0 if data.endswith('\n') else 1)
+            if numLines <= skipKeys:
+               data = ""
+            else:
+               data = data.split('\n', skipKeys)[-1]
+               numLines = skipKeys
+            skipKeys -= numLines
+            numPairs += numLines
+         if len(data) > 0:
+            keys = packLines(data)
+            if (numPairs + len(keys)) / 1000000 > numPairs / 1000000:
+               print "Read %f %% of input" %(fin.tell()*100./float(wholeFileBytes))
+            numPairs += len(keys)
+            yield keys
+         if last:
+            return
+
+
+'''
+A chunk file being written a block of keys at a time (see writeChunk).
+'''
+class ChunkWriter:
+   def __init__(self, chunkName):
+      print "Writing chunk "+chunkName
+      self.name = chunkName
+      self.fout = open(chunkName, "wb")
+      self.numKeys = 0
+
+   def write(self, block):
+      if sys.byteorder == "big":
+         block = array(UINT64, block)
+         block.byteswap()
+      block.tofile(self.fout)
+      self.numKeys += len(block)
+
+   def close(self):
+      self.fout.close()
+      return self.numKeys
+
+
 '''
 Open a file named wholeFileN, discard the first line (assumed to be a
-header), and then partition the remaining lines into four chunks.
-Based on knowing the input file format, these chunks are built
-sequentially rather than round-robin.
+header), and then split the remaining lines into chunks (runs) of sorted,
+distinct packed pair keys (see above), holding at most memoryBytes of
+keys at a time.
+The runs are formed by replacement selection: a pool holds as many keys
+as the budget allows; the smallest are written to the current run and
+replaced by the next input keys, which join the pool if they are not
+below the last key written, and are otherwise held back for the next
+run.  A run ends when every held key is held back.  On unordered input
+the runs average about twice the keys the budget holds (and sorted input
+is one run), so the number of chunks follows from the data and the
+budget.  The pool is a sorted list and keys move in blocks of an eighth
+of it (one slice and one sort per block, instead of a heap operation per
+key).
+manifest, a Manifest to record each finished run in, with a checkpoint
+(the pool, and the input keys consumed) to restart the next run from.
+Runs it already records are reused; if one of them no longer verifies,
+the runs are all redone.
+numWorkers > 1 forms the runs in parallel (see parallelRuns).
 Returns a list of the file names the chunks were saved under
 '''
-def partitionAndRemoveDups(wholefileN, NUM_PARTITIONS):
+def partitionAndRemoveDups(wholefileN, memoryBytes=RUN_MEMORY_BYTES, manifest=None, numWorkers=1):
+   if numWorkers > 1:
+      ranges = findRanges(wholefileN, numWorkers)
+      if len(ranges) > 1:
+         return parallelRuns(wholefileN, ranges, memoryBytes, manifest, numWorkers)
+
+   maxKeys = max(1, memoryBytes / POOL_KEY_BYTES)
    chunks = []
+   pool = [] # keys of the first run
+   consumed = 0 # input keys consumed so far
+
+   if manifest is not None:
+      job = manifest.data
+      if job["ranges"] is not None or \
+         not all([manifest.isValid(run) for run in job["runs"]]) or \
+         (job["resume"] is not None and not manifest.isValid(job["resume"]["pool"])):
+         print "Redoing the runs"
+         manifest.restart()
+      chunks = [run["name"] for run in job["runs"]]
+      if job["runsDone"]:
+         return chunks
+      if job["resume"] is not None:
+         print "Resuming after run %d" %(len(chunks))
+         pool = list(itertools.chain.from_iterable(readChunk(job["resume"]["pool"]["name"])))
+         consumed = job["resume"]["consumed"]
+
+   names = itertools.count(len(chunks) + 1)
+   def newChunk():
+      return ChunkWriter(wholefileN+"_chunk"+str(next(names))+".bin")
+
+   checkpoint = manifest.checkpoint if manifest is not None else None
+   keys = itertools.chain.from_iterable(inputKeyBlocks(wholefileN, consumed))
+   runs = formRuns(keys, maxKeys, newChunk, pool, consumed, checkpoint)
+   if manifest is not None:
+      manifest.finishRuns(runs)
+   return chunks + [chunkName for chunkName, numKeys in runs]
 
-   # Heuristic for chunk size- don't want to round-robin.
-   wholeFileBytes = os.stat(wholefileN).st_size
-   # Chunk end: file.tell() > curChunk * wholeFileBytes / NUM_PARTITIONS
-   curChunk = 1
-   chunkName = wholefileN+"_chunk"+str(curChunk)
-   chunks.append(chunkName)
-   curChunkF = open(chunkName, "w")
-
-   partSet = set() # set (docId, docID) pairs, sorted so min docId is 1st.
-
-   with open(wholefileN) as fin:
-      curLine = 0
-      for line in fin:
-         curLine += 1
-         if curLine == 1:
-            continue # skip header/comment line
-         if (curLine % 1000000) == 0:
-            print "Read %f %% of input" %(fin.tell()*100./float(wholeFileBytes))
-
-         # New chunk?
-         if fin.tell() > curChunk * wholeFileBytes / NUM_PARTITIONS:
-            writeChunk(curChunkF, partSet)
-            curChunkF.close()
-            curChunk += 1
-            print "New chunk: %d" %(curChunk)
-            chunkName = wholefileN+"_chunk"+str(curChunk)
-            chunks.append(chunkName)
-            curChunkF = open(chunkName, "w")
-            partSet = set()
-         s = line.split()
-         assert(len(s) == 2)
-         partSet.add(( min(s[0],s[1]), max(s[0],s[1]) ))
-
-   writeChunk(curChunkF, partSet)
-   curChunkF.close()
-
-   assert(len(chunks) == NUM_PARTITIONS)
-   return chunks
-
-
-'''
-A ChunkReader is an interface to the head element of a chunk file.
-Used by mergeChunks.
+
+'''
+Replacement selection (see partitionAndRemoveDups) of keys, an iterator
+of packed pair keys, holding at most maxKeys.  newChunk() opens the
+ChunkWriter of each next run.
+pool, the sorted keys held by the first run, and consumed, the keys
+consumed before keys (both as saved by a checkpoint).
+checkpoint(runName, numKeys, pool, consumed), if given, is called as
+each run but the last is finished, with the state the next run starts
+from.
+Returns the list of (file name, number of keys) of the runs written.
+'''
+def formRuns(keys, maxKeys, newChunk, pool=None, consumed=0, checkpoint=None):
+   blockKeys = max(1, maxKeys / 8)
+   pool = [] if pool is None else pool # keys of the current run
+   nextRun = [] # keys held back for the next run
+   runs = []
+   chunk = newChunk()
+   last = -1 # the last key written to the current run
+
+   for block in edgeWriter.blocks(keys, blockKeys):
+      # Write out the smallest keys, to make room for block.
+      excess = len(pool) + len(nextRun) + len(block) - maxKeys
+      while excess > 0:
+         if len(pool) == 0:
+            # Every held key is below the current run: start the next one.
+            runs.append((chunk.name, chunk.close()))
+            last = -1
+            nextRun.sort()
+            pool, nextRun = nextRun, []
+            if checkpoint is not None:
+               checkpoint(runs[-1][0], runs[-1][1], pool, consumed)
+            chunk = newChunk()
+         n = min(excess, len(pool))
+         last = writeDistinct(chunk, pool[:n], last)
+         del pool[:n]
+         excess -= n
+      pool.extend([key for key in block if key >= last])
+      pool.sort()
+      nextRun.extend([key for key in block if key < last])
+      consumed += len(block)
+
+   # End of the input: the rest of the current run, then the held back keys.
+   writeDistinct(chunk, pool, last)
+   runs.append((chunk.name, chunk.close()))
+   if len(nextRun) > 0:
+      chunk = newChunk()
+      runs.append((chunk.name, writeChunk(chunk, [sortedDistinct(nextRun)])))
+   return runs
+
+
+'''
+Pool worker for parallelRuns: form the runs of one byte range of the
+input (chunks named wholefileN_chunkR_K.bin, for range R) and record them.
+Returns (range index, [manifest entries of its runs]).
+'''
+def rangeRunsWorker(args):
+   wholefileN, index, start, end, memoryBytes = args
+   names = itertools.count(1)
+   def newChunk():
+      return ChunkWriter("%s_chunk%d_%d.bin" %(wholefileN, index + 1, next(names)))
+   keys = itertools.chain.from_iterable(inputKeyBlocks(wholefileN, 0, start, end))
+   runs = formRuns(keys, max(1, memoryBytes / POOL_KEY_BYTES), newChunk)
+   return index, [fileEntry(chunkName, numKeys) for chunkName, numKeys in runs]
+
+
+'''
+partitionAndRemoveDups with numWorkers processes: each byte range of
+ranges is made into runs by replacement selection in its own worker,
+with memoryBytes / numWorkers.
+manifest, a Manifest to record the runs of each range in as it is
+finished; the ranges it records are reused if their runs verify (ranges
+are redone whole, there is no checkpoint within one).
+Returns the list of chunk file names, in range order.
+'''
+def parallelRuns(wholefileN, ranges, memoryBytes, manifest=None, numWorkers=1):
+   ranges = [[start, end] for start, end in ranges]
+   rangeRuns = dict() # range index -> manifest entries of its runs
+   if manifest is not None:
+      job = manifest.data
+      if job["ranges"] != ranges:
+         if job["runs"] or job["rangeRuns"]:
+            print "Redoing the runs"
+         manifest.restart()
+         job["ranges"] = ranges
+      for index, runs in job["rangeRuns"].items():
+         if all([manifest.isValid(run) for run in runs]):
+            rangeRuns[int(index)] = runs
+      if job["runsDone"] and len(rangeRuns) == len(ranges):
+         return [run["name"] for run in job["runs"]]
+
+   jobs = [(wholefileN, index, ranges[index][0], ranges[index][1], memoryBytes / numWorkers)
+           for index in xrange(len(ranges)) if index not in rangeRuns]
+   if len(jobs) < len(ranges):
+      print "Reusing the runs of %d of %d input ranges" %(len(ranges) - len(jobs), len(ranges))
+   pool = multiprocessing.Pool(numWorkers)
+   try:
+      for index, runs in pool.imap_unordered(rangeRunsWorker, jobs):
+         rangeRuns[index] = runs
+         if manifest is not None:
+            manifest.finishRange(index, runs)
+   finally:
+      pool.close()
+      pool.join()
+
+   runs = list(itertools.chain.from_iterable(rangeRuns[index] for index in xrange(len(ranges))))
+   if manifest is not None:
+      manifest.finishRanges(runs)
+   return [run["name"] for run in runs]
+
+
+'''
+Write keys, a sorted list, to chunk (a ChunkWriter), less repeats and
+less a key equal to last (the key written before them).
+Returns the last key written.
+'''
+def writeDistinct(chunk, keys, last):
+   for block in edgeWriter.blocks(keys, RUN_BLOCK_KEYS):
+      block = [key for key, prev in izip(block, [last] + block) if key != prev]
+      if len(block) > 0:
+         chunk.write(array(UINT64, block))
+         last = block[-1]
+   return last
+
+
+'''
+A ChunkReader reads the keys of a chunk file in blocks.  Used by
+mergeChunks.  A background thread reads up to prefetchBlocks blocks of
+RUN_BLOCK_KEYS keys ahead (see inputStream.BlockPrefetcher; a compressed
+chunk is read through inputStream), and blocks() unpacks them.
 '''
 class ChunkReader:
-   def __init__(self, chunkfileName):
+   def __init__(self, chunkfileName, prefetchBlocks=PREFETCH_BLOCKS):
       self.fn = chunkfileName
-      self.fin = open(chunkfileName, "r")
-      # Discard the first header line
-      self.fin.readline()
-      self.nextEntry = None
+      self.fin = inputStream.openInput(chunkfileName)
+      self.data = inputStream.BlockPrefetcher(self.readBlocks(), prefetchBlocks)
+
+   def readBlocks(self):
+      while True:
+         data = self.fin.read(RUN_BLOCK_KEYS * KEY_BYTES)
+         if len(data) == 0:
+            return
+         yield data
 
    def close(self):
+      self.data.close()
       self.fin.close()
 
-   def nextLine(self):
-      try:
-         line = self.fin.readline()
-         s = line.split()
-         self.nextEntry = (int(s[0]), int(s[1]))
-      except IOError as e:
-         print "IOError on read (chunk done?): " + e.strerror
-         self.nextEntry = None
-         self.close()
+   def blocks(self):
+      for data in self.data:
+         if len(data) % KEY_BYTES != 0:
+            raise IOError("truncated key in chunk "+self.fn)
+         yield struct.unpack("<%dQ" % (len(data) / KEY_BYTES), data)
 
-   def head(self):
-      return self.nextEntry
+
+'''
+The blocks of keys of the chunk file chunkName.
+'''
+def readChunk(chunkName):
+   cr = ChunkReader(chunkName)
+   try:
+      for block in cr.blocks():
+         yield block
+   finally:
+      cr.close()
+
+
+'''
+Merge the sorted chunks of readers (ChunkReaders) a block at a time.
+Yields lists of distinct packed keys, each sorted and above the keys of
+the lists before it.
+Each round takes, from every chunk's current block, its keys up to
+cutoff, the smallest last key of those blocks: no key still unread is
+below cutoff, so the keys taken are merged and deduplicated on their own
+(one sort, which merges their sorted runs, and a pass dropping repeats),
+and at least one block is used up per round.  At most one block per
+chunk is held.
+'''
+def mergedKeyBlocks(readers):
+   current = [] # [block, position in it, block iterator] of each open chunk
+   for cr in readers:
+      c = [None, 0, cr.blocks()]
+      if nextBlock(c):
+         current.append(c)
+
+   while len(current) > 0:
+      cutoff = min([c[0][-1] for c in current])
+      taken = []
+      for c in current:
+         block, start = c[0], c[1]
+         end = bisect_right(block, cutoff, start)
+         taken.extend(block[start:end])
+         c[1] = end
+         if end == len(block) and not nextBlock(c):
+            c[0] = None
+      current = [c for c in current if c[0] is not None]
+      taken.sort()
+      yield taken[:1] + [b for a, b in izip(taken, itertools.islice(taken, 1, None)) if a != b]
+
+
+'''
+Move a chunk of mergedKeyBlocks on to its next non-empty block.
+False when the chunk is done.
+'''
+def nextBlock(c):
+   for block in c[2]:
+      if len(block) > 0:
+         c[0], c[1] = block, 0
+         return True
+   return False
+
+
+'''
+One merge pass: merge the chunks named chunksN into outputN, written a
+block at a time.  With final, outputN is the text (or edgeWriter .bin)
+pair file, else another chunk file.
+Returns the number of distinct pairs written.
+'''
+def mergePass(outputN, chunksN, final=False):
+   readers = []
+   try:
+      for fname in chunksN:
+         readers.append(ChunkReader(fname))
+      keyBlocks = mergedKeyBlocks(readers)
+      if not final:
+         return writeChunk(outputN, keyBlocks)
+      pairs = itertools.chain.from_iterable([(key >> PAIR_SHIFT, key & PAIR_MASK) for key in keys]
+                                            for keys in keyBlocks)
+      return edgeWriter.writeRows(outputN, pairs, CHUNK_COMMENT)
+   finally:
+      for cr in readers:
+         cr.close()
 
 
 '''
 Given a final output file name and a list of chunk filenames, merge the
 chunks into one output file, and eliminate duplicates.
+At most fanIn chunks are open at once: with more chunks than that,
+groups of fanIn chunks are first merged into intermediate chunks
+(finaloutputfileN+"_passP_I.bin"), pass after pass, until one pass can
+merge them all.  Memory is one block of keys per
+open chunk, plus one block of output.
+manifest, a Manifest to record each intermediate chunk and the output
+in.  Merging resumes after the latest pass whose chunks all verify
+(searching from the last pass), reusing the chunks of the next pass
+which do.  A pass's chunks are removed once the next pass is recorded
+(so the latest finished pass is always on disk), and the last pass's
+once the output verifies.
+Returns the number of distinct pairs written.
 '''
-def mergeChunks(finaloutputfileN, chunksN):
+def mergeChunks(finaloutputfileN, chunksN, fanIn=MERGE_FAN_IN, manifest=None):
    assert(finaloutputfileN != "")
    assert(len(chunksN) > 0)
+   assert(fanIn > 1)
+
+   passes = manifest.data["passes"] if manifest is not None else []
+   mergePassN = 0
+   intermediate = []
+   # Skip the passes already finished: resume after the latest one whose
+   # chunks all verify (those of the passes before it may be removed).
+   numChunks = [len(chunksN)] # chunks merged by each pass, then the final merge
+   while numChunks[-1] > fanIn:
+      numChunks.append((numChunks[-1] + fanIn - 1) / fanIn)
+   for p in xrange(min(len(passes), len(numChunks) - 1), 0, -1):
+      finished = passes[p - 1]
+      if len(finished) == numChunks[p] and all([manifest.isValid(a) for a in finished]):
+         mergePassN = p
+         print "Merge passes 1-%d: done" %(mergePassN)
+         chunksN = intermediate = [a["name"] for a in finished]
+         break
+   del passes[mergePassN + 1:]
+
+   while len(chunksN) > fanIn:
+      mergePassN += 1
+      print "Merge pass %d: %d chunks" %(mergePassN, len(chunksN))
+      if len(passes) < mergePassN:
+         passes.append([])
+      finished = dict((a["name"], a) for a in passes[mergePassN - 1])
+      merged = []
+      for i in xrange(0, len(chunksN), fanIn):
+         outputN = "%s_pass%d_%d.bin" %(finaloutputfileN, mergePassN, len(merged))
+         merged.append(outputN)
+         if outputN in finished and manifest.isValid(finished[outputN]):
+            continue
+         numKeys = mergePass(outputN, chunksN[i:i+fanIn])
+         if manifest is not None:
+            passes[mergePassN - 1] = [a for a in passes[mergePassN - 1] if a["name"] != outputN]
+            passes[mergePassN - 1].append(fileEntry(outputN, numKeys))
+            manifest.save()
+      # The previous pass's intermediate chunks are merged: remove them.
+      for fname in intermediate:
+         os.remove(fname)
+      chunksN = intermediate = merged
+
+   print "Final merge: %d chunks" %(len(chunksN))
+   n = mergePass(finaloutputfileN, chunksN, True)
+   if manifest is not None:
+      manifest.finishOutput(finaloutputfileN, n)
+   for fname in intermediate:
+      os.remove(fname)
+   return n
 
-   # Open the chunks
-   chunks = []
-   for fname in chunksN:
-      cr = ChunkReader(fname)
-      # Seed the chunk
-      cr.nextLine()
-      assert(cr.head() != None)
-      chunks.append(cr)
 
-   # TODO debug remove
-   for c in chunks:
-      print " option: " + str(c.head())
+'''
+The manifest entry of a finished file: its size and md5 (to verify it
+with before reuse), and its number of keys.
+'''
+def fileEntry(fname, numKeys):
+   return {"name": fname, "size": os.path.getsize(fname), "md5": fileHash(fname), "numKeys": numKeys}
+
+
+'''
+The manifest of an external sort job (see sortFile): the files it has
+finished, so that a restarted job reuses them.  A JSON file, rewritten
+(through a .tmp and a rename) whenever a run, an intermediate chunk or
+the output is finished:
+   input        name, size and mtime of the input file
+   memoryBytes  the run generation budget
+   fanIn        the merge fan-in
+   runs         the finished runs, in order
+   resume       where run generation restarts: the input keys consumed,
+                and the pool (a chunk file) at that point, or None
+   ranges       the input byte ranges, when the runs are made in parallel
+   rangeRuns    the runs of each finished range (by range index)
+   runsDone     every run is finished
+   passes       the finished intermediate chunks of each merge pass
+   output       the final output, once finished
+Each finished file is recorded as {name, size, md5, numKeys}, and is
+verified (size and md5) before it is reused.  A manifest for another
+input or memory budget is started over; one for another fan-in keeps the
+runs.
+'''
+class Manifest:
+   def __init__(self, filename, wholefileN, memoryBytes, fanIn):
+      self.filename = filename
+      st = os.stat(wholefileN)
+      self.data = {"version": MANIFEST_VERSION,
+                   "input": {"name": wholefileN, "size": st.st_size, "mtime": st.st_mtime},
+                   "memoryBytes": memoryBytes, "fanIn": fanIn}
+      self.restart()
+      if not os.path.exists(filename):
+         return
+      with open(filename) as fin:
+         job = json.load(fin)
+      if job.get("version") != MANIFEST_VERSION or job["input"] != self.data["input"] or \
+         job["memoryBytes"] != memoryBytes:
+         print "Manifest %s is for another job: starting over" %(filename)
+         return
+      if job["fanIn"] != fanIn:
+         job["fanIn"] = fanIn
+         job["passes"] = []
+         job["output"] = None
+      self.data = job
+
+   '''
+   Forget every finished file.
+   '''
+   def restart(self):
+      self.data.update({"runs": [], "resume": None, "ranges": None, "rangeRuns": {},
+                        "runsDone": False, "passes": [], "output": None})
+
+   def save(self):
+      with open(self.filename + ".tmp", "w") as fout:
+         json.dump(self.data, fout)
+      os.rename(self.filename + ".tmp", self.filename)
+
+   def isValid(self, entry):
+      fname = entry["name"]
+      if not os.path.exists(fname) or os.path.getsize(fname) != entry["size"] or \
+         fileHash(fname) != entry["md5"]:
+         print "%s is missing or changed" %(fname)
+         return False
+      return True
+
+   '''
+   Record a finished run, and the state the next run starts from: pool,
+   the sorted keys held, and consumed, the input keys consumed.
+   '''
+   def checkpoint(self, runName, numKeys, pool, consumed):
+      old = self.data["resume"]
+      self.data["runs"].append(fileEntry(runName, numKeys))
+      poolName = runName + ".pool"
+      writeChunk(poolName, [pool])
+      self.data["resume"] = {"consumed": consumed, "pool": fileEntry(poolName, len(pool))}
+      self.save()
+      if old is not None and old["pool"]["name"] != poolName:
+         os.remove(old["pool"]["name"])
+
+   '''
+   Record the runs (name, numKeys) made, those not yet recorded, and that
+   the runs are done.
+   '''
+   def finishRuns(self, runs):
+      old = self.data["resume"]
+      recorded = set([run["name"] for run in self.data["runs"]])
+      for runName, numKeys in runs:
+         if runName not in recorded:
+            self.data["runs"].append(fileEntry(runName, numKeys))
+      self.data["resume"] = None
+      self.data["runsDone"] = True
+      self.save()
+      if old is not None:
+         os.remove(old["pool"]["name"])
+
+   '''
+   Record the runs (manifest entries) of input range index.
+   '''
+   def finishRange(self, index, runs):
+      self.data["rangeRuns"][str(index)] = runs
+      self.save()
+
+   '''
+   Record the runs of all the ranges, in order, and that they are done.
+   '''
+   def finishRanges(self, runs):
+      self.data["runs"] = runs
+      self.data["runsDone"] = True
+      self.save()
+
+   '''
+   Record the output, and verify it was written whole.
+   '''
+   def finishOutput(self, fname, numPairs):
+      self.data["output"] = fileEntry(fname, numPairs)
+      self.save()
+      if not self.isValid(self.data["output"]):
+         raise IOError("output %s did not verify" %(fname))
+
 
-   # Find the minimum index and value at that index
-   v, i = min((v.head(), i) for (i, v) in enumerate(chunks))
-   print "chose value " +str(v) + " index "+str(i)
-   assert(False)
+'''
+Sort and deduplicate the (docId, docId) pairs of wholefileN into
+finaloutputfileN (see partitionAndRemoveDups and mergeChunks), keeping a
+manifest in finaloutputfileN+".manifest.json": a restarted job reuses the
+runs and merge passes it finished.  Once the output is written and
+verified, the runs are removed.
+Returns the number of distinct pairs.
+'''
+def sortFile(wholefileN, finaloutputfileN, memoryBytes=RUN_MEMORY_BYTES, fanIn=MERGE_FAN_IN, numWorkers=1):
+   manifest = Manifest(finaloutputfileN+".manifest.json", wholefileN, memoryBytes, fanIn)
+   output = manifest.data["output"]
+   if output is not None and manifest.isValid(output):
+      print "%s is already sorted" %(finaloutputfileN)
+      return output["numKeys"]
+
+   print "Partitioning into runs (memory budget %d bytes)..." %(memoryBytes)
+   chunks = partitionAndRemoveDups(wholefileN, memoryBytes, manifest, numWorkers)
+   print "Merging %d partitions..." %(len(chunks))
+   n = mergeChunks(finaloutputfileN, chunks, fanIn, manifest)
+   for fname in chunks:
+      os.remove(fname)
+   return n
 
 
 if __name__ == "__main__":
    print "External sort merge (for the purpose of duplicate elimination)"
    
    wholefileN = "doc_doc_prop_doc_0.25_co_1e-05_.tab"
-   # Split the wholefile into a list of chunks.
-   # "chunks" is a list of filenames containing sorted, duplicate-removed
-   # files.
-   NUM_PARTITIONS = 20
-   print "Partitioning into %d partitions..." %(NUM_PARTITIONS)
-   #TODO restore (already did this run):
-   #chunks = partitionAndRemoveDups(wholefileN, NUM_PARTITIONS)
-   
-   print "Merging partitions..."
+   # Split the wholefile into sorted, duplicate-removed chunks and merge
+   # them; rerun after a crash, this resumes from the manifest.
    finaloutputfileN = wholefileN+".nodups.tab"
-   
-   # TODO temp remove this: did the chunks in a previous run
-   chunks = []
-   for i in range(1,21):
-      n = "doc_doc_prop_doc_0.25_co_1e-05_.tab_chunk"+str(i)
-      chunks.append(n)
-   assert(len(chunks) == NUM_PARTITIONS)
-
-   mergeChunks(finaloutputfileN, chunks)
+   n = sortFile(wholefileN, finaloutputfileN, numWorkers=multiprocessing.cpu_count())
+   print "Wrote %d distinct pairs to %s" %(n, finaloutputfileN)
 
    
 
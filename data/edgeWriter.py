@@ -0,0 +1,147 @@
+'''
+edgeWriter.py
+Bryan Lewandowski
+
+Bulk writers for edge lists and histograms.  Rows are formatted a block
+at a time (BLOCK_ROWS rows joined into one string, one write per block)
+rather than a few fout.write calls per field, which on projected graphs
+with hundreds of millions of edges was most of the run time.
+
+The output format follows the file name:
+   x.tab (anything else)  tab separated text, one row per line, with an
+                          optional "# comment" title line (gnuplot/SNAP
+                          input, str() of each field)
+   x.bin                  fixed-width little-endian binary records, no
+                          title line: one int64 per column by default
+                          (struct format, eg: "qq" for an edge list, "qd"
+                          for an int -> float histogram)
+   x.tab.gz, x.bin.gz     gzip compressed
+   x.tab.bz2, x.bin.bz2   bzip2 compressed
+   x.tab.xz, x.bin.xz     xz compressed (needs the lzma module, python 3
+                          or backports.lzma)
+'''
+
+import bz2
+import gzip
+import struct
+import itertools
+
+import inputStream
+from inputStream import lzma
+
+BLOCK_ROWS = 1 << 16 # rows formatted per write
+
+
+'''
+Open filename for writing, compressed if it ends in .gz, .bz2 or .xz.
+'''
+def openOutput(filename):
+   if filename.endswith(".gz"):
+      return gzip.open(filename, "wb")
+   if filename.endswith(".bz2"):
+      return bz2.BZ2File(filename, "wb")
+   if filename.endswith(".xz"):
+      if lzma is None:
+         raise IOError("xz output needs the lzma module: "+filename)
+      return lzma.open(filename, "wb")
+   return open(filename, "wb")
+
+
+'''
+"bin" if filename (less any .gz/.bz2/.xz suffix) is a binary edge file, else
+"tab".
+'''
+def outputFormat(filename):
+   for suffix in [".gz", ".bz2", ".xz"]:
+      if filename.endswith(suffix):
+         filename = filename[:-len(suffix)]
+   return "bin" if filename.endswith(".bin") else "tab"
+
+
+'''
+Split an iterable of rows into lists of at most size rows.
+'''
+def blocks(rows, size=BLOCK_ROWS):
+   rows = iter(rows)
+   while True:
+      block = list(itertools.islice(rows, size))
+      if len(block) == 0:
+         return
+      yield block
+
+
+'''
+Tab separated rows of numColumns fields (str() of each field).
+'''
+class TabWriter:
+   def __init__(self, fout, numColumns=2, comment=""):
+      self.fout = fout
+      self.line = '\t'.join(['%s'] * numColumns) + '\n'
+      if len(comment) > 0:
+         fout.write('# '+comment+'\n')
+
+   def writeRows(self, rows):
+      line = self.line
+      n = 0
+      for block in blocks(rows):
+         self.fout.write(''.join([line % row for row in block]))
+         n += len(block)
+      return n
+
+
+'''
+Fixed-width little-endian binary rows, one struct of format fmt each
+(see the struct module, eg: "qq").
+'''
+class BinaryWriter:
+   def __init__(self, fout, fmt="qq"):
+      self.fout = fout
+      self.record = struct.Struct('<' + fmt)
+
+   def writeRows(self, rows):
+      pack = self.record.pack
+      n = 0
+      for block in blocks(rows):
+         self.fout.write(''.join([pack(*row) for row in block]))
+         n += len(block)
+      return n
+
+
+'''
+Write rows (an iterable of tuples of numColumns fields) to filename, in
+the format its name selects (see above).
+comment, the title line of a text file.
+binaryFormat, the struct format of a binary row (default all int64).
+Returns the number of rows written.
+'''
+def writeRows(filename, rows, comment="", numColumns=2, binaryFormat=None):
+   fout = openOutput(filename)
+   try:
+      if outputFormat(filename) == "bin":
+         writer = BinaryWriter(fout, binaryFormat or 'q' * numColumns)
+      else:
+         writer = TabWriter(fout, numColumns, comment)
+      return writer.writeRows(rows)
+   finally:
+      fout.close()
+
+
+'''
+Read back the rows of a binary file written by writeRows (compressed or
+not, see inputStream.py), as tuples.
+'''
+def readBinaryRows(filename, binaryFormat="qq"):
+   record = struct.Struct('<' + binaryFormat)
+   fin = inputStream.openInput(filename)
+   try:
+      blockBytes = record.size * BLOCK_ROWS
+      while True:
+         data = fin.read(blockBytes)
+         if len(data) == 0:
+            return
+         if len(data) % record.size != 0:
+            raise IOError("truncated binary row in "+filename)
+         for offset in xrange(0, len(data), record.size):
+            yield record.unpack_from(data, offset)
+   finally:
+      fin.close()
@@ -6,38 +6,38 @@ Generate basic stats about the payment_graph_physician_company.csv
 data.
 '''
 
-import os
 import math
 from subprocess import call
+import paymentCache
+import plotManager
+import edgeWriter
+import histograms
+import paymentGraph
+import paymentStats
+import paymentAggregates
+import sketches
+import incrementalStats
+
+DOLLAR_BINSIZE = 10. # bin width of the total payment histograms
 
 
 '''
 Plot a CCDF in gnuplot.
 Inputs: filename, a tab sep file for gnuplot to injest (columns 1,2)
    title, the title of the plot.
-Output: (a gnuplot .png file is created)
+Output: (a gnuplot .png file is created, in the background and only if
+   filename changed since it was last plotted; see plotManager.py)
 '''
 def plotCCDF(filename, title):
-   gnuplotarg = '-e "filenameIn=\''+filename+'\'; titleIn=\''+title+'\'"'
-   os.system( "gnuplot "+gnuplotarg+" plotCCDF.plt" )
+   plotManager.plot("plotCCDF.plt", filename, titleIn=title)
 
 
 '''
-Plot a log-log plot, provided x, y axis titles and graph title.
+Plot a log-log plot, provided x, y axis titles and graph title (in the
+background, as plotCCDF).
 '''
 def plotLogLog(filename, title, xtitle="x", ytitle="y"):
-   gnuplotarg = '-e "filenameIn=\''+filename+'\'; titleIn=\''+title+'\'; xIn=\''+xtitle+'\'; yIn=\''+ytitle+'\'"'
-   os.system( "gnuplot "+gnuplotarg+" plotLogLog.plt" )
-
-
-'''
-Write a line in a tab file (like gnuplot takes as input).
-'''
-def writeTab(fout, x, y):
-   fout.write(str(x))
-   fout.write('\t')
-   fout.write(str(y))
-   fout.write('\n')
+   plotManager.plot("plotLogLog.plt", filename, titleIn=title, xIn=xtitle, yIn=ytitle)
 
 
 '''
@@ -49,11 +49,7 @@ Inputs: d, a dictionary of {int,float} -> {int,float}, which will be
 Outputs: a file "filename.tab", where filename is the input variable.
 '''
 def writeHistogramFile(filename, d, comment=""):
-   with open(filename+".tab", "w") as fout:
-      if len(comment) > 0:
-         fout.write('# '+comment+'\n')
-      for k in sorted(d):
-         writeTab(fout, k, d[k])
+   edgeWriter.writeRows(filename+".tab", ((k, d[k]) for k in sorted(d)), comment)
       
 
 '''
@@ -64,13 +60,15 @@ Returns: a dict: int -> int, which is a integer number of payments to the
       number of doctors who received that many payments.
 '''
 def genPaymentCountHistogram(d):
-   hist = dict()
-   for k in d:
-      numPayments = len(d[k])
-      if numPayments not in hist:
-         hist[numPayments] = 0
-      hist[numPayments] += 1
-   return hist
+   return histograms.countHistogram([len(d[k]) for k in d])
+
+
+'''
+Same as genPaymentCountHistogram, from a dict of int -> int(number of
+payments) rather than the payment lists themselves.
+'''
+def countHistogram(counts):
+   return histograms.countHistogram(counts.values())
 
 
 '''
@@ -94,19 +92,14 @@ Input: d:  a dict int(doctor/companyID) -> float(total payments a doctor
       output are upper bounds (so bin 0 represents the number
       of doctors/companies involved in total payments between
       0 <= x < binsize
+   mode, "linear" (bins of binsize), or "log"/"quantile" bins (see
+      histograms.py), whose counts are densities (per dollar of bin width).
 Output: a binned dict float($) -> int(count), which is the lower bound
    of a bin (size per input), and the number of doctors/companies who
    fall in that bin.
 '''
-def paymentAmountHistogram(d, binsize):
-   assert(binsize > 0)
-   out = dict() # float -> int
-   for k in d:
-      binNum = int( d[k] / binsize )
-      if binNum*binsize not in out:
-         out[binNum*binsize] = 0
-      out[binNum*binsize] += 1
-   return out
+def paymentAmountHistogram(d, binsize, mode="linear"):
+   return histograms.binnedHistogram(d.values(), mode, binsize, density=True)
 
 
 '''
@@ -116,187 +109,242 @@ Input: hist, a dict {int,float} -> int, a histogram, where the first
    value (key) is the "y" and the second is the count of datapoints.
 '''
 def ccdfFromHistogram(hist):
-   datasize = sum( hist.values() )
-   out = dict() # {int,float whatever the key is} -> float(1-0)
-   obsdata = 0  # accumulator for observed data (discards in CCDF)
-   for k in sorted(hist):
-      out[k] = (datasize - obsdata) / float(datasize)
-      assert(out[k] >= 0. and out[k] <= 1.)
-      obsdata += hist[k]
-   return out
+   return histograms.ccdf(hist)
 
 
 '''
 Print secondary statistics.
 Inputs:
-   cosToDocs, dict() of company -> set of doctors paid
-   docsToCos, dict() of doctor -> set of companies recvd from
+   stats, the paymentStats.PaymentStats of the payments (its doctor
+      degree histogram and mean degrees)
+   writeHist, write the degree histogram .tab file (False if it is
+      unchanged, see printIncrementalStats).
 Outputs: (.tab files and gnuplot-generated .png images)
 '''
-def printSecondaries(cosToDocs, docsToCos):
+def printSecondaries(stats, writeHist=True):
    # Generate a histogram
    # Note: all the input data has been coalesced into one company->doc
    #       link, so this is the same as docs_payment_count_hist.tab
    # (number of companies x) (#docs paid by exactly x companies)
-   numCoToNumDocs = dict()
-   for k in docsToCos:
-      cosToThisDoc = len(docsToCos[k])
-      if cosToThisDoc not in numCoToNumDocs:
-         numCoToNumDocs[cosToThisDoc] = 0
-      numCoToNumDocs[cosToThisDoc] += 1
-
-   writeHistogramFile("secondary_numcos_docsPaidByNumCos_hist", numCoToNumDocs, "NumberOfCompaniesX   NumberOfDocsPaidByExactlyXCompanies")
+   if writeHist:
+      writeHistogramFile("secondary_numcos_docsPaidByNumCos_hist", stats.docDegreeHist, "NumberOfCompaniesX   NumberOfDocsPaidByExactlyXCompanies")
 
    # Average degree of a doctor (how many companies pay the doc).
-   docDegSum = 0.
-   for d in docsToCos:
-      docDegSum += len( docsToCos[d] )
-   docDegSum /= len(docsToCos)
-   print "Average degree of a doctor (# cos pay the doc): %f" %(docDegSum)
+   print "Average degree of a doctor (# cos pay the doc): %f" %(stats.meanDocDegree())
 
    # Average degree of a company (how many doctors they pay).
-   coDegSum = 0.
-   for d in cosToDocs:
-      coDegSum += len( cosToDocs[d] )
-   coDegSum /= len(cosToDocs)
-   print "Average degree of a company (# docs they pay): %f" %(coDegSum)
+   print "Average degree of a company (# docs they pay): %f" %(stats.meanCoDegree())
    
 
 
-def printStats(filename):
-   # A few variables used for sanity checks
-   NUM_DOCS = 0
-   NUM_COS = 0
+'''
+Print the statistics of the payment file filename, and write out the
+histogram/CCDF .tab files.
+numWorkers, the number of processes used to parse filename when its
+   binary cache has to be (re)built.
+streaming, use printStreamingStats (bounded memory, no payment lists).
+sketchError, use printStreamingStats with sketches of this error (eg:
+   0.01) for the degrees and payment quantiles.
+incremental, use printIncrementalStats (for a file grown by appending).
+'''
+def printStats(filename, numWorkers=1, streaming=False, sketchError=None, incremental=False):
+   if incremental:
+      printIncrementalStats(filename)
+      return
+   if streaming or sketchError is not None:
+      printStreamingStats(filename, numWorkers, sketchError)
+      return
    printBadLines = False
    
-   # Core structures
-   cos = dict() # company -> list of payments made
-   docs = dict() # doc/providerId -> list of payments recvd
+   # Typed columns, from the binary cache when it is still valid.
+   pc = paymentCache.loadPayments(filename, numWorkers=numWorkers)
+   i = pc.numLines
+   badLines = pc.badLines # integer of bad line numbers in data
+   if(printBadLines):
+      for b in badLines:
+         print "==== Problem on line %d" %(b)
+   rawTotalPayments = 0.
+   for amount in pc.amounts:
+      rawTotalPayments += amount
 
-   # Secondary structures (added later)
-   cosToDocs = dict() # company -> set of doctors paid
-   docsToCos = dict() # doctor -> set of companies recvd from
+   # Core structures (the CSR payment graph), and every statistic below
+   # in one pass over each of its sides.
+   graph = paymentGraph.PaymentGraph.fromColumns(pc)
+   stats = paymentStats.graphStats(graph)
+   # A few variables used for sanity checks
+   NUM_DOCS = graph.numDocs()
+   NUM_COS = graph.numCos()
 
-   i = 0
-   badLines = [] # integer of bad line numbers in data
-   rawTotalPayments = 0.
-   with open(filename) as fin:
-      for line in fin:
-         s = line.split()
-         i += 1
-         if i == 1:
-            continue # header line
-         if(len(s)!=3):
-            if(printBadLines):
-               print "==== Problem on line %d" %(i)
-               print line
-               print s
-               print str(len(s))
-            badLines.append(i)
-            continue
-         doc = int(s[0])
-         co = int(s[1])
-         amount = float(s[2])
-         if doc not in docs:
-            docs[doc] = []
-            docsToCos[doc] = set()
-            NUM_DOCS += 1
-         if co not in cos:
-            cos[co] = []
-            cosToDocs[co] = set()
-            NUM_COS += 1
-         docs[doc].append(amount)
-         cos[co].append(amount)
-         docsToCos[doc].add(co)
-         cosToDocs[co].add(doc)
-         rawTotalPayments += amount
-         #print doc, " ", co, " ", amount
-
-   assert(NUM_COS == len(cos))
-   assert(NUM_DOCS == len(docs))
+   assert(NUM_COS == stats.numCos)
+   assert(NUM_DOCS == stats.numDocs)
 
    print "==== Results ===="
    print "Bad lines in file (lines excluded): %d" %(len(badLines))
    print "Num payments (good lines): %d" %(i - len(badLines))
-   print "Num providers/docs: %d" %(len(docs))
-   print "Num companies/payers: %d" %(len(cos))
-   maxPayout = max([v for sub in cos.values() for v in sub])
-   print "Largest payout %f" %(maxPayout)
-   maxPayin = max([v for sub in docs.values() for v in sub])
-   print "Largest payin %f" %(maxPayin)
-
-   coTotalPayments = 0.
-   for c in cos:
-      for p in cos[c]:
-         coTotalPayments += p
-   totalPayments = sum([v for sub in docs.values() for v in sub])
-   print "Total of all payments %f" %(totalPayments)
-   print "Total of all paymentsC %f" %(coTotalPayments)
+   print "Num providers/docs: %d" %(stats.numDocs)
+   print "Num companies/payers: %d" %(stats.numCos)
+   print "Largest payout %f" %(stats.maxPayout)
+   print "Largest payin %f" %(stats.maxPayin)
+
+   print "Total of all payments %f" %(stats.docTotalPayments)
+   print "Total of all paymentsC %f" %(stats.coTotalPayments)
    print "Total of all paymentsRaw %f" %(rawTotalPayments)
 
-   cosPaymentCountHist = genPaymentCountHistogram(cos)
-   assert(NUM_COS == sum( cosPaymentCountHist.values() ))
+   assert(NUM_COS == sum( stats.coCountHist.values() ))
+   assert(NUM_DOCS == sum( stats.docCountHist.values() ))
+   assert(NUM_COS == len(stats.coTotals))
+   assert(NUM_DOCS == len(stats.docTotals))
+
+   writeDistributions(stats)
 
-   docsPaymentCountHist = genPaymentCountHistogram(docs)
-   assert(NUM_DOCS == sum( docsPaymentCountHist.values() ))
 
-   #print "cos: Num payments, num companies making that many payments"
-   #for k in sorted(cosPaymentCountHist):
-   #   print "%d %d" %(k, cosPaymentCountHist[k])
+'''
+Write out the histogram and CCDF .tab files (and their gnuplot plots),
+then print the secondary statistics.
+Input: stats, the paymentStats.PaymentStats of the payments (its payment
+   count histograms, company/doctor totals and degrees)
+'''
+def writeDistributions(stats):
+   cosSumPayments = stats.coTotals
+   docsSumPayments = stats.docTotals
+
+   NUM_COS = len(cosSumPayments)
+   NUM_DOCS = len(docsSumPayments)
+
+   hists = dict()
+   hists["cosCount"] = stats.coCountHist
+   hists["docsCount"] = stats.docCountHist
+   hists["cosDollars"] = paymentAmountHistogram(cosSumPayments, DOLLAR_BINSIZE)
+   assert(NUM_COS == sum( hists["cosDollars"].values() ))
+   hists["docsDollars"] = paymentAmountHistogram(docsSumPayments, DOLLAR_BINSIZE)
+   assert(NUM_DOCS == sum( hists["docsDollars"].values() ))
+   hists["cosDollarsLog"] = paymentAmountHistogram(cosSumPayments, DOLLAR_BINSIZE, "log")
+   hists["docsDollarsLog"] = paymentAmountHistogram(docsSumPayments, DOLLAR_BINSIZE, "log")
+   writeHistograms(hists)
+
+   # Secondary stastics
+   printSecondaries(stats)
+
 
-   #print "docs: Num payments, num doctors recieving that many payments"
-   #for k in sorted(docsPaymentCountHist):
-   #   print "%d %d" %(k, docsPaymentCountHist[k])
+'''
+Write out the .tab files (and plots) of the histograms in hists, a dict
+name -> histogram, and of their CCDFs; histograms missing from hists are
+left as they are (see printIncrementalStats).  The names:
+   cosCount, docsCount        payment count histograms
+   cosDollars, docsDollars    total payments in bins of DOLLAR_BINSIZE
+   cosDollarsLog, docsDollarsLog  total payments in log bins (densities)
+'''
+def writeHistograms(hists):
+   # Write out histogram files for gnuplot, and their CCDF distributions
+   # (counts at or above the level).
+   if "cosCount" in hists:
+      writeHistogramFile("cos_payment_count_hist", hists["cosCount"], "NumberOfPayments   NumberOfCompaniesMakingThatManyPayments")
+      writeHistogramFile("cos_payment_count_ccdf", ccdfFromHistogram(hists["cosCount"]), "NumberOfPayments   RatioOfCompaniesMaking>=ThatManyPayments")
+      plotCCDF("cos_payment_count_ccdf.tab", "CCDF, x is number of payments, y is % of companies making >= that many payments")
+   if "docsCount" in hists:
+      writeHistogramFile("docs_payment_count_hist", hists["docsCount"], "NumberOfPayments   NumberOfDoctorsReceivingThatManyPayments")
+      plotLogLog("docs_payment_count_hist.tab", "Doctor(node) to community degree distribution histogram", "Degree", "Number of Doctors")
+      writeHistogramFile("docs_payment_count_ccdf", ccdfFromHistogram(hists["docsCount"]), "NumberOfPayments   RatioOfDoctorsReceiving>=ThatManyPayments")
+      plotCCDF("docs_payment_count_ccdf.tab", "CCDF, x is number of payments, y is % of doctors taking >= that many payments")
+   if "cosDollars" in hists:
+      writeHistogramFile("cos_payment_dollars_hist", hists["cosDollars"], "TotalOfPaymentsDollars   NumCompaniesMakingThatMuchInTotalPayments")
+      writeHistogramFile("cos_payment_dollars_ccdf", ccdfFromHistogram(hists["cosDollars"]), "TotalOfPaymentsDollars   RatioCompaniesMaking>=ThatMuchInTotalPayments")
+      plotCCDF("cos_payment_dollars_ccdf.tab", "CCDF, x is total value $ of payments, y is % of companies making >= that total amount ($) of payments")
+   if "docsDollars" in hists:
+      writeHistogramFile("docs_payment_dollars_hist", hists["docsDollars"], "TotalOfPaymentsDollars   NumDoctorsTakingThatMuchInTotalPayments")
+      writeHistogramFile("docs_payment_dollars_ccdf", ccdfFromHistogram(hists["docsDollars"]), "TotalOfPaymentsDollars   RatioDoctorsTaking>=ThatMuchInTotalPayments")
+      plotCCDF("docs_payment_dollars_ccdf.tab", "CCDF, x is total value $ of payments, y is % of doctors taking >= that total amount ($) of payments")
+   # Log binned: the heavy tails in a few bins rather than thousands.
+   if "cosDollarsLog" in hists:
+      writeHistogramFile("cos_payment_dollars_loghist", hists["cosDollarsLog"], "TotalOfPaymentsDollars(LogBinLowerBound)   NumCompaniesPerDollarOfBinWidth")
+   if "docsDollarsLog" in hists:
+      writeHistogramFile("docs_payment_dollars_loghist", hists["docsDollarsLog"], "TotalOfPaymentsDollars(LogBinLowerBound)   NumDoctorsPerDollarOfBinWidth")
+      plotLogLog("docs_payment_dollars_loghist.tab", "Doctor total payments histogram (log bins)", "Total payments ($)", "Doctors per $ of bin width")
+
+
+'''
+Streaming version of printStats: a single pass over the payment file
+which only keeps per-entity running aggregates (count, total, max and
+distinct counterparties, see paymentAggregates.py), never the payment
+lists, and writes the same .tab files and summary lines.  Neither the
+binary cache nor the payment graph is built, so this works on payment
+files larger than memory.
+numWorkers, the number of processes the file is split across.
+sketchError, if given, the error of the sketches kept instead of the
+   distinct counterparty sets (so the degree statistics are estimates
+   of about that relative error), and of the payment quantiles then
+   printed (ranks within about that fraction of the payments).
+'''
+def printStreamingStats(filename, numWorkers=1, sketchError=None):
+   agg = paymentAggregates.aggregatePaymentFile(filename, numWorkers, sketchError=sketchError)
+   stats = paymentStats.PaymentStats.fromAggregates(agg)
+   NUM_DOCS = stats.numDocs
+   NUM_COS = stats.numCos
 
-   cosSumPayments = sumPayments(cos)
-   assert(NUM_COS == len(cosSumPayments))
-   docsSumPayments = sumPayments(docs)
-   assert(NUM_DOCS == len(docsSumPayments))
+   printResults(stats, agg.numLines, len(agg.badLines), agg.rawTotalPayments())
 
-   binsize = 10.
-   cosPaymentDollarsHist = paymentAmountHistogram(cosSumPayments, binsize)
-   assert(NUM_COS == sum( cosPaymentDollarsHist.values() ))
-   docsPaymentDollarsHist = paymentAmountHistogram(docsSumPayments, binsize)
-   assert(NUM_DOCS == sum( docsPaymentDollarsHist.values() ))
+   assert(NUM_COS == sum( stats.coCountHist.values() ))
+   assert(NUM_DOCS == sum( stats.docCountHist.values() ))
 
-   #print "cos: Payment histogram: payment->+%f, num cos making that much in total payments" %(binsize)
-   #for k in sorted(cosPaymentDollarsHist):
-   #   print "%f %d" %(k, cosPaymentDollarsHist[k])
+   if sketchError is not None:
+      printQuantiles(agg.amounts, stats, sketchError)
 
-   #print "docs: Payment histogram: payment->+%f, num docs taking that much in total payments" %(binsize)
-   #for k in sorted(docsPaymentDollarsHist):
-   #   print "%f %d" %(k, docsPaymentDollarsHist[k])
+   writeDistributions(stats)
 
-   # Write out histogram files for gnuplot.
-   writeHistogramFile("cos_payment_count_hist", cosPaymentCountHist, "NumberOfPayments   NumberOfCompaniesMakingThatManyPayments")
-   writeHistogramFile("docs_payment_count_hist", docsPaymentCountHist, "NumberOfPayments   NumberOfDoctorsReceivingThatManyPayments")
-   writeHistogramFile("cos_payment_dollars_hist", cosPaymentDollarsHist, "TotalOfPaymentsDollars   NumCompaniesMakingThatMuchInTotalPayments")
-   writeHistogramFile("docs_payment_dollars_hist", docsPaymentDollarsHist, "TotalOfPaymentsDollars   NumDoctorsTakingThatMuchInTotalPayments")
 
-   # Plot histograms for gnuplot.
-   plotLogLog("docs_payment_count_hist.tab", "Doctor(node) to community degree distribution histogram", "Degree", "Number of Doctors")
+'''
+Print the results lines of printStreamingStats/printIncrementalStats:
+the counts, largest payments and per-side totals of stats, with the
+numLines and numBadLines of the file and the raw total of its payments.
+'''
+def printResults(stats, numLines, numBadLines, rawTotalPayments):
+   print "==== Results ===="
+   print "Bad lines in file (lines excluded): %d" %(numBadLines)
+   print "Num payments (good lines): %d" %(numLines - numBadLines)
+   print "Num providers/docs: %d" %(stats.numDocs)
+   print "Num companies/payers: %d" %(stats.numCos)
+   print "Largest payout %f" %(stats.maxPayout)
+   print "Largest payin %f" %(stats.maxPayin)
+
+   print "Total of all payments %f" %(stats.docTotalPayments)
+   print "Total of all paymentsC %f" %(stats.coTotalPayments)
+   print "Total of all paymentsRaw %f" %(rawTotalPayments)
 
 
-   # Create CCDF distributions (counts at or above the level).
-   cosPaymentCountCCDF = ccdfFromHistogram(cosPaymentCountHist)
-   docsPaymentCountCCDF = ccdfFromHistogram(docsPaymentCountHist)
-   cosPaymentDollarsCCDF = ccdfFromHistogram(cosPaymentDollarsHist)
-   docsPaymentDollarsCCDF = ccdfFromHistogram(docsPaymentDollarsHist)
+'''
+Incremental version of printStreamingStats, for a payment file which
+grows by appended batches: the per-entity aggregates are kept in a state
+file next to it (see incrementalStats.py) and brought up to date from
+the lines appended since the last run only, and only the .tab files of
+the histograms that changed are rewritten (and replotted), including
+those changed by an earlier run interrupted before it wrote them.  The
+summary lines are those of printStreamingStats (without the payment
+quantiles).
+'''
+def printIncrementalStats(filename):
+   state = incrementalStats.updateState(filename, DOLLAR_BINSIZE)
+   stats = state.paymentStats()
+   meta = state.meta
+   printResults(stats, meta["numLines"], meta["numBadLines"], math.fsum(meta["rawTotal"]))
 
-   # Write out CCDF distributions for gnuplot.
-   writeHistogramFile("cos_payment_count_ccdf", cosPaymentCountCCDF, "NumberOfPayments   RatioOfCompaniesMaking>=ThatManyPayments")
-   writeHistogramFile("docs_payment_count_ccdf", docsPaymentCountCCDF, "NumberOfPayments   RatioOfDoctorsReceiving>=ThatManyPayments")
-   writeHistogramFile("cos_payment_dollars_ccdf", cosPaymentDollarsCCDF, "TotalOfPaymentsDollars   RatioCompaniesMaking>=ThatMuchInTotalPayments")
-   writeHistogramFile("docs_payment_dollars_ccdf", docsPaymentDollarsCCDF, "TotalOfPaymentsDollars   RatioDoctorsTaking>=ThatMuchInTotalPayments")
+   writeHistograms(dict((name, state.histogram(name)) for name in state.changed if name != "docsDegree"))
+   printSecondaries(stats, "docsDegree" in state.changed)
+   state.markWritten()
+   state.close()
 
-   # Plot file for gnuplot
-   plotCCDF("cos_payment_count_ccdf.tab", "CCDF, x is number of payments, y is % of companies making >= that many payments")
-   plotCCDF("docs_payment_count_ccdf.tab", "CCDF, x is number of payments, y is % of doctors taking >= that many payments")
-   plotCCDF("cos_payment_dollars_ccdf.tab", "CCDF, x is total value $ of payments, y is % of companies making >= that total amount ($) of payments")
-   plotCCDF("docs_payment_dollars_ccdf.tab", "CCDF, x is total value $ of payments, y is % of doctors taking >= that total amount ($) of payments")
 
-   # Secondary stastics
-   printSecondaries(cosToDocs, docsToCos)
+'''
+Print the (approximate) payment quantiles of amounts, a
+sketches.QuantileSketch of every payment, and the tail of the company
+totals of stats (sketched with the same rankError).
+'''
+def printQuantiles(amounts, stats, rankError):
+   coTotals = sketches.QuantileSketch.forError(rankError)
+   coTotals.extend(stats.coTotals.itervalues())
+   print "Median payment (rank error %g): %f" %(rankError, amounts.quantile(0.5))
+   print "99th percentile payment: %f" %(amounts.quantile(0.99))
+   print "Median company total: %f" %(coTotals.quantile(0.5))
+   print "99th percentile company total: %f" %(coTotals.quantile(0.99))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+'''
+histograms.py
+Bryan Lewandowski
+
+Histograms and CCDFs of the per-doctor/per-company values (payment
+counts, total dollars), as dicts bin -> count ready for
+writeHistogramFile.  The values are binned a whole column at a time:
+with numpy, by bincount (small ints) or unique over an array, and CCDFs
+by a cumulative sum; without it (numpy is optional), by one sort and a
+run-length count, which gives the same dicts.
+
+Binning modes (see binnedHistogram):
+   exact     one bin per distinct value (countHistogram)
+   linear    bins of a fixed width, keyed by their lower bound
+             (linearHistogram, what paymentAmountHistogram always did)
+   log       BINS_PER_DECADE bins per power of 10, keyed by their lower
+             bound (logHistogram): a heavy tailed distribution fills a
+             few dozen bins rather than thousands of sparse linear ones
+   quantile  bins holding about the same number of values each, keyed
+             by their lower bound (quantileHistogram)
+Log and quantile bins can instead count the density (count / bin width)
+of each bin, which is what a log-log plot of unequal bins should show.
+'''
+
+import math
+import itertools
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+BINS_PER_DECADE = 10 # log bins per power of 10
+QUANTILE_BINS = 50 # quantile bins, at most
+BINCOUNT_MIN = 1 << 16 # exact histograms of ints up to this use a bincount
+
+
+'''
+The number of values in each run of equal values of sortedValues, as
+dict value -> count.
+'''
+def runLengths(sortedValues):
+   return dict((v, len(list(run))) for v, run in itertools.groupby(sortedValues))
+
+
+'''
+Histogram of values (an iterable of ints or floats): dict distinct
+value -> number of values equal to it (eg: the payment counts of every
+doctor give number of payments -> number of doctors receiving that many).
+'''
+def countHistogram(values):
+   if numpy is not None:
+      a = numpy.fromiter(values, dtype=float)
+      if len(a) == 0:
+         return dict()
+      if numpy.all(a == numpy.floor(a)):
+         a = a.astype(numpy.int64) # (keys stay ints)
+         if a.min() >= 0 and a.max() <= 2 * len(a) + BINCOUNT_MIN:
+            counts = numpy.bincount(a)
+            keys = numpy.flatnonzero(counts)
+            return dict(zip(keys.tolist(), counts[keys].tolist()))
+      keys, counts = numpy.unique(a, return_counts=True)
+      return dict(zip(keys.tolist(), counts.tolist()))
+   return runLengths(sorted(values))
+
+
+'''
+Histogram of values in bins of width binsize (> 0): dict lower bound of
+a bin -> number of values in it.  A value x falls in the bin of lower
+bound int(x / binsize) * binsize (truncated towards 0, so a bin
+0 <= x < binsize).
+'''
+def linearHistogram(values, binsize):
+   assert(binsize > 0)
+   if numpy is not None:
+      a = numpy.fromiter(values, dtype=float)
+      keys, counts = numpy.unique(numpy.trunc(a / binsize), return_counts=True)
+      return dict(zip([int(k) * binsize for k in keys.tolist()], counts.tolist()))
+   hist = runLengths(sorted([int(x / binsize) for x in values]))
+   return dict((binNum * binsize, n) for binNum, n in hist.iteritems())
+
+
+'''
+Lower bound of log bin k (binsPerDecade bins per power of 10).
+'''
+def logBinEdge(k, binsPerDecade):
+   return 10. ** (k / float(binsPerDecade))
+
+
+'''
+The log bin of x > 0: the k with logBinEdge(k) <= x < logBinEdge(k + 1)
+(log10 is corrected where it rounds across an edge).
+'''
+def logBin(x, binsPerDecade):
+   k = int(math.floor(math.log10(x) * binsPerDecade))
+   if logBinEdge(k, binsPerDecade) > x:
+      k -= 1
+   elif logBinEdge(k + 1, binsPerDecade) <= x:
+      k += 1
+   return k
+
+
+'''
+dict lower bound -> count (or density) from the bins and counts of a
+histogram, edges(bin) the (lower, upper) bounds of a bin.
+'''
+def binCounts(bins, counts, edges, density):
+   hist = dict()
+   for b, n in itertools.izip(bins, counts):
+      lo, hi = edges(b)
+      hist[lo] = n / (hi - lo) if density and hi > lo else n
+   return hist
+
+
+'''
+Histogram of values in logarithmic bins, binsPerDecade per power of 10:
+dict lower bound of a bin -> number of values in it (density, that
+number over the bin width).  Values <= 0 can not be log binned: they
+are counted in one bin of lower bound 0 (whose width, for density, is up
+to the first log bin holding values).
+'''
+def logHistogram(values, binsPerDecade=BINS_PER_DECADE, density=False):
+   if numpy is not None:
+      a = numpy.fromiter(values, dtype=float)
+      numZero = int(numpy.count_nonzero(a <= 0))
+      a = a[a > 0]
+      k = numpy.floor(numpy.log10(a) * binsPerDecade)
+      k -= numpy.power(10., k / binsPerDecade) > a
+      k += numpy.power(10., (k + 1) / binsPerDecade) <= a
+      bins, counts = numpy.unique(k.astype(numpy.int64), return_counts=True)
+      logCounts = dict(zip(bins.tolist(), counts.tolist()))
+   else:
+      numZero = 0
+      ks = []
+      for x in values:
+         if x <= 0:
+            numZero += 1
+         else:
+            ks.append(logBin(x, binsPerDecade))
+      logCounts = runLengths(sorted(ks))
+   return logBinsHistogram(logCounts, numZero, binsPerDecade, density)
+
+
+'''
+The logHistogram of values which fall logCounts[k] in each log bin k
+(see logBin), and numZero more <= 0 (for histograms kept up to date bin
+by bin, see incrementalStats.py).
+'''
+def logBinsHistogram(logCounts, numZero, binsPerDecade=BINS_PER_DECADE, density=False):
+   bins = sorted([k for k in logCounts if logCounts[k] > 0])
+   counts = [logCounts[k] for k in bins]
+   hist = binCounts(bins, counts, lambda b: (logBinEdge(b, binsPerDecade), logBinEdge(b + 1, binsPerDecade)), density)
+   if numZero > 0:
+      hi = logBinEdge(bins[0], binsPerDecade) if len(bins) > 0 else 1.
+      hist[0.] = numZero / hi if density else numZero
+   return hist
+
+
+'''
+Histogram of values in (at most) numBins bins of about equal counts,
+their bounds at the quantiles of the values: dict lower bound of a bin
+-> number of values in it (density, that number over the bin width; the
+last bin ends at the largest value, and a bin of one value, with no
+width, keeps its count).  Equal values always share a bin, so a
+distribution with few distinct values gets fewer bins.
+'''
+def quantileHistogram(values, numBins=QUANTILE_BINS, density=False):
+   if numpy is not None:
+      a = numpy.sort(numpy.fromiter(values, dtype=float))
+      if len(a) == 0:
+         return dict()
+      edges = numpy.unique(a[(numpy.arange(numBins) * len(a)) // numBins])
+      counts = numpy.diff(numpy.append(numpy.searchsorted(a, edges, "left"), len(a)))
+      edges, counts, top = edges.tolist(), counts.tolist(), float(a[-1])
+   else:
+      a = sorted(values)
+      if len(a) == 0:
+         return dict()
+      edges = sorted(set([a[(q * len(a)) // numBins] for q in xrange(numBins)]))
+      # Values from each edge up to the next.
+      counts = []
+      i = 0
+      for e in edges[1:] + [None]:
+         j = i
+         while j < len(a) and (e is None or a[j] < e):
+            j += 1
+         counts.append(j - i)
+         i = j
+      top = float(a[-1])
+   bounds = edges[1:] + [top]
+   return binCounts(xrange(len(edges)), counts, lambda b: (edges[b], bounds[b]), density)
+
+
+'''
+Histogram of values in the bins of mode (see above): "exact", "linear"
+(bins of binsize), "log" or "quantile".
+'''
+def binnedHistogram(values, mode="linear", binsize=10., density=False):
+   if mode == "exact":
+      return countHistogram(values)
+   if mode == "linear":
+      return linearHistogram(values, binsize)
+   if mode == "log":
+      return logHistogram(values, density=density)
+   if mode == "quantile":
+      return quantileHistogram(values, density=density)
+   raise ValueError("unknown histogram binning: "+str(mode))
+
+
+'''
+The CCDF of a histogram hist (dict bin -> count, or density): dict bin
+-> fraction of the counts in that bin or above it.
+'''
+def ccdf(hist):
+   keys = sorted(hist)
+   if len(keys) == 0:
+      return dict()
+   if numpy is not None:
+      # (int64 counts, or float64 when any is a float, eg: densities)
+      counts = numpy.array([hist[k] for k in keys])
+      datasize = counts.sum()
+      below = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+      return dict(zip(keys, ((datasize - below) / float(datasize)).tolist()))
+   datasize = sum(hist.itervalues())
+   out = dict()
+   obsdata = 0 # accumulator for observed data (discards in CCDF)
+   for k in keys:
+      out[k] = (datasize - obsdata) / float(datasize)
+      obsdata += hist[k]
+   return out
@@ -0,0 +1,123 @@
+'''
+idIntern.py
+Bryan Lewandowski
+
+Dense integer ids for doctors and companies.  Raw ids (company ids are 12
+digit numbers like 100000005559, doctor ids are sparse) are mapped to
+0..N-1 int32 indices, in increasing raw id order, so comparing dense ids
+compares raw ids.  Dense ids are translated back to raw ids only when
+output is written.
+
+Two dense ids pack into a single int key (packPair), which is what the
+doc-doc/co-co edge sets are built from: an int is less than half the size
+of a tuple of two ints.
+'''
+
+import sys
+import itertools
+from array import array
+from bisect import bisect_left
+
+# array typecode holding a 64 bit signed int (company ids are 12 digits);
+# Python 2's array has no 'q', so this needs a platform with 64 bit longs.
+INT64 = 'l'
+assert array(INT64).itemsize == 8, "64-bit longs required (array typecode 'l')"
+INDEX = 'i' # array typecode of a dense id (int32)
+PAIR_SHIFT = 32
+PAIR_MASK = (1 << PAIR_SHIFT) - 1
+
+
+'''
+Pack two dense ids into one int key, lower id in the high bits (so the
+keys sort like the (lower, higher) pairs).
+'''
+def packPair(a, b):
+   if a > b:
+      a, b = b, a
+   return (a << PAIR_SHIFT) | b
+
+
+'''
+The (lower, higher) dense ids of a packed pair key.
+'''
+def unpackPair(key):
+   return key >> PAIR_SHIFT, key & PAIR_MASK
+
+
+'''
+A mapping raw id <-> dense id, for one side of the graph.
+   ids, array of the distinct raw ids, sorted; ids[i] is the raw id of
+      dense id i.
+'''
+class IdInterner:
+   def __init__(self, ids):
+      self.ids = ids
+      self.lookup = None # raw -> dense dict, built on first intern()
+
+   '''
+   Build an interner over the distinct values of keys (any iterable).
+   '''
+   @classmethod
+   def fromKeys(cls, keys):
+      return cls(array(INT64, sorted(set(keys))))
+
+   def __len__(self):
+      return len(self.ids)
+
+   def __contains__(self, raw):
+      i = bisect_left(self.ids, raw)
+      return i < len(self.ids) and self.ids[i] == raw
+
+   def index(self, raw):
+      i = bisect_left(self.ids, raw)
+      if i == len(self.ids) or self.ids[i] != raw:
+         raise KeyError(raw)
+      return i
+
+   def rawId(self, i):
+      return self.ids[i]
+
+   '''
+   Dense ids of a column of raw ids, as an int32 array.
+   '''
+   def intern(self, column):
+      if self.lookup is None:
+         self.lookup = dict(itertools.izip(self.ids, xrange(len(self.ids))))
+      lookup = self.lookup
+      return array(INDEX, [lookup[k] for k in column])
+
+   '''
+   Save/load the raw ids as a little-endian int64 file (dense id i is
+   the i'th entry), next to the data they describe.
+   '''
+   def save(self, filename):
+      ids = self.ids
+      if sys.byteorder == "big":
+         ids = array(INT64, ids)
+         ids.byteswap()
+      with open(filename, "wb") as fout:
+         ids.tofile(fout)
+
+   @classmethod
+   def load(cls, filename, n):
+      ids = array(INT64)
+      with open(filename, "rb") as fin:
+         ids.fromfile(fin, n)
+      if sys.byteorder == "big":
+         ids.byteswap()
+      return cls(ids)
+
+
+'''
+Dense view of a dict-like d of id -> collection of counterparty ids (eg:
+cosToDocs).
+Returns (interner, rows) where interner maps the counterparty ids and
+rows iterates, per key of d, the distinct dense counterparty ids.
+A paymentGraph view supplies these directly; for a plain dict an
+interner is built over all of its values.
+'''
+def denseNeighbourLists(d):
+   if getattr(d, "valueInterner", None) is not None:
+      return d.valueInterner, d.denseRows()
+   interner = IdInterner.fromKeys(itertools.chain.from_iterable(d.itervalues()))
+   return interner, (interner.intern(set(d[k])) for k in d)
@@ -0,0 +1,346 @@
+'''
+incrementalStats.py
+Bryan Lewandowski
+
+Statistics of a payment file kept up to date as batches of payments are
+appended to it (CMS publishes the data in releases), so that an update
+costs time in proportion to the new lines, not to the whole history.
+
+The state lives in an sqlite database next to the payment file
+(filename + ".stats.db"):
+   entities  per doctor/company: payment count, partial sums of the
+             payments (see paymentAggregates.addPartial), largest payment
+             and number of distinct counterparties
+   pairs     the distinct (doctor, company) pairs seen, so the degrees are
+             exact without holding counterparty sets in memory
+   hists     the histograms of genStats.writeHistograms, as counts per
+             bin (an entity is moved between bins as it changes)
+   badlines  the line numbers which did not parse
+   meta      how much of the file has been read (byte offset, line count,
+             header, md5 of the block before the offset), the
+             file-level counts, largest payments and totals (raw, and
+             the sums of the doctor and of the company totals), and the
+             names of the histograms changed since their .tab files
+             were last written
+An update reads the bytes after the stored offset only, BATCH_BYTES at a
+time aggregated in memory (paymentAggregates.aggregateRange), and commits
+each batch in one transaction, so an interrupted update resumes from the
+last whole batch (and the .tab files of the histograms it changed are
+still rewritten, however the update was interrupted).  The state is rebuilt from the start when the file is
+not the old one plus appended lines (it shrank, its header or the block
+before the offset changed, or its unterminated last line was extended),
+or is compressed (it can not be read from an offset).
+
+Totals are exact partial sums, so the statistics are the same as
+printStreamingStats of the whole file, however it was split into
+batches.
+'''
+
+import os
+import math
+import json
+import hashlib
+import sqlite3
+from array import array
+
+import histograms
+import inputStream
+import paymentStats
+import paymentAggregates
+from paymentAggregates import addPartial
+
+STATE_VERSION = 2
+BATCH_BYTES = 1 << 26 # bytes of the payment file aggregated in memory at once
+TAIL_BYTES = 1 << 16 # bytes before the offset hashed to recognise an append
+DOC = 0
+CO = 1
+ZERO_BIN = "<=0" # log histogram bin of the totals <= 0
+
+SCHEMA = ["CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)",
+          "CREATE TABLE entities (side INTEGER, id INTEGER, count INTEGER, sums BLOB, max REAL, degree INTEGER, PRIMARY KEY (side, id)) WITHOUT ROWID",
+          "CREATE TABLE pairs (doc INTEGER, co INTEGER, PRIMARY KEY (doc, co)) WITHOUT ROWID",
+          "CREATE TABLE hists (name TEXT, bin, count INTEGER, PRIMARY KEY (name, bin))",
+          "CREATE TABLE badlines (line INTEGER)"]
+
+
+def stateName(filename):
+   return filename + ".stats.db"
+
+
+'''
+md5 of the (up to) TAIL_BYTES of filename before byte end.
+'''
+def tailHash(filename, end):
+   with open(filename, "rb") as fin:
+      start = max(0, end - TAIL_BYTES)
+      fin.seek(start)
+      return hashlib.md5(fin.read(end - start)).hexdigest()
+
+
+'''
+Does the byte range [0, end) of filename end with a whole line?
+'''
+def endsLine(filename, end):
+   if end == 0:
+      return True
+   with open(filename, "rb") as fin:
+      fin.seek(end - 1)
+      return fin.read(1) == "\n"
+
+
+'''
+Split the byte range [start, end) of filename into ranges of about
+batchBytes, each starting at the beginning of a line.
+'''
+def batchRanges(filename, start, end, batchBytes=BATCH_BYTES):
+   if inputStream.isCompressed(filename):
+      return [(0, end)] # can not seek into a compressed stream
+   bounds = [start]
+   with open(filename, "rb") as fin:
+      while end - bounds[-1] > batchBytes:
+         fin.seek(bounds[-1] + batchBytes)
+         fin.readline()
+         if fin.tell() >= end:
+            break
+         bounds.append(fin.tell())
+   bounds.append(end)
+   return [(bounds[k], bounds[k + 1]) for k in xrange(len(bounds) - 1)]
+
+
+'''
+The persisted statistics of the payment file filename (see above), with
+the total payment histograms in bins of binsize.
+   meta, dict of the file-level values
+   hists, name -> dict bin -> count (loaded whole: they are about as
+      small as the .tab files written from them)
+   changed, the names of the histograms changed since their .tab files
+      were last written (see markWritten), committed with the counts
+'''
+class PaymentState:
+   def __init__(self, filename, binsize):
+      self.filename = filename
+      self.binsize = binsize
+      self.db = sqlite3.connect(stateName(filename))
+      self.meta = dict()
+      for key, value in self.db.execute("SELECT key, value FROM meta"):
+         self.meta[str(key)] = json.loads(value)
+      self.changed = set(self.meta.pop("changed", []))
+      self.hists = dict()
+      for name, b, n in self.db.execute("SELECT name, bin, count FROM hists"):
+         self.hists.setdefault(str(name), dict())[b] = n
+      self.deltas = dict() # (name, bin) -> change of its count, not yet stored
+
+   '''
+   A new, empty state for filename (replacing any old one).
+   '''
+   @classmethod
+   def create(cls, filename, binsize):
+      if os.path.exists(stateName(filename)):
+         os.remove(stateName(filename))
+      db = sqlite3.connect(stateName(filename))
+      for statement in SCHEMA:
+         db.execute(statement)
+      db.commit()
+      db.close()
+      state = cls(filename, binsize)
+      state.meta = {"version": STATE_VERSION, "binsize": binsize, "end": 0,
+                    "endsLine": True, "tail": tailHash(filename, 0), "header": "",
+                    "numLines": 0, "numBadLines": 0, "numPayments": 0,
+                    "numDocs": 0, "numCos": 0, "numPairs": 0,
+                    "maxPayin": None, "maxPayout": None, "rawTotal": [],
+                    "docsTotal": [], "cosTotal": []}
+      return state
+
+   def close(self):
+      self.db.close()
+
+   '''
+   Is filename still the file this state was read from, plus appended
+   lines?
+   '''
+   def canAppend(self):
+      meta = self.meta
+      if meta.get("version") != STATE_VERSION or meta.get("binsize") != self.binsize:
+         return False
+      if inputStream.isCompressed(self.filename):
+         return False
+      size = os.stat(self.filename).st_size
+      if size < meta["end"] or (size > meta["end"] and not meta["endsLine"]):
+         return False
+      if meta["numLines"] > 0:
+         with open(self.filename, "rb") as fin:
+            if fin.readline() != meta["header"]:
+               return False
+      return tailHash(self.filename, meta["end"]) == meta["tail"]
+
+   '''
+   Add n to the count of bin b of histogram name.
+   '''
+   def bump(self, name, b, n):
+      hist = self.hists.setdefault(name, dict())
+      hist[b] = hist.get(b, 0) + n
+      if hist[b] == 0:
+         del hist[b]
+      self.deltas[(name, b)] = self.deltas.get((name, b), 0) + n
+
+   '''
+   Count (n 1) or uncount (n -1) an entity of side ("docs" or "cos") in
+   the histograms, by its payment count, total payments and degree, and
+   in the side's sum of totals.
+   '''
+   def countEntity(self, side, count, total, degree, n):
+      addPartial(self.meta[side + "Total"], n * total)
+      self.bump(side + "Count", count, n)
+      self.bump(side + "Dollars", int(total / self.binsize) * self.binsize, n)
+      self.bump(side + "DollarsLog", histograms.logBin(total, histograms.BINS_PER_DECADE) if total > 0 else ZERO_BIN, n)
+      if side == "docs":
+         self.bump("docsDegree", degree, n)
+
+   '''
+   Record the distinct (doctor, company) pairs of agg, a
+   paymentAggregates.PaymentAggregates.  Returns (doctor id -> number of
+   new companies, company id -> number of new doctors).
+   '''
+   def addPairs(self, agg):
+      newDocs = dict()
+      newCos = dict()
+      for doc, cos in agg.docs.neighbours.iteritems():
+         for co in cos:
+            if self.db.execute("INSERT OR IGNORE INTO pairs VALUES (?, ?)", (doc, co)).rowcount == 1:
+               newCos[doc] = newCos.get(doc, 0) + 1
+               newDocs[co] = newDocs.get(co, 0) + 1
+               self.meta["numPairs"] += 1
+      return newCos, newDocs
+
+   '''
+   Merge the EntityAggregates entities of one side (DOC/CO, named
+   "docs"/"cos") into the stored entities, with their degrees grown by
+   newDegrees (id -> number of new counterparties).
+   '''
+   def addEntities(self, side, name, entities, newDegrees):
+      for k in entities:
+         row = self.db.execute("SELECT count, sums, max, degree FROM entities WHERE side = ? AND id = ?", (side, k)).fetchone()
+         if row is None:
+            count, sums, largest, degree = 0, [], None, 0
+            self.meta["numDocs" if side == DOC else "numCos"] += 1
+         else:
+            count, sums, largest, degree = row[0], array('d', str(row[1])).tolist(), row[2], row[3]
+            self.countEntity(name, count, math.fsum(sums), degree, -1)
+         count += entities.counts[k]
+         for y in entities.sums[k]:
+            addPartial(sums, y)
+         if largest is None or entities.maxes[k] > largest:
+            largest = entities.maxes[k]
+         degree += newDegrees.get(k, 0)
+         self.countEntity(name, count, math.fsum(sums), degree, 1)
+         self.db.execute("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)",
+                         (side, k, count, sqlite3.Binary(array('d', sums).tostring()), largest, degree))
+
+   '''
+   Add agg, the PaymentAggregates of the lines of the file up to byte
+   end (following those already added), and commit.
+   '''
+   def addBatch(self, agg, end):
+      meta = self.meta
+      if meta["numLines"] == 0:
+         meta["header"] = agg.header
+      self.db.executemany("INSERT INTO badlines VALUES (?)", [(b + meta["numLines"],) for b in agg.badLines])
+      meta["numBadLines"] += len(agg.badLines)
+      meta["numLines"] += agg.numLines
+      meta["numPayments"] += agg.numPayments()
+      for y in agg.rawTotal:
+         addPartial(meta["rawTotal"], y)
+      for key, side in [("maxPayin", agg.docs), ("maxPayout", agg.cos)]:
+         for m in side.maxes.itervalues():
+            if meta[key] is None or m > meta[key]:
+               meta[key] = m
+
+      newCos, newDocs = self.addPairs(agg)
+      self.addEntities(DOC, "docs", agg.docs, newCos)
+      self.addEntities(CO, "cos", agg.cos, newDocs)
+
+      meta["end"] = end
+      meta["endsLine"] = endsLine(self.filename, end)
+      meta["tail"] = tailHash(self.filename, end)
+      self.commit()
+
+   def commit(self):
+      for (name, b), n in self.deltas.iteritems():
+         if n == 0:
+            continue
+         self.changed.add(name)
+         if b in self.hists[name]:
+            self.db.execute("INSERT OR REPLACE INTO hists VALUES (?, ?, ?)", (name, b, self.hists[name][b]))
+         else:
+            self.db.execute("DELETE FROM hists WHERE name = ? AND bin = ?", (name, b))
+      self.deltas = dict()
+      self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                          [(key, json.dumps(value)) for key, value in self.meta.iteritems()])
+      self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", ("changed", json.dumps(sorted(self.changed))))
+      self.db.commit()
+
+   '''
+   The .tab files of the changed histograms have been written: forget
+   (and commit) that they changed.
+   '''
+   def markWritten(self):
+      self.changed = set()
+      self.commit()
+
+   '''
+   Histogram name as genStats.writeHistograms takes it (the log binned
+   totals as densities, like paymentAmountHistogram).
+   '''
+   def histogram(self, name):
+      hist = self.hists.get(name, dict())
+      if name.endswith("DollarsLog"):
+         logCounts = dict((b, n) for b, n in hist.iteritems() if b != ZERO_BIN)
+         return histograms.logBinsHistogram(logCounts, hist.get(ZERO_BIN, 0), density=True)
+      return dict(hist)
+
+   '''
+   The paymentStats.PaymentStats of the state: its counts, largest
+   payments, sums of the doctor/company totals, count and degree
+   histograms and degrees (not the per-entity totals).
+   '''
+   def paymentStats(self):
+      meta = self.meta
+      stats = paymentStats.PaymentStats()
+      stats.numDocs = meta["numDocs"]
+      stats.numCos = meta["numCos"]
+      stats.numPayments = meta["numPayments"]
+      stats.maxPayin = meta["maxPayin"]
+      stats.maxPayout = meta["maxPayout"]
+      stats.docTotalPayments = math.fsum(meta["docsTotal"])
+      stats.coTotalPayments = math.fsum(meta["cosTotal"])
+      stats.docCountHist = self.histogram("docsCount")
+      stats.coCountHist = self.histogram("cosCount")
+      stats.docDegreeHist = self.histogram("docsDegree")
+      stats.docDegreeSum = stats.coDegreeSum = meta["numPairs"]
+      return stats
+
+
+'''
+Bring the state of the payment file filename up to date (creating or
+rebuilding it as needed, see above), with the total payment histograms
+in bins of binsize.  Returns the PaymentState, whose changed names the
+histograms changed since their .tab files were last written (by this
+update, all of them when it was rebuilt, or an interrupted one).
+'''
+def updateState(filename, binsize, batchBytes=BATCH_BYTES):
+   state = None
+   if os.path.exists(stateName(filename)):
+      state = PaymentState(filename, binsize)
+      if not state.canAppend():
+         state.close()
+         state = None
+   if state is None:
+      print "Building payment statistics state for " + filename
+      state = PaymentState.create(filename, binsize)
+      state.commit()
+
+   size = os.stat(filename).st_size
+   if size > state.meta["end"]:
+      for start, end in batchRanges(filename, state.meta["end"], size, batchBytes):
+         state.addBatch(paymentAggregates.aggregateRange(filename, start, end), end)
+   return state
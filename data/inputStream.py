@@ -0,0 +1,245 @@
+'''
+inputStream.py
+Bryan Lewandowski
+
+Transparent reading of compressed input files.  openInput(filename)
+picks the codec from the file extension:
+   .gz    gzip (zlib)
+   .bz2   bzip2
+   .xz    xz (needs the lzma module, python 3 or backports.lzma)
+   other  plain file, opened directly
+
+A compressed file is decompressed in a background thread into a bounded
+queue of blocks (at most QUEUE_BLOCKS blocks of decompressed data are
+held), so decompression overlaps the parsing done by the reader.  zlib
+and bz2 release the GIL while they decompress, so the two really do run
+at the same time.
+
+The returned reader iterates lines like a file, and has readline(),
+read(n), tell() and close().  For a compressed file tell() is the offset
+in the *compressed* file of the data read so far, so it can be compared
+to os.stat(filename).st_size for progress.  Compressed files can not be
+seeked: byte-range readers (paymentCache.findRanges) read them whole.
+
+The same read-ahead is available for any iterator of blocks whose work
+is mostly I/O (eg: file reads, which release the GIL): BlockPrefetcher.
+'''
+
+import bz2
+import zlib
+import Queue
+import threading
+
+try:
+   import lzma
+except ImportError:
+   try:
+      from backports import lzma
+   except ImportError:
+      lzma = None
+
+READ_BYTES = 1 << 20 # compressed bytes read per block
+QUEUE_BLOCKS = 16 # decompressed blocks buffered ahead of the reader
+
+
+def gzipDecompressor():
+   return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def xzDecompressor():
+   if lzma is None:
+      raise IOError("xz input needs the lzma module")
+   return lzma.LZMADecompressor()
+
+
+DECOMPRESSORS = {".gz": gzipDecompressor, ".bz2": bz2.BZ2Decompressor, ".xz": xzDecompressor}
+
+
+'''
+The decompressor factory for filename's extension, or None if it is not
+compressed.
+'''
+def codecFor(filename):
+   for suffix in DECOMPRESSORS:
+      if filename.endswith(suffix):
+         return DECOMPRESSORS[suffix]
+   return None
+
+
+def isCompressed(filename):
+   return codecFor(filename) is not None
+
+
+'''
+Decompress the raw stream fin, yielding (compressed offset, data)
+blocks.  Concatenated streams (eg: cat a.gz b.gz) are decompressed one
+after the other, like gzip -d does.
+'''
+def decompressBlocks(fin, newDecompressor):
+   d = newDecompressor()
+   while True:
+      raw = fin.read(READ_BYTES)
+      if not raw:
+         return
+      while raw:
+         try:
+            data = d.decompress(raw)
+         except EOFError:
+            # The previous stream ended exactly at a block boundary.
+            d = newDecompressor()
+            continue
+         if data:
+            yield fin.tell(), data
+         raw = d.unused_data
+         if raw:
+            d = newDecompressor()
+
+
+'''
+Iterate the items of blocks (an iterator), computed ahead by a background
+thread: at most numBlocks items are held ready (2: double buffering).  An
+exception in the thread is raised again by the reader.  close() stops the
+thread early.
+'''
+class BlockPrefetcher:
+   def __init__(self, blocks, numBlocks=QUEUE_BLOCKS):
+      self.queue = Queue.Queue(numBlocks)
+      self.stopped = False
+      self.done = False
+      self.thread = threading.Thread(target=self.produce, args=(blocks,))
+      self.thread.daemon = True
+      self.thread.start()
+
+   def put(self, item):
+      while not self.stopped:
+         try:
+            self.queue.put(item, timeout=0.1)
+            return
+         except Queue.Full:
+            continue
+
+   def produce(self, blocks):
+      try:
+         for block in blocks:
+            if self.stopped:
+               return
+            self.put((True, block))
+         self.put((False, None))
+      except Exception as e:
+         self.put((False, e))
+
+   def __iter__(self):
+      return self
+
+   def next(self):
+      if self.done:
+         raise StopIteration
+      more, item = self.queue.get()
+      if not more:
+         self.done = True
+         if item is None:
+            raise StopIteration
+         raise item
+      return item
+
+   def close(self):
+      self.stopped = True
+      self.thread.join()
+
+
+'''
+decompressBlocks of the file filename.
+'''
+def decompressFile(filename, newDecompressor):
+   with open(filename, "rb") as fin:
+      for item in decompressBlocks(fin, newDecompressor):
+         yield item
+
+
+'''
+A line reader over a compressed file, fed by a decompressing thread.
+'''
+class CompressedReader:
+   def __init__(self, filename, newDecompressor):
+      self.name = filename
+      self.buf = "" # decompressed data; buf[start:] is not yet read
+      self.start = 0
+      self.blockPos = 0 # compressed offsets where buf's block begins/ends
+      self.pos = 0
+      self.blocks = BlockPrefetcher(decompressFile(filename, newDecompressor))
+
+   '''
+   Append the next decompressed block to the unread data; False at the
+   end of the file.
+   '''
+   def fill(self):
+      try:
+         item = next(self.blocks)
+      except StopIteration:
+         return False
+      except Exception as e:
+         raise IOError("error decompressing %s: %s" %(self.name, e))
+      self.blockPos = self.pos
+      self.pos, data = item
+      self.buf = self.buf[self.start:] + data
+      self.start = 0
+      return True
+
+   def readline(self):
+      while True:
+         i = self.buf.find('\n', self.start)
+         if i >= 0:
+            line = self.buf[self.start:i + 1]
+            self.start = i + 1
+            return line
+         if not self.fill():
+            line = self.buf[self.start:]
+            self.start = len(self.buf)
+            return line
+
+   def read(self, n=-1):
+      while (n < 0 or len(self.buf) - self.start < n) and self.fill():
+         pass
+      if n < 0:
+         n = len(self.buf) - self.start
+      data = self.buf[self.start:self.start + n]
+      self.start += len(data)
+      return data
+
+   def __iter__(self):
+      while True:
+         line = self.readline()
+         if not line:
+            return
+         yield line
+
+   '''
+   Compressed offset of the data read so far, interpolated within the
+   current block.
+   '''
+   def tell(self):
+      if len(self.buf) == 0:
+         return self.pos
+      return self.blockPos + (self.pos - self.blockPos) * self.start // len(self.buf)
+
+   def close(self):
+      self.blocks.close()
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *args):
+      self.close()
+
+
+'''
+Open filename for reading (binary mode), decompressing it in a background
+thread if its extension is a compressed one.
+'''
+def openInput(filename):
+   newDecompressor = codecFor(filename)
+   if newDecompressor is None:
+      return open(filename, "rb")
+   if newDecompressor is xzDecompressor and lzma is None:
+      raise IOError("xz input needs the lzma module: "+filename)
+   return CompressedReader(filename, newDecompressor)
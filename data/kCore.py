@@ -0,0 +1,137 @@
+'''
+kCore.py
+Bryan Lewandowski
+
+Bipartite (k_doc, k_co)-core of the payment graph: the largest subgraph
+in which every doctor is paid by at least k_doc distinct companies and
+every company pays at least k_co distinct doctors.
+
+Removing one node lowers the degrees of its neighbours, so a single
+round of degree filtering (paymentFilters.DegreeFilter) is not a core.
+Here the nodes are peeled with a queue: every node below its side's
+threshold is queued once, and removing it decrements its neighbours'
+degrees, queueing any neighbour which drops below its threshold.  Each
+distinct doctor-company link is looked at a constant number of times, so
+the whole peel is linear in the number of links.
+'''
+
+from array import array
+
+import paymentFilters
+from paymentGraph import countingSort
+from idIntern import PAIR_SHIFT, PAIR_MASK
+
+
+'''
+Peel the payments of pc selected by mask down to their
+(minDocK, minCoK)-core.
+Returns (docRemoved, coRemoved, peelOrder): bytearrays over the dense
+doctor/company ids (1 = peeled), and the peeled nodes in removal order,
+as a list of ("doc"|"co", raw id).
+'''
+def peel(pc, mask, minDocK, minCoK):
+   if pc.docIndex is None:
+      pc.internIds()
+   docIndex = pc.docIndex
+   coIndex = pc.coIndex
+   numDocs = len(pc.docInterner)
+   numCos = len(pc.coInterner)
+
+   # Distinct doctor-company links of the selected payments.
+   links = set()
+   for e in xrange(len(docIndex)):
+      if mask[e]:
+         links.add((docIndex[e] << PAIR_SHIFT) | coIndex[e])
+   linkDoc = array('l', [key >> PAIR_SHIFT for key in links])
+   linkCo = array('l', [key & PAIR_MASK for key in links])
+   links = None
+
+   # Both adjacency directions (CSR over link indices).
+   docOffsets, docLinks = countingSort(linkDoc, numDocs)
+   coOffsets, coLinks = countingSort(linkCo, numCos)
+   docDeg = array('l', [docOffsets[i + 1] - docOffsets[i] for i in xrange(numDocs)])
+   coDeg = array('l', [coOffsets[j + 1] - coOffsets[j] for j in xrange(numCos)])
+
+   # Queue of peeled nodes: doctor i is i, company j is ~j (negative).
+   docRemoved = bytearray(numDocs)
+   coRemoved = bytearray(numCos)
+   queue = array('l')
+   for i in xrange(numDocs):
+      if 0 < docDeg[i] < minDocK:
+         docRemoved[i] = 1
+         queue.append(i)
+   for j in xrange(numCos):
+      if 0 < coDeg[j] < minCoK:
+         coRemoved[j] = 1
+         queue.append(~j)
+
+   head = 0
+   while head < len(queue):
+      v = queue[head]
+      head += 1
+      if v >= 0:
+         for l in docLinks[docOffsets[v]:docOffsets[v + 1]]:
+            j = linkCo[l]
+            if coRemoved[j]:
+               continue
+            coDeg[j] -= 1
+            if coDeg[j] < minCoK:
+               coRemoved[j] = 1
+               queue.append(~j)
+      else:
+         for l in coLinks[coOffsets[~v]:coOffsets[~v + 1]]:
+            i = linkDoc[l]
+            if docRemoved[i]:
+               continue
+            docDeg[i] -= 1
+            if docDeg[i] < minDocK:
+               docRemoved[i] = 1
+               queue.append(i)
+
+   peelOrder = []
+   for v in queue:
+      if v >= 0:
+         peelOrder.append(("doc", pc.docInterner.rawId(v)))
+      else:
+         peelOrder.append(("co", pc.coInterner.rawId(~v)))
+   return docRemoved, coRemoved, peelOrder
+
+
+'''
+Filter stage (see paymentFilters.py) keeping the (minDocK, minCoK)-core
+of the payments still in the mask.  After apply(), removedDocs and
+removedCos are the sets of raw ids peeled, and peelOrder the peeled
+nodes in removal order.
+'''
+class KCoreFilter:
+   def __init__(self, minDocK, minCoK):
+      self.minDocK = minDocK
+      self.minCoK = minCoK
+      self.removedDocs = set()
+      self.removedCos = set()
+      self.peelOrder = []
+
+   def apply(self, pc, mask):
+      docRemoved, coRemoved, self.peelOrder = peel(pc, mask, self.minDocK, self.minCoK)
+      self.removedDocs = set([k for side, k in self.peelOrder if side == "doc"])
+      self.removedCos = set([k for side, k in self.peelOrder if side == "co"])
+      docIndex = pc.docIndex
+      coIndex = pc.coIndex
+      for e in xrange(len(docIndex)):
+         if mask[e] and (docRemoved[docIndex[e]] or coRemoved[coIndex[e]]):
+            mask[e] = 0
+
+
+'''
+The (minDocK, minCoK)-core of the payment columns pc, optionally after
+removing the payments less than minPayment.
+Returns (core, peelOrder): the payments of the core, as a new
+PaymentColumns, and the peeled nodes in removal order.
+'''
+def kCore(pc, minDocK, minCoK, minPayment=None):
+   pipeline = paymentFilters.FilterPipeline()
+   if minPayment is not None:
+      pipeline.add(paymentFilters.MinAmountFilter(minPayment))
+   coreFilter = KCoreFilter(minDocK, minCoK)
+   pipeline.add(coreFilter)
+   return pipeline.run(pc), coreFilter.peelOrder
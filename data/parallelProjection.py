@@ -0,0 +1,225 @@
+'''
+parallelProjection.py
+Bryan Lewandowski
+
+Process-pool execution of the doc-doc/co-co projections (see
+projection.py).  The member pairs of every group are independent, only
+their deduplication is shared, so the groups are sharded over the worker
+processes and each worker deduplicates its own pairs into sorted runs;
+a final k-way merge of all the runs sums the weights of the pairs found
+by several workers.
+
+The degree distribution is very skewed (a few companies pay thousands of
+doctors), so the shards are balanced by pair cost, C(size, 2) per
+group, not by number of groups: the work is cut into units (a group, or
+for a group costing more than a fair share, slices of its members) which
+are dealt to NUM_SHARDS_PER_WORKER * numWorkers shards, largest first,
+always to the cheapest shard so far.  The pool hands shards out as
+workers free up.
+
+The workers get the incidence matrix by inheritance (it is a module
+global when the pool forks), not by pickling it per task.
+'''
+
+import os
+import heapq
+import shutil
+import tempfile
+import multiprocessing
+
+import edgeWriter
+from projection import BLOCK_ROWS, DEDUP_BYTES_PER_PAIR
+from idIntern import PAIR_SHIFT, PAIR_MASK
+
+NUM_SHARDS_PER_WORKER = 4
+RUN_MEMORY_BYTES = 1 << 29 # default budget of the pairs held, over all the workers
+MERGE_FAN_IN = 64 # most runs open at once in a merge pass
+
+_incidence = None # the Incidence being projected, inherited by the workers
+
+
+'''
+Cut the groups of inc into units of work (g, a, b): the pairs whose
+lower member is at position a..b-1 of group g's members (those pairs
+pair it with every later member of the group).  A group costing more
+than maxCost pairs is sliced into units of about maxCost pairs.
+Returns a list of (cost, (g, a, b)).
+'''
+def workUnits(inc, maxCost):
+   units = []
+   for g in xrange(inc.numGroups()):
+      a, end = inc.groupOffsets[g], inc.groupOffsets[g + 1]
+      n = end - a
+      if n * (n - 1) / 2 <= maxCost:
+         if n > 1:
+            units.append((n * (n - 1) / 2, (g, a, end)))
+         continue
+      start = a
+      cost = 0
+      for x in xrange(a, end):
+         cost += end - x - 1
+         if cost >= maxCost:
+            units.append((cost, (g, start, x + 1)))
+            start = x + 1
+            cost = 0
+      if cost > 0:
+         units.append((cost, (g, start, end)))
+   return units
+
+
+'''
+Deal the work of inc into numShards shards of about equal pair cost
+(greedy, largest unit first, to the cheapest shard).
+Returns a list of (cost, [units]) shards, empty shards left out.
+'''
+def balanceShards(inc, numShards):
+   total = 0
+   for g in xrange(inc.numGroups()):
+      n = inc.groupSize(g)
+      total += n * (n - 1) / 2
+   units = workUnits(inc, max(1, total / (numShards * 2)))
+   units.sort(reverse=True)
+   heap = [(0, s) for s in xrange(numShards)]
+   shards = [[] for s in xrange(numShards)]
+   for cost, unit in units:
+      load, s = heapq.heappop(heap)
+      shards[s].append(unit)
+      heapq.heappush(heap, (load + cost, s))
+   loads = dict((s, load) for load, s in heap)
+   return [(loads[s], shards[s]) for s in xrange(numShards) if len(shards[s]) > 0]
+
+
+'''
+Run record format: packed pair key, shared (int64, or float64 when the
+groups are weighted), and dollars (float64) when withDollars.
+'''
+def runFormat(inc, withDollars):
+   return "q" + ("q" if inc.groupWeights is None else "d") + ("d" if withDollars else "")
+
+
+'''
+Write the pairs of shared (and dollars) as a sorted run file.
+'''
+def writeRun(filename, fmt, shared, dollars):
+   if dollars is None:
+      rows = ((key, shared[key]) for key in sorted(shared))
+   else:
+      rows = ((key, shared[key], dollars[key]) for key in sorted(shared))
+   edgeWriter.writeRows(filename, rows, numColumns=len(fmt), binaryFormat=fmt)
+   return filename
+
+
+'''
+Pool worker: generate and deduplicate the pairs of one shard, writing a
+sorted run every runPairs distinct pairs.
+Returns the list of run file names.
+'''
+def shardWorker(args):
+   shardIndex, units, runPrefix, withDollars, runPairs = args
+   inc = _incidence
+   fmt = runFormat(inc, withDollars)
+   groupMembers = inc.groupMembers
+   groupValues = inc.groupValues
+   groupWeights = inc.groupWeights
+   runs = []
+   shared = dict()
+   dollars = dict() if withDollars else None
+   for g, a, b in units:
+      end = inc.groupOffsets[g + 1]
+      w = 1 if groupWeights is None else groupWeights[g]
+      for x in xrange(a, b):
+         lo = groupMembers[x] << PAIR_SHIFT
+         for y in xrange(x + 1, end):
+            key = lo | groupMembers[y]
+            shared[key] = shared.get(key, 0) + w
+            if withDollars:
+               dollars[key] = dollars.get(key, 0.) + min(groupValues[x], groupValues[y])
+         if len(shared) >= runPairs:
+            runs.append(writeRun("%s%d_%d.bin" %(runPrefix, shardIndex, len(runs)), fmt, shared, dollars))
+            shared = dict()
+            dollars = dict() if withDollars else None
+   if len(shared) > 0:
+      runs.append(writeRun("%s%d_%d.bin" %(runPrefix, shardIndex, len(runs)), fmt, shared, dollars))
+   return runs
+
+
+'''
+k-way merge of sorted run files (all in format fmt), summing the weights
+of equal pairs.  Yields (key, shared) or (key, shared, dollars) rows in
+increasing key order, like the runs.
+'''
+def sumRuns(runs, fmt):
+   merged = heapq.merge(*[edgeWriter.readBinaryRows(r, fmt) for r in runs])
+   cur = None
+   for row in merged:
+      if cur is not None and row[0] == cur[0]:
+         cur[1] += row[1]
+         if len(row) > 2:
+            cur[2] += row[2]
+         continue
+      if cur is not None:
+         yield tuple(cur)
+      cur = list(row)
+   if cur is not None:
+      yield tuple(cur)
+
+
+'''
+Merge the sorted run files (all in format fmt) with at most fanIn open at
+once: while there are more, groups of fanIn runs are merged into
+intermediate runs (runPrefix + "pass<n>_<k>.bin"), and the merged runs
+removed.  Yields (i, k, shared) or (i, k, shared, dollars) rows in
+increasing (i, k) order.
+'''
+def mergeRuns(runs, fmt, runPrefix, fanIn=MERGE_FAN_IN):
+   assert(fanIn > 1)
+   mergePassN = 0
+   while len(runs) > fanIn:
+      mergePassN += 1
+      merged = []
+      for k in xrange(0, len(runs), fanIn):
+         merged.append("%spass%d_%d.bin" %(runPrefix, mergePassN, len(merged)))
+         edgeWriter.writeRows(merged[-1], sumRuns(runs[k:k+fanIn], fmt), numColumns=len(fmt), binaryFormat=fmt)
+         for r in runs[k:k+fanIn]:
+            os.remove(r)
+      runs = merged
+   for row in sumRuns(runs, fmt):
+      yield (row[0] >> PAIR_SHIFT, row[0] & PAIR_MASK) + row[1:]
+
+
+'''
+The projection of inc computed by numWorkers processes (see above), the
+runs under a temporary directory in spillDir (removed afterwards).
+memoryBytes bounds the pairs held at once over all the workers (each
+holds memoryBytes / numWorkers; default RUN_MEMORY_BYTES).
+Yields blocks of rows like projection.projectBlocks, in increasing
+(i, k) order.  Shared dollars are summed in a different order than in
+the serial projection, so they can differ from it in the last bits.
+'''
+def parallelBlocks(inc, numWorkers, withDollars=False, spillDir=None, memoryBytes=None):
+   global _incidence
+   if withDollars and inc.groupValues is None:
+      raise ValueError("shared dollars need an Incidence built with dollars")
+   if memoryBytes is None:
+      memoryBytes = RUN_MEMORY_BYTES
+   runPairs = max(1, memoryBytes / (DEDUP_BYTES_PER_PAIR * numWorkers))
+   tmpDir = tempfile.mkdtemp(prefix="projection", dir=spillDir)
+   try:
+      shards = balanceShards(inc, NUM_SHARDS_PER_WORKER * numWorkers)
+      jobs = [(s, shards[s][1], os.path.join(tmpDir, "run"), withDollars, runPairs) for s in xrange(len(shards))]
+      runs = []
+      _incidence = inc
+      pool = multiprocessing.Pool(numWorkers)
+      try:
+         for shardRuns in pool.imap_unordered(shardWorker, jobs):
+            runs.extend(shardRuns)
+      finally:
+         pool.close()
+         pool.join()
+         _incidence = None
+
+      rows = mergeRuns(runs, runFormat(inc, withDollars), os.path.join(tmpDir, "merge"))
+      for block in edgeWriter.blocks(rows, BLOCK_ROWS):
+         yield block
+   finally:
+      shutil.rmtree(tmpDir, ignore_errors=True)
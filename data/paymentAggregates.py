@@ -0,0 +1,246 @@
+'''
+paymentAggregates.py
+Bryan Lewandowski
+
+Per-entity running aggregates of the payment data (payment count, total,
+largest payment and distinct counterparties of every doctor and company),
+updated one payment at a time and mergeable, so they can be built over
+byte ranges of the payment file in separate processes and combined.
+
+Totals are kept as exact partial sums (Shewchuk's algorithm, as used by
+math.fsum), so a total does not depend on how the payments were split up
+or in which order the partial results were merged.
+
+With a sketchError the aggregates are bounded in memory (see
+sketches.py): each entity's distinct counterparties are a HyperLogLog
+instead of a set, and the payment amounts are kept in a QuantileSketch
+(for the median and tail payments), both mergeable like the rest.
+'''
+
+import math
+import multiprocessing
+from array import array
+
+import paymentCache
+import sketches
+from paymentCache import INT64
+
+
+'''
+Add x to the list of non-overlapping partial sums partials (in place).
+math.fsum(partials) is then the correctly rounded total.
+'''
+def addPartial(partials, x):
+   i = 0
+   for y in partials:
+      if abs(x) < abs(y):
+         x, y = y, x
+      hi = x + y
+      lo = y - (hi - x)
+      if lo:
+         partials[i] = lo
+         i += 1
+      x = hi
+   partials[i:] = [x]
+
+
+'''
+Running aggregates for one side of the bipartite graph (doctors or
+companies), keyed by entity id:
+   counts, id -> number of payments
+   sums, id -> partial sums of the payments (see addPartial)
+   maxes, id -> largest single payment
+   neighbours, id -> set of distinct counterparty ids (None if
+      keepNeighbours is False; with a distinctError, a
+      sketches.HyperLogLog of about that relative error instead of a set)
+'''
+class EntityAggregates:
+   def __init__(self, keepNeighbours=True, distinctError=None):
+      self.counts = dict()
+      self.sums = dict()
+      self.maxes = dict()
+      self.neighbours = dict() if keepNeighbours else None
+      self.distinctError = distinctError
+
+   '''
+   A new neighbour collection: a set, or a HyperLogLog.
+   '''
+   def newNeighbours(self):
+      if self.distinctError is None:
+         return set()
+      return sketches.HyperLogLog.forError(self.distinctError)
+
+   def __len__(self):
+      return len(self.counts)
+
+   def __iter__(self):
+      return iter(self.counts)
+
+   def __contains__(self, k):
+      return k in self.counts
+
+   def add(self, k, other, amount):
+      if k not in self.counts:
+         self.counts[k] = 1
+         self.sums[k] = [amount]
+         self.maxes[k] = amount
+         if self.neighbours is not None:
+            self.neighbours[k] = self.newNeighbours()
+            self.neighbours[k].add(other)
+         return
+      self.counts[k] += 1
+      addPartial(self.sums[k], amount)
+      if amount > self.maxes[k]:
+         self.maxes[k] = amount
+      if self.neighbours is not None:
+         self.neighbours[k].add(other)
+
+   def merge(self, other):
+      for k in other.counts:
+         if k not in self.counts:
+            self.counts[k] = other.counts[k]
+            self.sums[k] = list(other.sums[k])
+            self.maxes[k] = other.maxes[k]
+            if self.neighbours is not None:
+               self.neighbours[k] = self.newNeighbours()
+               self.mergeNeighbours(k, other.neighbours[k])
+            continue
+         self.counts[k] += other.counts[k]
+         for y in other.sums[k]:
+            addPartial(self.sums[k], y)
+         if other.maxes[k] > self.maxes[k]:
+            self.maxes[k] = other.maxes[k]
+         if self.neighbours is not None:
+            self.mergeNeighbours(k, other.neighbours[k])
+
+   def mergeNeighbours(self, k, neighbours):
+      if self.distinctError is None:
+         self.neighbours[k].update(neighbours)
+      else:
+         self.neighbours[k].merge(neighbours)
+
+   def total(self, k):
+      return math.fsum(self.sums[k])
+
+   def degree(self, k):
+      return len(self.neighbours[k])
+
+   '''
+   dict id -> total payments (like sumPayments of the payment lists).
+   '''
+   def totals(self):
+      out = dict()
+      for k in self.sums:
+         out[k] = math.fsum(self.sums[k])
+      return out
+
+   '''
+   dict id -> number of distinct counterparties (estimated, with a
+   distinctError).
+   '''
+   def degrees(self):
+      out = dict()
+      for k in self.neighbours:
+         out[k] = len(self.neighbours[k])
+      return out
+
+
+'''
+Aggregates of a (part of a) payment file: one EntityAggregates per side,
+plus the file-level bad line numbers, line count, header and total.
+sketchError, if given, is the error of the sketches kept instead of
+exact structures: the relative error of the degrees and the rank error
+of amounts, a sketches.QuantileSketch of every payment (None without a
+sketchError).
+'''
+class PaymentAggregates:
+   def __init__(self, keepNeighbours=True, sketchError=None):
+      self.docs = EntityAggregates(keepNeighbours, sketchError)
+      self.cos = EntityAggregates(keepNeighbours, sketchError)
+      self.badLines = array(INT64)
+      self.numLines = 0
+      self.header = ""
+      self.rawTotal = []  # partial sums of every payment
+      self.sketchError = sketchError
+      self.amounts = None
+      if sketchError is not None:
+         self.amounts = sketches.QuantileSketch.forError(sketchError)
+
+   def add(self, doc, co, amount):
+      self.docs.add(doc, co, amount)
+      self.cos.add(co, doc, amount)
+      addPartial(self.rawTotal, amount)
+      if self.amounts is not None:
+         self.amounts.add(amount)
+
+   def numPayments(self):
+      return sum(self.cos.counts.itervalues())
+
+   def rawTotalPayments(self):
+      return math.fsum(self.rawTotal)
+
+   '''
+   Merge in the aggregates of the part of the file directly following
+   this one (its line numbers are shifted by this part's line count).
+   '''
+   def merge(self, other):
+      if self.numLines == 0:
+         self.header = other.header
+      self.docs.merge(other.docs)
+      self.cos.merge(other.cos)
+      self.badLines.extend([b + self.numLines for b in other.badLines])
+      self.numLines += other.numLines
+      for y in other.rawTotal:
+         addPartial(self.rawTotal, y)
+      if self.amounts is not None:
+         self.amounts.merge(other.amounts)
+
+
+'''
+Aggregate the lines of filename in the byte range [start, end) (see
+paymentCache.parseRange for the line format and numbering).
+'''
+def aggregateRange(filename, start, end, keepNeighbours=True, sketchError=None):
+   agg = PaymentAggregates(keepNeighbours, sketchError)
+   i = 0
+   for line in paymentCache.rangeLines(filename, start, end):
+      i += 1
+      if i == 1 and start == 0:
+         agg.header = line
+         continue # header line
+      s = line.split()
+      if(len(s)!=3):
+         agg.badLines.append(i)
+         continue
+      agg.add(int(s[0]), int(s[1]), float(s[2]))
+   agg.numLines = i
+   return agg
+
+
+def aggregateRangeWorker(args):
+   return aggregateRange(*args)
+
+
+'''
+Aggregate the whole payment file, in numWorkers processes (one
+newline-aligned byte range each) when numWorkers > 1.  The partial
+results are merged in file order, so the result is identical to the
+serial (numWorkers=1) path (the sketches of a sketchError aside, which
+are only within their error bounds of it).
+Returns a PaymentAggregates.
+'''
+def aggregatePaymentFile(filename, numWorkers=1, keepNeighbours=True, sketchError=None):
+   ranges = paymentCache.findRanges(filename, numWorkers)
+   if numWorkers <= 1 or len(ranges) <= 1:
+      return aggregateRange(filename, 0, ranges[-1][1], keepNeighbours, sketchError)
+
+   agg = PaymentAggregates(keepNeighbours, sketchError)
+   pool = multiprocessing.Pool(numWorkers)
+   try:
+      jobs = [(filename, start, end, keepNeighbours, sketchError) for start, end in ranges]
+      for part in pool.imap(aggregateRangeWorker, jobs):
+         agg.merge(part)
+   finally:
+      pool.close()
+      pool.join()
+   return agg
@@ -0,0 +1,365 @@
+'''
+paymentCache.py
+Bryan Lewandowski
+
+One-time ingest of the payment_graph_physician_company.csv data into a
+columnar binary cache.  The cache lives in a directory next to the input
+file (filename + ".cache") and holds one raw, little-endian column per
+file:
+   doc.bin      int64   doctor/provider id of each good line
+   co.bin       int64   company/payer id of each good line
+   amount.bin   float64 payment amount of each good line
+   badlines.bin int64   line numbers (1 based, header is line 1) which did
+                        not parse into 3 fields
+   docids.bin   int64   sorted distinct doctor ids (dense id -> raw id)
+   coids.bin    int64   sorted distinct company ids (dense id -> raw id)
+   docidx.bin   int32   dense doctor id of each good line
+   coidx.bin    int32   dense company id of each good line
+   meta.json    the source file signature (size, mtime, md5), the header
+                line and the row counts.
+
+The column files have no header, so they can be memory-mapped directly
+(eg: numpy.memmap(..., dtype='<i8')).  Here they are read with one bulk
+array.fromfile() each, which is far cheaper than re-parsing the text.
+
+The cache is rebuilt automatically whenever the source file's size
+changes, or its mtime changes and its md5 no longer matches.
+'''
+
+import os
+import sys
+import json
+import hashlib
+import multiprocessing
+from array import array
+from itertools import izip
+
+import inputStream
+from idIntern import IdInterner, INT64, INDEX
+
+
+CACHE_VERSION = 2
+
+FLOAT64 = 'd'
+
+COLUMNS = [("docs", "doc.bin", INT64),
+           ("cos", "co.bin", INT64),
+           ("amounts", "amount.bin", FLOAT64),
+           ("badLines", "badlines.bin", INT64),
+           ("docIndex", "docidx.bin", INDEX),
+           ("coIndex", "coidx.bin", INDEX)]
+
+
+'''
+The parsed payment file, as typed columns.
+   header, the header line of the source file (with its newline)
+   docs, array of doctor ids, one per good line
+   cos, array of company ids, one per good line
+   amounts, array of payment amounts, one per good line
+   badLines, array of line numbers (1 based) excluded from the data
+   numLines, the number of lines in the file (including the header)
+and, once internIds() has been called (always, when loaded through the
+cache):
+   docInterner, coInterner, the idIntern.IdInterner of each side
+   docIndex, coIndex, int32 arrays of the dense ids of docs and cos
+'''
+class PaymentColumns:
+   def __init__(self, header, docs, cos, amounts, badLines, numLines):
+      assert(len(docs) == len(cos) and len(cos) == len(amounts))
+      self.header = header
+      self.docs = docs
+      self.cos = cos
+      self.amounts = amounts
+      self.badLines = badLines
+      self.numLines = numLines
+      self.docInterner = None
+      self.coInterner = None
+      self.docIndex = None
+      self.coIndex = None
+
+   '''
+   Map the doctor and company ids to dense ids (see idIntern.py).
+   '''
+   def internIds(self):
+      self.docInterner = IdInterner.fromKeys(self.docs)
+      self.coInterner = IdInterner.fromKeys(self.cos)
+      self.docIndex = self.docInterner.intern(self.docs)
+      self.coIndex = self.coInterner.intern(self.cos)
+
+   def __len__(self):
+      return len(self.amounts)
+
+   '''
+   Iterate the payments in file order, as (doc, co, amount) triples.
+   '''
+   def rows(self):
+      return izip(self.docs, self.cos, self.amounts)
+
+
+'''
+Split filename into (at most) numRanges byte ranges [start, end), each
+starting at the beginning of a line, so that every line falls in exactly
+one range.
+'''
+def findRanges(filename, numRanges):
+   size = os.stat(filename).st_size
+   if inputStream.isCompressed(filename):
+      return [(0, size)] # can not seek into a compressed stream
+   bounds = [0]
+   with open(filename, "rb") as fin:
+      for k in xrange(1, numRanges):
+         fin.seek(k * size / numRanges)
+         fin.readline()
+         pos = min(fin.tell(), size)
+         if pos > bounds[-1]:
+            bounds.append(pos)
+   if bounds[-1] < size or len(bounds) == 1:
+      bounds.append(size)
+   return [(bounds[k], bounds[k + 1]) for k in xrange(len(bounds) - 1)]
+
+
+'''
+Iterate the lines of filename which start in the byte range [start, end)
+(start must be the beginning of a line, see findRanges).
+'''
+def rangeLines(filename, start, end):
+   if inputStream.isCompressed(filename):
+      # One range only (see findRanges): every line of the file.
+      assert(start == 0)
+      with inputStream.openInput(filename) as fin:
+         for line in fin:
+            yield line
+      return
+   with open(filename, "rb") as fin:
+      fin.seek(start)
+      pos = start
+      while pos < end:
+         line = fin.readline()
+         if not line:
+            break
+         pos += len(line)
+         yield line
+
+
+'''
+Parse the lines of filename in the byte range [start, end), in the
+original text format: a header line (only in the range starting at byte
+0), then "doctorId companyId amount" whitespace separated.
+Returns a PaymentColumns whose badLines and numLines are local to the
+range (line 1 is the first line of the range).
+'''
+def parseRange(filename, start, end):
+   docs = array(INT64)
+   cos = array(INT64)
+   amounts = array(FLOAT64)
+   badLines = array(INT64)
+   header = ""
+   i = 0
+   for line in rangeLines(filename, start, end):
+      i += 1
+      if i == 1 and start == 0:
+         header = line
+         continue # header line
+      s = line.split()
+      if(len(s)!=3):
+         badLines.append(i)
+         continue
+      docs.append(int(s[0]))
+      cos.append(int(s[1]))
+      amounts.append(float(s[2]))
+   return PaymentColumns(header, docs, cos, amounts, badLines, i)
+
+
+'''
+Parse the payment file line by line (the original text format: a header
+line, then "doctorId companyId amount" whitespace separated).
+Returns a PaymentColumns.
+'''
+def parsePaymentFile(filename):
+   return parseRange(filename, 0, os.stat(filename).st_size)
+
+
+'''
+Pool worker for parsePaymentFileParallel: parse one byte range and ship
+the columns back as raw bytes (much cheaper to pickle than arrays).
+'''
+def parseRangeWorker(args):
+   pc = parseRange(*args)
+   return (pc.header, pc.docs.tostring(), pc.cos.tostring(),
+           pc.amounts.tostring(), pc.badLines.tostring(), pc.numLines)
+
+
+'''
+Parse the payment file with numWorkers processes, one newline-aligned
+byte range each.  The ranges are concatenated back in file order, with
+bad line numbers shifted to global line numbers, so the result is
+identical to parsePaymentFile.
+'''
+def parsePaymentFileParallel(filename, numWorkers):
+   ranges = findRanges(filename, numWorkers)
+   if numWorkers <= 1 or len(ranges) <= 1:
+      return parsePaymentFile(filename)
+
+   docs = array(INT64)
+   cos = array(INT64)
+   amounts = array(FLOAT64)
+   badLines = array(INT64)
+   header = ""
+   numLines = 0
+   pool = multiprocessing.Pool(numWorkers)
+   try:
+      jobs = [(filename, start, end) for start, end in ranges]
+      for part in pool.imap(parseRangeWorker, jobs):
+         if numLines == 0:
+            header = part[0]
+         docs.fromstring(part[1])
+         cos.fromstring(part[2])
+         amounts.fromstring(part[3])
+         partBad = array(INT64)
+         partBad.fromstring(part[4])
+         badLines.extend([b + numLines for b in partBad])
+         numLines += part[5]
+   finally:
+      pool.close()
+      pool.join()
+   return PaymentColumns(header, docs, cos, amounts, badLines, numLines)
+
+
+def cacheDirName(filename):
+   return filename + ".cache"
+
+
+'''
+md5 of a whole file, read in large blocks.
+'''
+def fileHash(filename):
+   h = hashlib.md5()
+   with open(filename, "rb") as fin:
+      while True:
+         block = fin.read(1 << 22)
+         if not block:
+            break
+         h.update(block)
+   return h.hexdigest()
+
+
+'''
+Write the columns of a PaymentColumns (with its dense ids, see
+PaymentColumns.internIds) into the cache directory for filename.
+meta.json is written last, so an interrupted write is seen as "no cache"
+on the next load.
+'''
+def writeCache(filename, pc, digest=None):
+   cacheDir = cacheDirName(filename)
+   if not os.path.isdir(cacheDir):
+      os.makedirs(cacheDir)
+   metaName = os.path.join(cacheDir, "meta.json")
+   if os.path.exists(metaName):
+      os.remove(metaName)
+
+   for attr, fn, typecode in COLUMNS:
+      col = getattr(pc, attr)
+      if sys.byteorder == "big":
+         col = array(typecode, col)
+         col.byteswap()
+      with open(os.path.join(cacheDir, fn), "wb") as fout:
+         col.tofile(fout)
+
+   pc.docInterner.save(os.path.join(cacheDir, "docids.bin"))
+   pc.coInterner.save(os.path.join(cacheDir, "coids.bin"))
+
+   st = os.stat(filename)
+   meta = dict()
+   meta["version"] = CACHE_VERSION
+   meta["size"] = st.st_size
+   meta["mtime"] = st.st_mtime
+   meta["md5"] = digest if digest is not None else fileHash(filename)
+   meta["header"] = pc.header
+   meta["numLines"] = pc.numLines
+   meta["numPayments"] = len(pc)
+   meta["numBadLines"] = len(pc.badLines)
+   meta["numDocs"] = len(pc.docInterner)
+   meta["numCos"] = len(pc.coInterner)
+   with open(metaName + ".tmp", "w") as fout:
+      json.dump(meta, fout)
+   os.rename(metaName + ".tmp", metaName)
+
+
+def readCacheMeta(filename):
+   metaName = os.path.join(cacheDirName(filename), "meta.json")
+   if not os.path.exists(metaName):
+      return None
+   with open(metaName) as fin:
+      return json.load(fin)
+
+
+'''
+Is the cache for filename still describing the same data?  A size change
+always invalidates; an mtime change only invalidates if the md5 changed
+too (in which case the stored mtime is refreshed, so the hash is not
+recomputed on every load).
+'''
+def cacheIsValid(filename, meta):
+   if meta is None or meta.get("version") != CACHE_VERSION:
+      return False
+   st = os.stat(filename)
+   if st.st_size != meta["size"]:
+      return False
+   if st.st_mtime == meta["mtime"]:
+      return True
+   if fileHash(filename) != meta["md5"]:
+      return False
+   meta["mtime"] = st.st_mtime
+   metaName = os.path.join(cacheDirName(filename), "meta.json")
+   with open(metaName + ".tmp", "w") as fout:
+      json.dump(meta, fout)
+   os.rename(metaName + ".tmp", metaName)
+   return True
+
+
+'''
+Read the cached columns of filename (no validity check, see
+cacheIsValid).  Returns a PaymentColumns.
+'''
+def readCache(filename, meta):
+   cacheDir = cacheDirName(filename)
+   n = meta["numPayments"]
+   lengths = {"docs": n, "cos": n, "amounts": n, "docIndex": n, "coIndex": n,
+              "badLines": meta["numBadLines"]}
+   cols = dict()
+   for attr, fn, typecode in COLUMNS:
+      col = array(typecode)
+      with open(os.path.join(cacheDir, fn), "rb") as fin:
+         col.fromfile(fin, lengths[attr])
+      if sys.byteorder == "big":
+         col.byteswap()
+      cols[attr] = col
+   pc = PaymentColumns(str(meta["header"]), cols["docs"], cols["cos"],
+                       cols["amounts"], cols["badLines"], meta["numLines"])
+   pc.docInterner = IdInterner.load(os.path.join(cacheDir, "docids.bin"), meta["numDocs"])
+   pc.coInterner = IdInterner.load(os.path.join(cacheDir, "coids.bin"), meta["numCos"])
+   pc.docIndex = cols["docIndex"]
+   pc.coIndex = cols["coIndex"]
+   return pc
+
+
+'''
+Load the payment file filename as typed columns, from its binary cache if
+that is still valid, otherwise by parsing the text file and (re)writing
+the cache.
+Inputs: filename, the payment .csv file
+   rebuild, force a re-parse of the text file.
+   numWorkers, the number of processes used if the text file has to be
+      parsed (1 parses serially).
+Returns a PaymentColumns.
+'''
+def loadPayments(filename, rebuild=False, numWorkers=1):
+   meta = None if rebuild else readCacheMeta(filename)
+   if cacheIsValid(filename, meta):
+      return readCache(filename, meta)
+
+   print "Building payment cache for " + filename
+   pc = parsePaymentFileParallel(filename, numWorkers)
+   pc.internIds()
+   writeCache(filename, pc)
+   return pc
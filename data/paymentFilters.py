@@ -0,0 +1,201 @@
+'''
+paymentFilters.py
+Bryan Lewandowski
+
+Composable filters over the in-memory payment columns (a
+paymentCache.PaymentColumns).  Each filter is a stage which clears the
+entries of a keep-mask (a bytearray, one byte per payment) for the
+payments it rejects; a FilterPipeline runs its stages in order over one
+shared mask, so chaining filters never re-reads the payment file.
+
+Stages which depend on the data (degree and proportion thresholds) look
+only at the payments still in the mask when they run, so their order in
+the pipeline matters, eg: [DegreeFilter(3, 3), MinAmountFilter(1000.)]
+measures degrees before removing the small payments.
+'''
+
+import itertools
+from array import array
+
+import edgeWriter
+from paymentCache import PaymentColumns, INT64, FLOAT64
+from idIntern import PAIR_SHIFT, PAIR_MASK
+
+
+'''
+Remove payments less than minPayment.
+'''
+class MinAmountFilter:
+   def __init__(self, minPayment):
+      self.minPayment = minPayment
+
+   def apply(self, pc, mask):
+      minPayment = self.minPayment
+      amounts = pc.amounts
+      for e in xrange(len(amounts)):
+         if mask[e] and amounts[e] < minPayment:
+            mask[e] = 0
+
+
+'''
+Remove payments from the companies in skipCos or to the doctors in
+skipDocs (sets of raw ids, either may be None).
+'''
+class ExcludeFilter:
+   def __init__(self, skipCos=None, skipDocs=None):
+      self.skipCos = skipCos
+      self.skipDocs = skipDocs
+
+   def apply(self, pc, mask):
+      for skip, col in [(self.skipCos, pc.cos), (self.skipDocs, pc.docs)]:
+         if skip is None or len(skip) == 0:
+            continue
+         for e in xrange(len(col)):
+            if mask[e] and col[e] in skip:
+               mask[e] = 0
+
+
+'''
+Remove doctors paid by fewer than minDocK distinct companies and
+companies paying fewer than minCoK distinct doctors (one round, degrees
+measured over the payments still in the mask; kCore.KCoreFilter iterates
+to a true core).  After apply(),
+removedDocs and removedCos are the sets of raw ids which were removed.
+'''
+class DegreeFilter:
+   def __init__(self, minDocK, minCoK):
+      self.minDocK = minDocK
+      self.minCoK = minCoK
+      self.removedDocs = set()
+      self.removedCos = set()
+
+   def apply(self, pc, mask):
+      if pc.docIndex is None:
+         pc.internIds()
+      docIndex = pc.docIndex
+      coIndex = pc.coIndex
+
+      # Distinct (doc, co) links, as packed keys.
+      links = set()
+      for e in xrange(len(docIndex)):
+         if mask[e]:
+            links.add((docIndex[e] << PAIR_SHIFT) | coIndex[e])
+      docDeg = array('l', [0]) * len(pc.docInterner)
+      coDeg = array('l', [0]) * len(pc.coInterner)
+      for key in links:
+         docDeg[key >> PAIR_SHIFT] += 1
+         coDeg[key & PAIR_MASK] += 1
+      links = None
+
+      minDocK = self.minDocK
+      minCoK = self.minCoK
+      self.removedDocs = set([pc.docInterner.rawId(i) for i in xrange(len(docDeg)) if 0 < docDeg[i] < minDocK])
+      self.removedCos = set([pc.coInterner.rawId(j) for j in xrange(len(coDeg)) if 0 < coDeg[j] < minCoK])
+      for e in xrange(len(docIndex)):
+         if mask[e] and (docDeg[docIndex[e]] < minDocK or coDeg[coIndex[e]] < minCoK):
+            mask[e] = 0
+
+
+'''
+Keep only the payments which are at least upperCoProportion of the
+paying company's total payments and at least upperDocProportion of the
+receiving doctor's total payments (totals over the payments still in
+the mask).
+'''
+class ProportionFilter:
+   def __init__(self, upperCoProportion, upperDocProportion):
+      self.upperCoProportion = upperCoProportion
+      self.upperDocProportion = upperDocProportion
+
+   def apply(self, pc, mask):
+      if pc.docIndex is None:
+         pc.internIds()
+      docIndex = pc.docIndex
+      coIndex = pc.coIndex
+      amounts = pc.amounts
+
+      # Totals accumulate in file order, like sum() of the payment lists.
+      docTotal = array(FLOAT64, [0.]) * len(pc.docInterner)
+      coTotal = array(FLOAT64, [0.]) * len(pc.coInterner)
+      for e in xrange(len(amounts)):
+         if mask[e]:
+            docTotal[docIndex[e]] += amounts[e]
+            coTotal[coIndex[e]] += amounts[e]
+      for i in xrange(len(docTotal)):
+         docTotal[i] *= self.upperDocProportion
+      for j in xrange(len(coTotal)):
+         coTotal[j] *= self.upperCoProportion
+
+      for e in xrange(len(amounts)):
+         if mask[e] and (amounts[e] < coTotal[coIndex[e]] or amounts[e] < docTotal[docIndex[e]]):
+            mask[e] = 0
+
+
+'''
+Keep only the first of identical (doctor, company, amount) payments.
+'''
+class DistinctPaymentsFilter:
+   def apply(self, pc, mask):
+      seen = set()
+      for e in xrange(len(pc.amounts)):
+         if mask[e]:
+            key = (pc.docs[e], pc.cos[e], pc.amounts[e])
+            if key in seen:
+               mask[e] = 0
+            else:
+               seen.add(key)
+
+
+'''
+The payment columns selected by mask, as a new PaymentColumns (with no
+dense ids: the kept payments may not use every id).
+'''
+def selectColumns(pc, mask):
+   docs = array(INT64, itertools.compress(pc.docs, mask))
+   cos = array(INT64, itertools.compress(pc.cos, mask))
+   amounts = array(FLOAT64, itertools.compress(pc.amounts, mask))
+   return PaymentColumns(pc.header, docs, cos, amounts, pc.badLines, pc.numLines)
+
+
+'''
+Write payment columns out in the payment file format (header line, then
+"doctorId companyId amount" tab separated), gzip/xz compressed if
+filename ends in .gz/.xz.
+'''
+def writePaymentFile(filename, pc, header=None):
+   fout = edgeWriter.openOutput(filename)
+   try:
+      fout.write(pc.header if header is None else header)
+      edgeWriter.TabWriter(fout, 3).writeRows(pc.rows())
+   finally:
+      fout.close()
+
+
+'''
+A sequence of filter stages, combined into one keep-mask.
+'''
+class FilterPipeline:
+   def __init__(self, stages=None):
+      self.stages = list(stages) if stages is not None else []
+
+   '''
+   Append a stage; returns the pipeline, so calls can be chained.
+   '''
+   def add(self, stage):
+      self.stages.append(stage)
+      return self
+
+   '''
+   The keep-mask (bytearray, 1 = keep) of the payments of pc.
+   '''
+   def mask(self, pc):
+      mask = bytearray([1]) * len(pc)
+      for stage in self.stages:
+         stage.apply(pc, mask)
+      return mask
+
+   '''
+   The payments of pc which pass every stage, as a new PaymentColumns.
+   '''
+   def run(self, pc):
+      return selectColumns(pc, self.mask(pc))
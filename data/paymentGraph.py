@@ -0,0 +1,300 @@
+'''
+paymentGraph.py
+Bryan Lewandowski
+
+Compact doctor-company bipartite payment graph.
+
+Every payment is an edge, stored once: edges are kept in doctor-major
+order (a compressed sparse row, CSR, layout) with the amount of each
+payment aligned to its edge.  A second CSR in company-major order holds
+only edge indices into the doctor-major arrays, so the amounts are never
+duplicated.  Within a row, payments keep their order in the input file.
+Beside them, each side has a deduplicated CSR of its distinct
+counterparties, sorted, so a neighbour list is a slice and a degree an
+offset difference.
+
+   docIds      sorted distinct doctor ids (row i of the doctor CSR is
+               dense doctor id i, see idIntern.py)
+   docOffsets  payments of doctor row i are edges docOffsets[i]:docOffsets[i+1]
+   edgeDoc     doctor row of each edge
+   edgeCo      company row of each edge
+   amounts     amount of each edge
+   coIds       sorted distinct company ids (row j of the company CSR)
+   coOffsets   company row j owns coEdges[coOffsets[j]:coOffsets[j+1]]
+   coEdges     edge indices, grouped by company
+   docNeighbourOffsets, docNeighbours
+               distinct company rows of doctor row i, increasing:
+               docNeighbours[docNeighbourOffsets[i]:docNeighbourOffsets[i+1]]
+   coNeighbourOffsets, coNeighbours
+               distinct doctor rows of company row j, likewise
+
+The views returned by paymentsByCo(), paymentsByDoc(), docsByCo(),
+cosByDoc(), paymentsRankedByCo() and paymentsRankedByDoc() behave like the
+read-only dicts fileToStructures used to build (cos, docs, cosToDocs,
+docsToCos, cosPayments, docsPayments), so the histogram and filter
+functions can take them unchanged.
+'''
+
+from array import array
+from bisect import bisect_left
+
+from paymentCache import FLOAT64
+from idIntern import IdInterner, INDEX, INT64
+
+
+'''
+Group edges by row with a stable counting sort.
+Input: rows, the row index of each edge; numRows, the number of rows.
+Returns: (offsets, order) where order lists the edge indices grouped by
+   row (in their input order within a row) and the edges of row r are
+   order[offsets[r]:offsets[r+1]].
+'''
+def countingSort(rows, numRows):
+   offsets = array(INT64, [0]) * (numRows + 1)
+   for r in rows:
+      offsets[r + 1] += 1
+   for r in xrange(numRows):
+      offsets[r + 1] += offsets[r]
+   pos = offsets[:-1]
+   order = array(INT64, [0]) * len(rows)
+   e = 0
+   for r in rows:
+      order[pos[r]] = e
+      pos[r] += 1
+      e += 1
+   return offsets, order
+
+
+'''
+Deduplicated, sorted neighbour CSR of one side of the graph.
+Input: numRows, the number of rows; rowNeighbours(r), the counterparty
+   row of each payment of row r (with repeats, in any order).
+Returns: (offsets, neighbours) where the distinct counterparty rows of
+   row r are neighbours[offsets[r]:offsets[r+1]], in increasing order.
+'''
+def neighbourCSR(numRows, rowNeighbours):
+   offsets = array(INT64, [0]) * (numRows + 1)
+   neighbours = array(INDEX)
+   for r in xrange(numRows):
+      neighbours.extend(sorted(set(rowNeighbours(r))))
+      offsets[r + 1] = len(neighbours)
+   return offsets, neighbours
+
+
+'''
+A read-only dict-like view: id -> lookup(row) for every id in ids.
+Neighbour views also carry denseRows (row -> dense counterparty ids) and
+valueInterner (to translate those back), see idIntern.denseNeighbourLists,
+and denseValues (row -> dollars paid between the row and each of those
+counterparties, in the same order).  graph is the PaymentGraph viewed.
+'''
+class GraphView:
+   def __init__(self, ids, lookup, rowNeighbours=None, valueInterner=None, rowValues=None, graph=None):
+      self.ids = ids
+      self.lookup = lookup
+      self.rowNeighbours = rowNeighbours
+      self.valueInterner = valueInterner
+      self.rowValues = rowValues
+      self.graph = graph
+
+   def row(self, k):
+      i = bisect_left(self.ids, k)
+      if i == len(self.ids) or self.ids[i] != k:
+         raise KeyError(k)
+      return i
+
+   def __len__(self):
+      return len(self.ids)
+
+   def __iter__(self):
+      return iter(self.ids)
+
+   def __contains__(self, k):
+      i = bisect_left(self.ids, k)
+      return i < len(self.ids) and self.ids[i] == k
+
+   def __getitem__(self, k):
+      return self.lookup(self.row(k))
+
+   def keys(self):
+      return self.ids
+
+   def values(self):
+      return (self.lookup(i) for i in xrange(len(self.ids)))
+
+   def items(self):
+      return ((self.ids[i], self.lookup(i)) for i in xrange(len(self.ids)))
+
+   iteritems = items
+   itervalues = values
+
+   def denseRows(self):
+      return (self.rowNeighbours(i) for i in xrange(len(self.ids)))
+
+   def denseValues(self):
+      return (self.rowValues(i) for i in xrange(len(self.ids)))
+
+
+class PaymentGraph(object):
+   '''
+   Build the graph from three parallel columns (any iterables of equal
+   length): doctor ids, company ids and payment amounts.
+   '''
+   def __init__(self, docs, cos, amounts):
+      docInterner = IdInterner.fromKeys(docs)
+      coInterner = IdInterner.fromKeys(cos)
+      self.build(docInterner, docInterner.intern(docs), coInterner, coInterner.intern(cos), amounts)
+
+   '''
+   Build the graph from payments already interned to dense ids (see
+   idIntern.py): the interners and the dense doctor/company id columns.
+   '''
+   @classmethod
+   def fromDense(cls, docInterner, docRows, coInterner, coRows, amounts):
+      graph = cls.__new__(cls)
+      graph.build(docInterner, docRows, coInterner, coRows, amounts)
+      return graph
+
+   def build(self, docInterner, docRows, coInterner, coRows, amounts):
+      self.docInterner = docInterner
+      self.coInterner = coInterner
+      self.docIds = docInterner.ids
+      self.coIds = coInterner.ids
+      numEdges = len(docRows)
+      if not isinstance(amounts, array):
+         amounts = array(FLOAT64, amounts)
+      assert(len(amounts) == numEdges and len(coRows) == numEdges)
+
+      # Doctor-major CSR (the edge order of every other array).
+      self.docOffsets, docOrder = countingSort(docRows, len(self.docIds))
+      self.edgeDoc = array(INDEX, [docRows[e] for e in docOrder])
+      self.edgeCo = array(INDEX, [coRows[e] for e in docOrder])
+      self.amounts = array(FLOAT64, [amounts[e] for e in docOrder])
+
+      # Company-major CSR, as indices into the doctor-major edges.
+      edgeOf = array(INT64, [0]) * numEdges
+      for p in xrange(numEdges):
+         edgeOf[docOrder[p]] = p
+      self.coOffsets, coOrder = countingSort(coRows, len(self.coIds))
+      self.coEdges = array(INT64, [edgeOf[e] for e in coOrder])
+
+      # Distinct neighbours of each row, built once.
+      edgeDoc, edgeCo, coEdges = self.edgeDoc, self.edgeCo, self.coEdges
+      docOffsets, coOffsets = self.docOffsets, self.coOffsets
+      self.docNeighbourOffsets, self.docNeighbours = neighbourCSR(len(self.docIds),
+         lambda i: edgeCo[docOffsets[i]:docOffsets[i + 1]])
+      self.coNeighbourOffsets, self.coNeighbours = neighbourCSR(len(self.coIds),
+         lambda j: [edgeDoc[e] for e in coEdges[coOffsets[j]:coOffsets[j + 1]]])
+
+   '''
+   Build the graph from a paymentCache.PaymentColumns (using its dense
+   ids when it has them).
+   '''
+   @classmethod
+   def fromColumns(cls, pc):
+      if pc.docInterner is None:
+         return cls(pc.docs, pc.cos, pc.amounts)
+      return cls.fromDense(pc.docInterner, pc.docIndex, pc.coInterner, pc.coIndex, pc.amounts)
+
+   def numDocs(self):
+      return len(self.docIds)
+
+   def numCos(self):
+      return len(self.coIds)
+
+   def numPayments(self):
+      return len(self.amounts)
+
+   # Row accessors (by row index, not id).
+
+   def docRowPayments(self, i):
+      return self.amounts[self.docOffsets[i]:self.docOffsets[i + 1]]
+
+   def coRowPayments(self, j):
+      amounts = self.amounts
+      return [amounts[e] for e in self.coEdges[self.coOffsets[j]:self.coOffsets[j + 1]]]
+
+   def docRowNeighbourRows(self, i):
+      return self.docNeighbours[self.docNeighbourOffsets[i]:self.docNeighbourOffsets[i + 1]]
+
+   def coRowNeighbourRows(self, j):
+      return self.coNeighbours[self.coNeighbourOffsets[j]:self.coNeighbourOffsets[j + 1]]
+
+   '''
+   Total dollars between a row and each of its counterparties, aligned
+   with docRowNeighbourRows/coRowNeighbourRows.
+   '''
+   def docRowNeighbourDollars(self, i):
+      totals = dict()
+      for e in xrange(self.docOffsets[i], self.docOffsets[i + 1]):
+         j = self.edgeCo[e]
+         totals[j] = totals.get(j, 0.) + self.amounts[e]
+      return [totals[j] for j in self.docRowNeighbourRows(i)]
+
+   def coRowNeighbourDollars(self, j):
+      totals = dict()
+      for e in self.coEdges[self.coOffsets[j]:self.coOffsets[j + 1]]:
+         i = self.edgeDoc[e]
+         totals[i] = totals.get(i, 0.) + self.amounts[e]
+      return [totals[i] for i in self.coRowNeighbourRows(j)]
+
+   def docRowNeighbours(self, i):
+      coIds = self.coIds
+      return tuple([coIds[j] for j in self.docRowNeighbourRows(i)])
+
+   def coRowNeighbours(self, j):
+      docIds = self.docIds
+      return tuple([docIds[i] for i in self.coRowNeighbourRows(j)])
+
+   def docRowRanked(self, i):
+      coIds = self.coIds
+      a, b = self.docOffsets[i], self.docOffsets[i + 1]
+      return sorted([(self.amounts[e], coIds[self.edgeCo[e]]) for e in xrange(a, b)], reverse=True)
+
+   def coRowRanked(self, j):
+      docIds = self.docIds
+      return sorted([(self.amounts[e], docIds[self.edgeDoc[e]]) for e in self.coEdges[self.coOffsets[j]:self.coOffsets[j + 1]]], reverse=True)
+
+   # Per-id accessors.
+
+   def docPaymentCount(self, doc):
+      i = self.paymentsByDoc().row(doc)
+      return self.docOffsets[i + 1] - self.docOffsets[i]
+
+   def coPaymentCount(self, co):
+      j = self.paymentsByCo().row(co)
+      return self.coOffsets[j + 1] - self.coOffsets[j]
+
+   def docDegree(self, doc):
+      i = self.cosByDoc().row(doc)
+      return self.docNeighbourOffsets[i + 1] - self.docNeighbourOffsets[i]
+
+   def coDegree(self, co):
+      j = self.docsByCo().row(co)
+      return self.coNeighbourOffsets[j + 1] - self.coNeighbourOffsets[j]
+
+   def docTotal(self, doc):
+      return sum(self.paymentsByDoc()[doc])
+
+   def coTotal(self, co):
+      return sum(self.paymentsByCo()[co])
+
+   # dict-like views, matching the structures of fileToStructures.
+
+   def paymentsByDoc(self):
+      return GraphView(self.docIds, self.docRowPayments, graph=self)
+
+   def paymentsByCo(self):
+      return GraphView(self.coIds, self.coRowPayments, graph=self)
+
+   def cosByDoc(self):
+      return GraphView(self.docIds, self.docRowNeighbours, self.docRowNeighbourRows, self.coInterner, self.docRowNeighbourDollars, self)
+
+   def docsByCo(self):
+      return GraphView(self.coIds, self.coRowNeighbours, self.coRowNeighbourRows, self.docInterner, self.coRowNeighbourDollars, self)
+
+   def paymentsRankedByDoc(self):
+      return GraphView(self.docIds, self.docRowRanked, graph=self)
+
+   def paymentsRankedByCo(self):
+      return GraphView(self.coIds, self.coRowRanked, graph=self)
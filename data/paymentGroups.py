@@ -0,0 +1,275 @@
+'''
+paymentGroups.py
+Bryan Lewandowski
+
+External (bounded memory) group-by of the payment file: sortPayments
+writes it sorted by doctor, or by company, without ever holding more than
+memoryBytes of payments, so the per-doctor and per-company analyses can
+run on a payment file larger than memory.  The payments are parsed in
+runs of at most memoryBytes, each sorted and spilled to a binary run file
+(a temporary directory under spillDir), and the runs are k-way merged,
+MERGE_FAN_IN at a time.  Within an entity the payments keep their order
+in the input file (the line number is the second sort key).
+
+The sorted file is a payment file again (header line, then "doctorId
+companyId amount" tab separated; a .bin name selects fixed-width binary
+records instead, and .gz/.bz2/.xz compression, see edgeWriter.py), with
+every entity's payments contiguous.  groups(sortedName, by) then scans
+it one entity at a time, holding only that entity's payments.
+
+Consumers of the groups (each holds one group, plus at most one number
+per entity):
+   countHistogram(groups)  number of payments -> number of entities
+   entityTotals(groups)    entity -> total payments (like sumPayments)
+   entityDegrees(groups)   entity -> number of distinct counterparties
+and the filters degreeFilter and proportionFilter, which are the one
+round paymentFilters.DegreeFilter and ProportionFilter (+
+DistinctPaymentsFilter) as scans of the doctor and company sorted files,
+writing the kept payments to a new (doctor sorted) payment file.
+'''
+
+import os
+import heapq
+import shutil
+import tempfile
+import itertools
+
+import edgeWriter
+import inputStream
+import paymentCache
+
+RUN_MEMORY_BYTES = 1 << 28 # default memory budget of a sort
+ROW_BYTES = 200 # python memory per buffered payment: a 4-tuple, its fields and its list slot
+MERGE_FAN_IN = 64 # most runs open at once in a merge
+RUN_FORMAT = "qqqd" # run record: entity id, line number, counterparty id, amount
+PAYMENT_FORMAT = "qqd" # binary sorted payment record: doctor id, company id, amount
+PAYMENT_HEADER = "Physician_Profile_ID\tApplicable_Manufacturer_or_Applicable_GPO_Making_Payment_ID\tAmount\n"
+
+
+'''
+Write rows of (doctor id, company id, amount) as a payment file (see
+above), with the header line header (text files only).
+Returns the number of payments written.
+'''
+def writePayments(filename, rows, header=PAYMENT_HEADER):
+   fout = edgeWriter.openOutput(filename)
+   try:
+      if edgeWriter.outputFormat(filename) == "bin":
+         return edgeWriter.BinaryWriter(fout, PAYMENT_FORMAT).writeRows(rows)
+      fout.write(header if len(header) > 0 else PAYMENT_HEADER)
+      return edgeWriter.TabWriter(fout, 3).writeRows(rows)
+   finally:
+      fout.close()
+
+
+'''
+The payments of a payment file (text, in the original format, or binary,
+see writePayments), as (doctor id, company id, amount) triples.  Bad
+lines are skipped.
+'''
+def readPayments(filename):
+   if edgeWriter.outputFormat(filename) == "bin":
+      for row in edgeWriter.readBinaryRows(filename, PAYMENT_FORMAT):
+         yield row
+      return
+   lines = paymentCache.rangeLines(filename, 0, os.stat(filename).st_size)
+   next(lines, None) # header line
+   for line in lines:
+      s = line.split()
+      if(len(s)!=3):
+         continue
+      yield int(s[0]), int(s[1]), float(s[2])
+
+
+'''
+The header line of a text payment file ("" for a binary one).
+'''
+def readHeader(filename):
+   if edgeWriter.outputFormat(filename) == "bin":
+      return ""
+   with inputStream.openInput(filename) as fin:
+      return fin.readline()
+
+
+'''
+Sorted runs of the payments of filename (see sortPayments), written under
+tmpDir.  Returns (the run file names, the header line).
+'''
+def writeRuns(filename, by, memoryBytes, tmpDir):
+   maxRows = max(1, memoryBytes / ROW_BYTES)
+   runs = []
+   header = ""
+   buf = []
+   i = 0
+   for line in paymentCache.rangeLines(filename, 0, os.stat(filename).st_size):
+      i += 1
+      if i == 1:
+         header = line
+         continue # header line
+      s = line.split()
+      if(len(s)!=3):
+         continue
+      if by == "doc":
+         buf.append((int(s[0]), i, int(s[1]), float(s[2])))
+      else:
+         buf.append((int(s[1]), i, int(s[0]), float(s[2])))
+      if len(buf) >= maxRows:
+         buf.sort()
+         runs.append(os.path.join(tmpDir, "run%d.bin" %(len(runs))))
+         edgeWriter.writeRows(runs[-1], buf, numColumns=4, binaryFormat=RUN_FORMAT)
+         buf = []
+   if len(buf) > 0 or len(runs) == 0:
+      buf.sort()
+      runs.append(os.path.join(tmpDir, "run%d.bin" %(len(runs))))
+      edgeWriter.writeRows(runs[-1], buf, numColumns=4, binaryFormat=RUN_FORMAT)
+   return runs, header
+
+
+'''
+k-way merge of sorted run files, in increasing (entity, line) order.
+'''
+def mergeRuns(runs):
+   return heapq.merge(*[edgeWriter.readBinaryRows(r, RUN_FORMAT) for r in runs])
+
+
+'''
+Sort the payment file filename by doctor (by="doc") or by company
+(by="co") into the payment file sortedName (see above), using about
+memoryBytes of memory and temporary run files under spillDir.
+Returns the number of payments written.
+'''
+def sortPayments(filename, sortedName, by="doc", memoryBytes=RUN_MEMORY_BYTES, spillDir=None):
+   if by not in ["doc", "co"]:
+      raise ValueError("payments are grouped by \"doc\" or \"co\", not "+str(by))
+   tmpDir = tempfile.mkdtemp(prefix="paymentGroups", dir=spillDir)
+   try:
+      runs, header = writeRuns(filename, by, memoryBytes, tmpDir)
+      # Merge passes until the runs can all be open at once.
+      mergePassN = 0
+      while len(runs) > MERGE_FAN_IN:
+         mergePassN += 1
+         merged = []
+         for k in xrange(0, len(runs), MERGE_FAN_IN):
+            merged.append(os.path.join(tmpDir, "merge%d_%d.bin" %(mergePassN, len(merged))))
+            edgeWriter.writeRows(merged[-1], mergeRuns(runs[k:k+MERGE_FAN_IN]), numColumns=4, binaryFormat=RUN_FORMAT)
+            for r in runs[k:k+MERGE_FAN_IN]:
+               os.remove(r)
+         runs = merged
+
+      if by == "doc":
+         rows = ((key, other, amount) for key, line, other, amount in mergeRuns(runs))
+      else:
+         rows = ((other, key, amount) for key, line, other, amount in mergeRuns(runs))
+      return writePayments(sortedName, rows, header)
+   finally:
+      shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+'''
+Sort filename both ways: into filename's name less any compression
+suffix, plus ".byDoc.tab" and ".byCo.tab" (or suffix).
+Returns (the doctor sorted file name, the company sorted file name).
+'''
+def sortBothWays(filename, memoryBytes=RUN_MEMORY_BYTES, spillDir=None, suffix=".tab"):
+   base = filename
+   for ext in [".gz", ".bz2", ".xz"]:
+      if base.endswith(ext):
+         base = base[:-len(ext)]
+   docSorted = base + ".byDoc" + suffix
+   coSorted = base + ".byCo" + suffix
+   sortPayments(filename, docSorted, "doc", memoryBytes, spillDir)
+   sortPayments(filename, coSorted, "co", memoryBytes, spillDir)
+   return docSorted, coSorted
+
+
+'''
+The payments of sortedName (sorted by, see sortPayments) one entity at a
+time: yields (entity id, [(counterparty id, amount)...]), the payments in
+input file order.  The file is checked to be sorted as it is read.
+'''
+def groups(sortedName, by="doc"):
+   entity, other = (0, 1) if by == "doc" else (1, 0)
+   last = None
+   for k, rows in itertools.groupby(readPayments(sortedName), lambda row: row[entity]):
+      if last is not None and k <= last:
+         raise ValueError("%s is not sorted by %s (%d after %d)" %(sortedName, by, k, last))
+      last = k
+      yield k, [(row[other], row[2]) for row in rows]
+
+
+'''
+dict number of payments -> number of entities making/receiving that
+many payments (like genPaymentCountHistogram), over groups.
+'''
+def countHistogram(groups):
+   hist = dict()
+   for k, payments in groups:
+      hist[len(payments)] = hist.get(len(payments), 0) + 1
+   return hist
+
+
+'''
+dict entity -> total of its payments (like sumPayments), over groups.
+'''
+def entityTotals(groups):
+   totals = dict()
+   for k, payments in groups:
+      totals[k] = sum([amount for other, amount in payments])
+   return totals
+
+
+'''
+dict entity -> number of distinct counterparties, over groups.
+'''
+def entityDegrees(groups):
+   degrees = dict()
+   for k, payments in groups:
+      degrees[k] = len(set([other for other, amount in payments]))
+   return degrees
+
+
+'''
+Remove doctors paid by fewer than minDocK distinct companies and
+companies paying fewer than minCoK distinct doctors (one round, as
+paymentFilters.DegreeFilter), from the doctor and company sorted files
+docSorted and coSorted, writing the kept payments to outName.
+Returns the number of payments kept.
+'''
+def degreeFilter(docSorted, coSorted, outName, minDocK, minCoK):
+   coDeg = entityDegrees(groups(coSorted, "co"))
+   def kept():
+      for doc, payments in groups(docSorted, "doc"):
+         if len(set([co for co, amount in payments])) < minDocK:
+            continue
+         for co, amount in payments:
+            if coDeg[co] >= minCoK:
+               yield doc, co, amount
+   return writePayments(outName, kept(), readHeader(docSorted))
+
+
+'''
+Keep only the payments which are at least upperCoProportion of the
+paying company's total payments and at least upperDocProportion of the
+receiving doctor's total payments (as paymentFilters.ProportionFilter),
+and with distinct, only the first of identical (doctor, company, amount)
+payments (as DistinctPaymentsFilter), from the doctor and company sorted
+files docSorted and coSorted, writing the kept payments to outName.
+Returns the number of payments kept.
+'''
+def proportionFilter(docSorted, coSorted, outName, upperCoProportion, upperDocProportion, distinct=True):
+   coThresh = entityTotals(groups(coSorted, "co"))
+   for co in coThresh:
+      coThresh[co] *= upperCoProportion
+   def kept():
+      for doc, payments in groups(docSorted, "doc"):
+         docThresh = sum([amount for co, amount in payments]) * upperDocProportion
+         seen = set()
+         for co, amount in payments:
+            if amount < coThresh[co] or amount < docThresh:
+               continue
+            if distinct:
+               if (co, amount) in seen:
+                  continue
+               seen.add((co, amount))
+            yield doc, co, amount
+   return writePayments(outName, kept(), readHeader(docSorted))
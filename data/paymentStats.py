@@ -0,0 +1,178 @@
+'''
+paymentStats.py
+Bryan Lewandowski
+
+The summary statistics of printStats, k3Trim and proportionTrim
+computed together, in one pass over each side of the payment graph,
+instead of a walk over cos/docs per statistic (sumPayments,
+genPaymentCountHistogram, the largest payments, the totals and the
+degree averages of printSecondaries).  On paymentGraph views the pass
+reads the CSR arrays directly (see graphStats); any other dict-likes
+(id -> payment list, id -> counterparties) are walked once each (see
+viewStats).
+
+Totals are summed in the same order as the walks they replace (each
+entity's payments in order, the entities in the order the dicts iterate
+them), so every printed statistic and .tab file is unchanged.
+'''
+
+import math
+
+import histograms
+
+
+'''
+The statistics of a payment graph (or of payment aggregates, see
+fromAggregates):
+   numDocs, numCos      the number of doctors/companies
+   numPayments          the number of payments
+   maxPayin, maxPayout  the largest payment received/made
+   docTotalPayments     total of the payments, summed doctor by doctor
+   coTotalPayments      the same, summed company by company
+   docTotals, coTotals  dicts id -> total payments (as sumPayments)
+   docCountHist, coCountHist  payment count histograms (as
+                        genPaymentCountHistogram)
+   docDegreeHist        number of companies -> number of doctors paid by
+                        exactly that many companies
+   docDegreeSum, coDegreeSum  sums over the doctors/companies of their
+                        number of distinct counterparties
+'''
+class PaymentStats:
+   def __init__(self):
+      self.numDocs = 0
+      self.numCos = 0
+      self.numPayments = 0
+      self.maxPayin = None
+      self.maxPayout = None
+      self.docTotalPayments = 0.
+      self.coTotalPayments = 0.
+      self.docTotals = dict()
+      self.coTotals = dict()
+      self.docCountHist = dict()
+      self.coCountHist = dict()
+      self.docDegreeHist = dict()
+      self.docDegreeSum = 0
+      self.coDegreeSum = 0
+
+   '''
+   Average number of companies paying a doctor.
+   '''
+   def meanDocDegree(self):
+      return self.docDegreeSum / float(self.numDocs)
+
+   '''
+   Average number of doctors a company pays.
+   '''
+   def meanCoDegree(self):
+      return self.coDegreeSum / float(self.numCos)
+
+   '''
+   The statistics of paymentAggregates.PaymentAggregates agg (kept with
+   its neighbours; totals are agg's exact sums, and docTotalPayments/
+   coTotalPayments the sums of the doctor/company totals, to check
+   against agg's raw total).
+   '''
+   @classmethod
+   def fromAggregates(cls, agg):
+      stats = cls()
+      stats.numDocs = len(agg.docs)
+      stats.numCos = len(agg.cos)
+      stats.numPayments = agg.numPayments()
+      stats.maxPayin = max(agg.docs.maxes.itervalues())
+      stats.maxPayout = max(agg.cos.maxes.itervalues())
+      stats.docTotals = agg.docs.totals()
+      stats.coTotals = agg.cos.totals()
+      stats.docTotalPayments = math.fsum(stats.docTotals.itervalues())
+      stats.coTotalPayments = math.fsum(stats.coTotals.itervalues())
+      stats.docCountHist = histograms.countHistogram(agg.docs.counts.values())
+      stats.coCountHist = histograms.countHistogram(agg.cos.counts.values())
+      docDegrees = agg.docs.degrees().values()
+      stats.docDegreeHist = histograms.countHistogram(docDegrees)
+      stats.docDegreeSum = sum(docDegrees)
+      stats.coDegreeSum = sum(agg.cos.degrees().itervalues())
+      return stats
+
+
+'''
+One side of the graph: rows yields (id, payments, number of distinct
+counterparties) per entity.  Returns (total, largest payment, dict id ->
+total, counts, degrees).
+'''
+def sideStats(rows):
+   total = 0.
+   largest = None
+   totals = dict()
+   counts = []
+   degrees = []
+   for k, payments, degree in rows:
+      totals[k] = sum(payments)
+      total = sum(payments, total) # (in order, like one running total)
+      if len(payments) > 0:
+         m = max(payments)
+         if largest is None or m > largest:
+            largest = m
+      counts.append(len(payments))
+      degrees.append(degree)
+   return total, largest, totals, counts, degrees
+
+
+'''
+Fill stats from the sideStats of the doctors and of the companies.
+'''
+def setSides(stats, docSide, coSide):
+   stats.docTotalPayments, stats.maxPayin, stats.docTotals, docCounts, docDegrees = docSide
+   stats.coTotalPayments, stats.maxPayout, stats.coTotals, coCounts, coDegrees = coSide
+   stats.numDocs = len(docCounts)
+   stats.numCos = len(coCounts)
+   stats.numPayments = sum(coCounts)
+   stats.docCountHist = histograms.countHistogram(docCounts)
+   stats.coCountHist = histograms.countHistogram(coCounts)
+   stats.docDegreeHist = histograms.countHistogram(docDegrees)
+   stats.docDegreeSum = sum(docDegrees)
+   stats.coDegreeSum = sum(coDegrees)
+   return stats
+
+
+'''
+sideStats of one CSR side of a graph: row i (raw id ids[i]) has the
+payments values[offsets[i]:offsets[i+1]], and
+neighbourOffsets[i+1] - neighbourOffsets[i] distinct counterparties.
+The running total over all the rows in order is then just the sum of
+values.
+'''
+def csrSideStats(ids, offsets, values, neighbourOffsets):
+   totals = dict()
+   degrees = [neighbourOffsets[i + 1] - neighbourOffsets[i] for i in xrange(len(ids))]
+   for i in xrange(len(ids)):
+      a, b = offsets[i], offsets[i + 1]
+      totals[ids[i]] = sum(values[a:b])
+   counts = [offsets[i + 1] - offsets[i] for i in xrange(len(ids))]
+   largest = max(values) if len(values) > 0 else None
+   return sum(values), largest, totals, counts, degrees
+
+
+'''
+The PaymentStats of a paymentGraph.PaymentGraph, in one pass over each
+of its CSRs (the company side gathered into company-major order first).
+'''
+def graphStats(graph):
+   amounts = graph.amounts
+   docSide = csrSideStats(graph.docIds, graph.docOffsets, amounts, graph.docNeighbourOffsets)
+   coAmounts = map(amounts.__getitem__, graph.coEdges)
+   coSide = csrSideStats(graph.coIds, graph.coOffsets, coAmounts, graph.coNeighbourOffsets)
+   return setSides(PaymentStats(), docSide, coSide)
+
+
+'''
+The PaymentStats of cos, docs (id -> list of payments), cosToDocs and
+docsToCos (id -> counterparties), as fileToStructures returns them.
+paymentGraph views of one graph are read through graphStats; otherwise
+each dict is walked once, in its own order.
+'''
+def viewStats(cos, docs, cosToDocs, docsToCos):
+   graph = getattr(docs, "graph", None)
+   if graph is not None and all([getattr(d, "graph", None) is graph for d in [cos, cosToDocs, docsToCos]]):
+      return graphStats(graph)
+   docRows = ((k, payments, len(docsToCos[k])) for k, payments in docs.iteritems())
+   coRows = ((k, payments, len(cosToDocs[k])) for k, payments in cos.iteritems())
+   return setSides(PaymentStats(), sideStats(docRows), sideStats(coRows))
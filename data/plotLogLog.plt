@@ -7,6 +7,8 @@ set terminal png size 1000,800
 #print "Got passed filename as ", filenameIn
 
 set output filenameIn.'.png'
+# The data may be read from a copy of filenameIn (see plotManager.py).
+if (!exists("dataIn")) dataIn = filenameIn
 
 #print "Got passed title as ", titleIn
 
@@ -23,5 +25,5 @@ set ylabel yIn
 set tics scale 2
 #set yrange [10**-6:1]
 
-plot filenameIn using 1:2 title xIn with points pt 7 lc 2
+plot dataIn using 1:2 title xIn with points pt 7 lc 2
 
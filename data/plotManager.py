@@ -0,0 +1,192 @@
+'''
+plotManager.py
+Bryan Lewandowski
+
+Background gnuplot rendering for plotCCDF/plotLogLog.  A plot is queued
+and rendered by a small pool of worker threads (one gnuplot process per
+plot), so the statistics carry on while the .png files are drawn; the
+pending plots are waited for at exit (or by wait()).
+
+A plot is skipped when its .png was drawn from the same input: the sha1
+of the .tab content, the .plt script and the plot's variables is kept
+beside the .png in <tab>.png.sha1.  The .tab content is copied when the
+plot is queued, so the .tab file may be rewritten (eg: by the next step
+of a threshold sweep) before the plot is drawn, and a plot queued again
+for the same .png before it was drawn replaces the earlier one.
+
+The .plt scripts read the data from dataIn (the copy), and name the .png
+after filenameIn.
+'''
+
+import os
+import sys
+import atexit
+import hashlib
+import shutil
+import tempfile
+import threading
+import subprocess
+import Queue
+
+PLOT_WORKERS = 2 # gnuplot processes run at once
+HASH_SUFFIX = ".png.sha1"
+
+
+'''
+A gnuplot string literal of s.
+'''
+def gnuplotString(s):
+   return "'" + str(s).replace("'", "''") + "'"
+
+
+'''
+Queues plots and renders them in numWorkers background threads (the
+plots of one .tab file always by the same thread, one after another).
+gnuplot, the gnuplot command.
+'''
+class PlotManager:
+   def __init__(self, numWorkers=PLOT_WORKERS, gnuplot="gnuplot"):
+      self.gnuplot = gnuplot
+      self.pending = dict() # .tab filename -> job not yet started
+      self.lock = threading.Lock()
+      self.tmpDir = tempfile.mkdtemp(prefix="plots")
+      self.missing = False # gnuplot could not be run
+      self.missingScripts = set() # .plt scripts which could not be read
+      self.queues = [Queue.Queue() for i in xrange(max(1, numWorkers))]
+      self.workers = []
+      for queue in self.queues:
+         t = threading.Thread(target=self.work, args=(queue,))
+         t.daemon = True
+         t.start()
+         self.workers.append(t)
+
+   '''
+   Queue a plot of filename (a .tab file) with the gnuplot script, the
+   variables vars (name -> string) set for it.  Returns False if the
+   .png is already up to date or script can not be read (the plot is
+   skipped, and reported at close), else True.
+   '''
+   def plot(self, script, filename, **vars):
+      try:
+         scriptText = open(script, "rb").read()
+      except IOError:
+         self.missingScripts.add(script)
+         return False
+      data = open(filename, "rb").read()
+      h = hashlib.sha1(data)
+      h.update(scriptText)
+      for name in sorted(vars):
+         h.update("\0%s=%s" %(name, vars[name]))
+      digest = h.hexdigest()
+      fd, copy = tempfile.mkstemp(dir=self.tmpDir, suffix=".tab")
+      os.write(fd, data)
+      os.close(fd)
+      job = (script, filename, vars, copy, digest)
+      with self.lock:
+         previous = self.pending.get(filename)
+         # (a pending plot of other content will overwrite the .png)
+         if previous is None and self.upToDate(filename, digest):
+            os.remove(copy)
+            return False
+         self.pending[filename] = job
+      if previous is not None:
+         os.remove(previous[3]) # (replaced before it was drawn)
+      else:
+         self.queues[hash(filename) % len(self.queues)].put(filename)
+      return True
+
+   '''
+   Whether the .png of filename was drawn from the input of digest.
+   '''
+   def upToDate(self, filename, digest):
+      hashFile = filename + HASH_SUFFIX
+      if not os.path.exists(filename + ".png") or not os.path.exists(hashFile):
+         return False
+      return open(hashFile).read().strip() == digest
+
+   '''
+   Worker thread: draw the latest pending job of each filename queued on
+   queue, until a None is queued.
+   '''
+   def work(self, queue):
+      while True:
+         filename = queue.get()
+         if filename is None:
+            queue.task_done()
+            return
+         try:
+            with self.lock:
+               job = self.pending.pop(filename, None)
+            if job is not None:
+               self.render(*job)
+         finally:
+            queue.task_done()
+
+   def render(self, script, filename, vars, copy, digest):
+      assigns = ["filenameIn=" + gnuplotString(filename), "dataIn=" + gnuplotString(copy)]
+      assigns += [name + "=" + gnuplotString(vars[name]) for name in sorted(vars)]
+      try:
+         status = 1
+         if not self.missing:
+            try:
+               status = subprocess.call([self.gnuplot, "-e", "; ".join(assigns), script])
+            except OSError:
+               self.missing = True
+         if status == 0 and os.path.exists(filename + ".png"):
+            fout = open(filename + HASH_SUFFIX, "w")
+            fout.write(digest+"\n")
+            fout.close()
+      finally:
+         os.remove(copy)
+
+   '''
+   Wait for every queued plot to be drawn.
+   '''
+   def wait(self):
+      for queue in self.queues:
+         queue.join()
+
+   '''
+   Wait for the queued plots, then stop the worker threads.
+   '''
+   def close(self):
+      for queue in self.queues:
+         queue.put(None)
+      for t in self.workers:
+         t.join()
+      shutil.rmtree(self.tmpDir, True)
+      sys.stdout.flush()
+      if self.missing:
+         sys.stderr.write("%s could not be run, plots skipped\n" %(self.gnuplot))
+      for script in sorted(self.missingScripts):
+         sys.stderr.write("%s could not be read, its plots skipped\n" %(script))
+
+
+manager = None
+
+
+'''
+The shared PlotManager of this process (started on first use, and
+waited for at exit).
+'''
+def getManager():
+   global manager
+   if manager is None:
+      manager = PlotManager()
+      atexit.register(manager.close)
+   return manager
+
+
+'''
+Queue a plot with the shared PlotManager (see PlotManager.plot).
+'''
+def plot(script, filename, **vars):
+   return getManager().plot(script, filename, **vars)
+
+
+'''
+Wait for the plots queued with the shared PlotManager.
+'''
+def wait():
+   if manager is not None:
+      manager.wait()
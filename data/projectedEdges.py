@@ -0,0 +1,98 @@
+'''
+projectedEdges.py
+Bryan Lewandowski
+
+Streaming access to the doc-doc/co-co projections.  Rather than waiting
+for writeDocDoc/writeCoCo to write the whole _.tab file, iterate the
+projected edges as they are computed, a block (list) at a time:
+
+   for block in projectedEdges.edgeBlocks(cosToDocs, withShared=True):
+      for doc1, doc2, sharedCompanies in block:
+         ...
+
+The projection is planned and run as by writeDocDoc (see
+projectionPlanner.py): in memory, partitioned or in a process pool, hub
+capped if asked.  Nothing but the current block of edges is held, and no
+intermediate text file is written.
+
+Consumers of edge blocks:
+   degrees(blocks)     node -> degree in the projected graph
+   components(blocks)  node -> connected component
+and edgeWriter.writeRows(filename, edges(...)) writes a SNAP edge list.
+'''
+
+import itertools
+
+import projection
+import projectionPlanner
+
+
+'''
+Blocks of the projected edges of d, a dict-like of group id ->
+collection of member ids (eg: cosToDocs gives the doc-doc projection).
+Each edge is (u, v) raw member ids, u < v, followed by the shared weight
+if withShared and the shared dollars if withDollars (d must then be a
+paymentGraph view).
+ordered, the edges come in (u, v) order; otherwise a partitioned
+projection streams each partition in turn, in no overall order.
+memoryBytes, maxPairs, hubPolicy and numWorkers are as for
+projectionPlanner.makePlan, spillDir where any spill files go.
+'''
+def edgeBlocks(d, withShared=False, withDollars=False, ordered=True, memoryBytes=None, maxPairs=None, hubPolicy=None, numWorkers=1, spillDir=None):
+   inc = projection.Incidence.fromNeighbourLists(d, withDollars)
+   plan = projectionPlanner.makePlan(inc, "", withShared, withDollars, memoryBytes, maxPairs, hubPolicy, numWorkers)
+   pairBlocks = projectionPlanner.pairBlocks(plan, withDollars, spillDir, ordered)
+   return projection.rawEdgeBlocks(plan.incidence, pairBlocks, withShared, withDollars)
+
+
+'''
+The projected edges of d one at a time (see edgeBlocks).
+'''
+def edges(d, **options):
+   return itertools.chain.from_iterable(edgeBlocks(d, **options))
+
+
+'''
+dict node -> number of projected edges at the node, over edge blocks.
+'''
+def degrees(blocks):
+   deg = dict()
+   for block in blocks:
+      for edge in block:
+         for node in edge[:2]:
+            deg[node] = deg.get(node, 0) + 1
+   return deg
+
+
+'''
+Connected components of the projected graph, over edge blocks (a
+union-find, so only one entry per node is kept).
+Returns dict node -> component label (the smallest node id in it).
+'''
+def components(blocks):
+   parent = dict()
+
+   def find(x):
+      root = x
+      while parent[root] != root:
+         root = parent[root]
+      while parent[x] != root:
+         parent[x], x = root, parent[x]
+      return root
+
+   for block in blocks:
+      for edge in block:
+         u, v = edge[0], edge[1]
+         if u not in parent:
+            parent[u] = u
+         if v not in parent:
+            parent[v] = v
+         ru, rv = find(u), find(v)
+         if ru != rv:
+            # Smaller id as the root, so it labels the component.
+            if ru < rv:
+               parent[rv] = ru
+            else:
+               parent[ru] = rv
+
+   return dict((node, find(node)) for node in parent)
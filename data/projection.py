@@ -0,0 +1,395 @@
+'''
+projection.py
+Bryan Lewandowski
+
+One-mode projections of the bipartite payment graph: the doc-doc network
+(two doctors are linked if some company paid both) and the co-co network
+(two companies are linked if they paid the same doctor).
+
+With B the sparse member x group incidence matrix (eg: doctor x company
+for doc-doc), the projection is B.B^T.  It is computed one row at a time
+(Gustavson's row-by-row sparse product): for member i, every member k > i
+of every group of i is counted in a dense accumulator, so each pair comes
+out exactly once, already deduplicated, in (i, k) order.  Only B, B^T and
+one accumulator are in memory; the pairs go straight to the writer in
+blocks of BLOCK_ROWS rows, never into one big set.
+
+With a memory budget (writeProjection's memoryBytes), the pairs are
+instead generated group by group (every pair of members of a group) and
+spilled, partitioned by their lower member id, into numPartitions
+temporary files; each partition is then deduplicated and its weights
+summed on its own.  Partitions are by hash (lower id % numPartitions)
+or, when the output must be in order, by ranges of lower ids.
+numPartitions is chosen so a partition's deduplication fits in the
+budget, and the spill buffers never hold more than the budget either.
+
+Every pair carries its weights:
+   shared    the number of groups the two members have in common (the
+             entry of B.B^T), or the sum of those groups' weights when
+             the groups are weighted (see projectionPlanner.py)
+   dollars   (optional) dollars in common: over the shared groups, the
+             sum of the smaller of the two members' totals with the group
+'''
+
+import os
+import math
+import shutil
+import tempfile
+import itertools
+from array import array
+from bisect import bisect_right
+
+import idIntern
+import edgeWriter
+from paymentGraph import countingSort
+from paymentCache import FLOAT64, INT64
+from idIntern import PAIR_SHIFT, PAIR_MASK
+
+BLOCK_ROWS = 4096 # rows of B.B^T per emitted block
+# Rough python memory per spilled pair while its partition is
+# deduplicated (its int64 key, float64 dollars, and a dict entry).
+DEDUP_BYTES_PER_PAIR = 128
+
+
+'''
+Sparse incidence matrix of one side of the graph (the members, eg:
+doctors) against the other (the groups, eg: companies), both ways:
+   interner      member raw ids (dense member id -> raw id)
+   groupOffsets  members of group g are groupMembers[groupOffsets[g]:groupOffsets[g+1]]
+   groupMembers  dense member ids, sorted within each group
+   groupValues   dollars between each group and member (aligned with
+                 groupMembers), or None
+   memberOffsets groups of member i are memberGroups[memberOffsets[i]:memberOffsets[i+1]]
+   memberGroups  group indices
+   groupWeights  what each group adds to the shared weight of its pairs,
+                 or None (1 each, shared counts the groups)
+'''
+class Incidence:
+   def __init__(self, interner, groupOffsets, groupMembers, groupValues=None, groupWeights=None):
+      self.interner = interner
+      self.groupOffsets = groupOffsets
+      self.groupMembers = groupMembers
+      self.groupValues = groupValues
+      self.groupWeights = groupWeights
+      numGroups = len(groupOffsets) - 1
+      groupOf = array('l', [0]) * len(groupMembers)
+      for g in xrange(numGroups):
+         for p in xrange(groupOffsets[g], groupOffsets[g + 1]):
+            groupOf[p] = g
+      self.memberOffsets, order = countingSort(groupMembers, len(interner))
+      self.memberGroups = array('l', [groupOf[p] for p in order])
+
+   '''
+   Build from a dict-like d of group id -> collection of member ids (eg:
+   cosToDocs for the doc-doc projection).  withDollars takes the dollars
+   from d's denseValues (a paymentGraph neighbour view).
+   '''
+   @classmethod
+   def fromNeighbourLists(cls, d, withDollars=False):
+      if withDollars and getattr(d, "rowValues", None) is None:
+         raise ValueError("shared dollars need a paymentGraph neighbour view")
+      interner, rows = idIntern.denseNeighbourLists(d)
+      values = d.denseValues() if withDollars else None
+      groupOffsets = array('l', [0])
+      groupMembers = array('l')
+      groupValues = array(FLOAT64) if withDollars else None
+      for row in rows:
+         if values is None:
+            groupMembers.extend(sorted(row))
+         else:
+            # Views list members sorted already (as int32 arrays),
+            # dollars aligned.
+            groupMembers.extend(list(row))
+            groupValues.extend(values.next())
+         groupOffsets.append(len(groupMembers))
+      return cls(interner, groupOffsets, groupMembers, groupValues)
+
+   def numMembers(self):
+      return len(self.interner)
+
+   def numGroups(self):
+      return len(self.groupOffsets) - 1
+
+   def groupSize(self, g):
+      return self.groupOffsets[g + 1] - self.groupOffsets[g]
+
+
+'''
+Compute the projection of inc, BLOCK_ROWS member rows at a time.
+Yields blocks (lists) of (i, k, shared) rows, or (i, k, shared, dollars)
+when withDollars, with i < k dense member ids; within and across blocks
+the pairs are in increasing (i, k) order.
+'''
+def projectBlocks(inc, withDollars=False, blockRows=BLOCK_ROWS):
+   if withDollars and inc.groupValues is None:
+      raise ValueError("shared dollars need an Incidence built with dollars")
+   n = inc.numMembers()
+   groupOffsets = inc.groupOffsets
+   groupMembers = inc.groupMembers
+   groupValues = inc.groupValues
+   memberOffsets = inc.memberOffsets
+   memberGroups = inc.memberGroups
+   groupWeights = inc.groupWeights
+   shared = array('l' if groupWeights is None else FLOAT64, [0]) * n
+   dollars = array(FLOAT64, [0.]) * n
+
+   for lo in xrange(0, n, blockRows):
+      block = []
+      for i in xrange(lo, min(n, lo + blockRows)):
+         touched = []
+         for p in xrange(memberOffsets[i], memberOffsets[i + 1]):
+            g = memberGroups[p]
+            w = 1 if groupWeights is None else groupWeights[g]
+            end = groupOffsets[g + 1]
+            # Members after i in the (sorted) group; i itself is at start-1.
+            start = bisect_right(groupMembers, i, groupOffsets[g], end)
+            if withDollars:
+               mine = groupValues[start - 1]
+            for q in xrange(start, end):
+               k = groupMembers[q]
+               if shared[k] == 0:
+                  touched.append(k)
+               shared[k] += w
+               if withDollars:
+                  dollars[k] += min(mine, groupValues[q])
+         touched.sort()
+         if withDollars:
+            for k in touched:
+               block.append((i, k, shared[k], dollars[k]))
+               shared[k] = 0
+               dollars[k] = 0.
+         else:
+            for k in touched:
+               block.append((i, k, shared[k]))
+               shared[k] = 0
+      if len(block) > 0:
+         yield block
+
+
+'''
+Number of member pairs generated group by group, duplicates included
+(the sum over the groups of C(size, 2)), an upper bound on the number of
+distinct pairs.
+'''
+def rawPairCount(inc):
+   total = 0
+   for g in xrange(inc.numGroups()):
+      n = inc.groupSize(g)
+      total += n * (n - 1) / 2
+   return total
+
+
+'''
+Number of spill partitions which keeps the deduplication of each one
+within memoryBytes.
+'''
+def numPartitionsFor(inc, memoryBytes):
+   return max(1, int(math.ceil(rawPairCount(inc) * DEDUP_BYTES_PER_PAIR / float(memoryBytes))))
+
+
+'''
+Spill the member pairs of every group of inc, as packed dense pair keys
+(see idIntern.packPair) in partition partitionOf[lower id] (default
+lower id % numPartitions), to the
+files spillPrefix+"<partition>.keys", with, aligned, ".dollars" (the
+smaller of the two members' dollars with the group) when withDollars and
+".weights" (the group's weight) when inc's groups are weighted.  At most
+bufferPairs pairs are buffered before they are flushed.
+Returns the list of (keys, dollars, weights) file names (None for a
+column not spilled) per partition.
+'''
+def spillPairs(inc, spillPrefix, numPartitions, withDollars=False, bufferPairs=1 << 20, partitionOf=None):
+   weighted = inc.groupWeights is not None
+   files = []
+   for p in xrange(numPartitions):
+      keysName = spillPrefix + str(p) + ".keys"
+      dollarsName = spillPrefix + str(p) + ".dollars" if withDollars else None
+      weightsName = spillPrefix + str(p) + ".weights" if weighted else None
+      files.append((keysName, dollarsName, weightsName))
+      for name in files[-1]:
+         if name is not None:
+            open(name, "wb").close()
+   keys = [array(INT64) for p in xrange(numPartitions)]
+   dollars = [array(FLOAT64) for p in xrange(numPartitions)]
+   weights = [array(FLOAT64) for p in xrange(numPartitions)]
+
+   # Files are opened per flush (appending), so any number of partitions
+   # can be used without running out of file handles.
+   def flush():
+      for p in xrange(numPartitions):
+         if len(keys[p]) == 0:
+            continue
+         for name, buf in zip(files[p], [keys[p], dollars[p], weights[p]]):
+            if name is not None:
+               with open(name, "ab") as fout:
+                  buf.tofile(fout)
+               del buf[:]
+
+   groupOffsets = inc.groupOffsets
+   groupMembers = inc.groupMembers
+   groupValues = inc.groupValues
+   buffered = 0
+   for g in xrange(inc.numGroups()):
+      a, b = groupOffsets[g], groupOffsets[g + 1]
+      for x in xrange(a, b):
+         lo = groupMembers[x]
+         p = lo % numPartitions if partitionOf is None else partitionOf[lo]
+         partKeys = keys[p]
+         for y in xrange(x + 1, b):
+            partKeys.append((lo << PAIR_SHIFT) | groupMembers[y])
+         if withDollars:
+            mine = groupValues[x]
+            dollars[p].extend([min(mine, groupValues[y]) for y in xrange(x + 1, b)])
+         if weighted:
+            weights[p].extend([inc.groupWeights[g]] * (b - x - 1))
+         buffered += b - x - 1
+         if buffered >= bufferPairs:
+            flush()
+            buffered = 0
+   flush()
+   return files
+
+
+def readSpill(filename, typecode):
+   column = array(typecode)
+   with open(filename, "rb") as fin:
+      column.fromfile(fin, os.path.getsize(filename) / column.itemsize)
+   return column
+
+
+'''
+Deduplicate one spilled partition (files as returned by spillPairs).
+Yields (i, k, shared) rows, or (i, k, shared, dollars), in increasing
+(i, k) order.
+'''
+def dedupPartition(keysName, dollarsName=None, weightsName=None):
+   keys = readSpill(keysName, INT64)
+   shared = dict()
+   if weightsName is None:
+      for key in keys:
+         shared[key] = shared.get(key, 0) + 1
+   else:
+      weights = readSpill(weightsName, FLOAT64)
+      for e in xrange(len(keys)):
+         key = keys[e]
+         shared[key] = shared.get(key, 0.) + weights[e]
+      weights = None
+   dollars = None
+   if dollarsName is not None:
+      dollarsIn = readSpill(dollarsName, FLOAT64)
+      dollars = dict()
+      for e in xrange(len(keys)):
+         key = keys[e]
+         dollars[key] = dollars.get(key, 0.) + dollarsIn[e]
+      dollarsIn = None
+   keys = None
+   for key in sorted(shared):
+      if dollars is None:
+         yield key >> PAIR_SHIFT, key & PAIR_MASK, shared[key]
+      else:
+         yield key >> PAIR_SHIFT, key & PAIR_MASK, shared[key], dollars[key]
+
+
+'''
+Range partitions for an ordered spill: partitionOf[i] for every member
+i, contiguous member ranges of about equal raw pair cost (a pair is
+counted against its lower member), so the partitions in order hold the
+pairs in order.
+'''
+def rangePartitions(inc, numPartitions):
+   n = inc.numMembers()
+   cost = array('l', [0]) * n
+   groupOffsets = inc.groupOffsets
+   groupMembers = inc.groupMembers
+   for g in xrange(inc.numGroups()):
+      a, b = groupOffsets[g], groupOffsets[g + 1]
+      for x in xrange(a, b):
+         cost[groupMembers[x]] += b - x - 1
+   target = sum(cost) / float(numPartitions)
+   partitionOf = array('i', [0]) * n
+   p = 0
+   acc = 0
+   for i in xrange(n):
+      partitionOf[i] = p
+      acc += cost[i]
+      if acc >= (p + 1) * target and p < numPartitions - 1:
+         p += 1
+   return partitionOf
+
+
+'''
+The projection of inc computed out of core (see above), within about
+memoryBytes of memory, with the spill files in a temporary directory
+under spillDir (removed afterwards).  Yields blocks of rows like
+projectBlocks, one partition at a time: in (i, k) order if ordered, else
+sorted within each (hash) partition only.
+'''
+def partitionedBlocks(inc, memoryBytes, withDollars=False, spillDir=None, numPartitions=None, ordered=True):
+   if withDollars and inc.groupValues is None:
+      raise ValueError("shared dollars need an Incidence built with dollars")
+   if numPartitions is None:
+      numPartitions = numPartitionsFor(inc, memoryBytes)
+   pairBytes = 8 * (1 + int(withDollars) + int(inc.groupWeights is not None))
+   bufferPairs = max(1, memoryBytes / pairBytes)
+   tmpDir = tempfile.mkdtemp(prefix="projection", dir=spillDir)
+   try:
+      partitionOf = rangePartitions(inc, numPartitions) if ordered else None
+      files = spillPairs(inc, os.path.join(tmpDir, "part"), numPartitions, withDollars, bufferPairs, partitionOf)
+      for names in files:
+         rows = dedupPartition(*names)
+         for block in edgeWriter.blocks(rows, BLOCK_ROWS):
+            yield block
+         for name in names:
+            if name is not None:
+               os.remove(name)
+   finally:
+      shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+'''
+Translate blocks of dense pair rows (as from projectBlocks) of inc to
+blocks of (rawId, rawId) edges, followed by the shared weight if
+withShared and the shared dollars if withDollars.
+'''
+def rawEdgeBlocks(inc, pairBlocks, withShared=False, withDollars=False):
+   ids = inc.interner.ids
+   for block in pairBlocks:
+      if withShared and withDollars:
+         yield [(ids[row[0]], ids[row[1]], row[2], row[3]) for row in block]
+      elif withShared:
+         yield [(ids[row[0]], ids[row[1]], row[2]) for row in block]
+      elif withDollars:
+         yield [(ids[row[0]], ids[row[1]], row[3]) for row in block]
+      else:
+         yield [(ids[row[0]], ids[row[1]]) for row in block]
+
+
+'''
+Write the projection of inc to filename (any edgeWriter format), one
+"rawId rawId" line per pair, followed by the shared count if withShared
+and the shared dollars if withDollars.  comment, the title line.
+memoryBytes, if given, computes the projection out of core within about
+that much memory (spilling under spillDir, default the system temporary
+directory).
+pairBlocks, the blocks of pairs if already being computed some other way
+(eg: parallelProjection.parallelBlocks).
+Returns the number of pairs written.
+'''
+def writeProjection(filename, inc, comment="", withShared=False, withDollars=False, memoryBytes=None, spillDir=None, pairBlocks=None):
+   numColumns = 2
+   binaryFormat = "qq"
+   if withShared:
+      numColumns += 1
+      binaryFormat += "q" if inc.groupWeights is None else "d"
+   if withDollars:
+      numColumns += 1
+      binaryFormat += "d"
+
+   if pairBlocks is None:
+      if memoryBytes is None:
+         pairBlocks = projectBlocks(inc, withDollars)
+      else:
+         pairBlocks = partitionedBlocks(inc, memoryBytes, withDollars, spillDir)
+
+   rows = itertools.chain.from_iterable(rawEdgeBlocks(inc, pairBlocks, withShared, withDollars))
+   return edgeWriter.writeRows(filename, rows, comment, numColumns, binaryFormat)
@@ -0,0 +1,286 @@
+'''
+projectionPlanner.py
+Bryan Lewandowski
+
+Plan a doc-doc/co-co projection (see projection.py) before running it:
+from the group sizes (eg: how many doctors each company pays) and a
+small sample of the projection, estimate
+   rawPairs       sum over the groups of C(size, 2): the pairs generated,
+                  duplicates included (an upper bound on the output)
+   distinctPairs  the pairs in the output, from the exact projection of
+                  SAMPLE_ROWS member rows
+   outputBytes    the size of the output file (before any compression)
+and choose how to run it:
+   memory         projection.projectBlocks, when its accumulators and
+                  pair blocks fit the memory budget
+   partitioned    projection.partitionedBlocks, spilled within the budget
+   hub-capped     when rawPairs is over maxPairs: first apply a hub policy
+                  to the super-hub groups (size above maxDegree), then
+                  run the capped projection in memory or partitioned
+   parallel       with numWorkers > 1 and at least PARALLEL_MIN_PAIRS raw
+                  pairs: parallelProjection.parallelBlocks (its workers
+                  keep to the memory budget between them)
+
+Hub policies, apply(inc, maxDegree) returns a new projection.Incidence:
+   SkipHubs        drop the groups larger than maxDegree
+   SampleHubs      keep maxDegree random members of each such group
+   DownWeightHubs  keep the groups, but each adds only maxDegree/size to
+                   the shared weight of its pairs (this changes weights,
+                   not the amount of work: it needs an explicit maxDegree)
+'''
+
+import random
+from array import array
+
+import edgeWriter
+import projection
+import parallelProjection
+from paymentCache import FLOAT64
+
+SAMPLE_ROWS = 1000 # member rows projected exactly to estimate the output
+SAMPLE_SEED = 240
+ACCUMULATOR_BYTES = 16 # per member: projectBlocks' shared and dollars
+PAIR_ROW_BYTES = 160 # python memory per pair row held in a block
+DOLLARS_CHARS = 13 # estimated text width of a dollars column
+PARALLEL_MIN_PAIRS = 1 << 20 # below this a process pool costs more than it saves
+
+
+'''
+An Incidence with the groups of inc rebuilt: keep(g, a, b) returns the
+positions (in groupMembers) to keep of group g, whose members are
+positions a:b; weight(g, size) the group's weight (None: unweighted).
+'''
+def rebuildGroups(inc, keep, weight=None):
+   groupOffsets = array('l', [0])
+   groupMembers = array('l')
+   groupValues = array(FLOAT64) if inc.groupValues is not None else None
+   groupWeights = array(FLOAT64) if weight is not None else None
+   for g in xrange(inc.numGroups()):
+      a, b = inc.groupOffsets[g], inc.groupOffsets[g + 1]
+      positions = keep(g, a, b)
+      if positions is None:
+         continue
+      groupMembers.extend([inc.groupMembers[p] for p in positions])
+      if groupValues is not None:
+         groupValues.extend([inc.groupValues[p] for p in positions])
+      if groupWeights is not None:
+         groupWeights.append(weight(g, b - a))
+      groupOffsets.append(len(groupMembers))
+   return projection.Incidence(inc.interner, groupOffsets, groupMembers, groupValues, groupWeights)
+
+
+'''
+Number of pairs generated once the groups larger than maxDegree have
+size capSize(size) instead, sizes a sorted list of group sizes.
+'''
+def cappedPairs(sizes, maxDegree, capSize):
+   total = 0
+   for n in sizes:
+      if n > maxDegree:
+         n = capSize(n, maxDegree)
+      total += n * (n - 1) / 2
+   return total
+
+
+class SkipHubs:
+   def __init__(self, maxDegree=None):
+      self.maxDegree = maxDegree
+
+   def name(self):
+      return "skip"
+
+   def capSize(self, n, maxDegree):
+      return 0
+
+   def apply(self, inc, maxDegree):
+      return rebuildGroups(inc, lambda g, a, b: xrange(a, b) if b - a <= maxDegree else None)
+
+
+class SampleHubs:
+   def __init__(self, maxDegree=None, seed=SAMPLE_SEED):
+      self.maxDegree = maxDegree
+      self.seed = seed
+
+   def name(self):
+      return "sample"
+
+   def capSize(self, n, maxDegree):
+      return maxDegree
+
+   def apply(self, inc, maxDegree):
+      rng = random.Random(self.seed)
+      def keep(g, a, b):
+         if b - a <= maxDegree:
+            return xrange(a, b)
+         return sorted(rng.sample(xrange(a, b), maxDegree)) # members stay sorted
+      return rebuildGroups(inc, keep)
+
+
+class DownWeightHubs:
+   def __init__(self, maxDegree=None):
+      self.maxDegree = maxDegree
+
+   def name(self):
+      return "down-weight"
+
+   def capSize(self, n, maxDegree):
+      return n
+
+   def apply(self, inc, maxDegree):
+      return rebuildGroups(inc, lambda g, a, b: xrange(a, b),
+                           lambda g, n: 1. if n <= maxDegree else maxDegree / float(n))
+
+
+'''
+The plan of a projection (see makePlan); incidence is the (possibly hub
+capped) incidence matrix to run.
+'''
+class ProjectionPlan:
+   def __init__(self):
+      self.mode = "memory"
+      self.incidence = None
+      self.numMembers = 0
+      self.numGroups = 0
+      self.maxGroupSize = 0
+      self.rawPairs = 0
+      self.hubPolicy = None
+      self.maxDegree = None
+      self.cappedRawPairs = None
+      self.distinctPairs = 0
+      self.outputBytes = 0
+      self.memoryBytes = None
+      self.inMemoryBytes = 0
+      self.numPartitions = 1
+      self.numWorkers = 1
+
+   def report(self):
+      lines = ["Projection plan: %d members, %d groups, largest group %d" %(self.numMembers, self.numGroups, self.maxGroupSize),
+               "Projection plan: raw pairs %d" %(self.rawPairs)]
+      if self.hubPolicy is not None:
+         lines.append("Projection plan: hubs above degree %d (%s): raw pairs %d" %(self.maxDegree, self.hubPolicy.name(), self.cappedRawPairs))
+      lines.append("Projection plan: est. distinct pairs %d, est. output bytes %d" %(self.distinctPairs, self.outputBytes))
+      execution = self.mode
+      if self.mode == "partitioned":
+         execution += " (%d partitions)" %(self.numPartitions)
+      elif self.mode == "parallel":
+         execution += " (%d workers)" %(self.numWorkers)
+      if self.hubPolicy is not None:
+         execution = "hub-capped, " + execution
+      lines.append("Projection plan: execution " + execution)
+      return "\n".join(lines)
+
+
+'''
+Exactly project SAMPLE_ROWS random member rows of inc.
+Returns (estimated distinct pairs, mean output line length in chars).
+'''
+def sampleProjection(inc, withShared, withDollars):
+   n = inc.numMembers()
+   if n == 0:
+      return 0, 0.
+   rows = range(n) if n <= SAMPLE_ROWS else random.Random(SAMPLE_SEED).sample(xrange(n), SAMPLE_ROWS)
+   ids = inc.interner.ids
+   pairs = 0
+   chars = 0
+   for i in rows:
+      shared = dict()
+      for p in xrange(inc.memberOffsets[i], inc.memberOffsets[i + 1]):
+         g = inc.memberGroups[p]
+         w = 1 if inc.groupWeights is None else inc.groupWeights[g]
+         for q in xrange(inc.groupOffsets[g], inc.groupOffsets[g + 1]):
+            k = inc.groupMembers[q]
+            if k > i:
+               shared[k] = shared.get(k, 0) + w
+      pairs += len(shared)
+      for k in shared:
+         chars += len(str(ids[i])) + len(str(ids[k])) + 2
+         if withShared:
+            chars += len(str(shared[k])) + 1
+         if withDollars:
+            chars += DOLLARS_CHARS + 1
+   meanLine = chars / float(pairs) if pairs > 0 else 0.
+   return pairs * n / len(rows), meanLine
+
+
+'''
+Plan the projection of inc to filename (see above).
+memoryBytes, the memory budget (None: unlimited).
+maxPairs, the most raw pairs to generate (None: unlimited); over it, the
+   groups are capped with hubPolicy (default SkipHubs), at the policy's
+   maxDegree or else at the largest degree which keeps to maxPairs.
+numWorkers, the processes the projection may use.
+Returns a ProjectionPlan.
+'''
+def makePlan(inc, filename, withShared=False, withDollars=False, memoryBytes=None, maxPairs=None, hubPolicy=None, numWorkers=1):
+   plan = ProjectionPlan()
+   sizes = sorted([inc.groupSize(g) for g in xrange(inc.numGroups())])
+   plan.numMembers = inc.numMembers()
+   plan.numGroups = len(sizes)
+   plan.maxGroupSize = sizes[-1] if len(sizes) > 0 else 0
+   plan.rawPairs = projection.rawPairCount(inc)
+   plan.memoryBytes = memoryBytes
+
+   if (maxPairs is not None and plan.rawPairs > maxPairs) or (hubPolicy is not None and hubPolicy.maxDegree is not None):
+      if hubPolicy is None:
+         hubPolicy = SkipHubs()
+      maxDegree = hubPolicy.maxDegree
+      if maxDegree is None:
+         if isinstance(hubPolicy, DownWeightHubs):
+            raise ValueError("down-weighting hubs does not cap the pairs: give it a maxDegree")
+         # Largest degree (a group size, or 1) which keeps within maxPairs:
+         # cappedPairs grows with maxDegree, so binary search the sizes.
+         maxDegree = 1
+         distinctSizes = sorted(set(sizes))
+         lo, hi = 0, len(distinctSizes)
+         while lo < hi:
+            mid = (lo + hi) / 2
+            if cappedPairs(sizes, distinctSizes[mid], hubPolicy.capSize) > maxPairs:
+               hi = mid
+            else:
+               maxDegree = distinctSizes[mid]
+               lo = mid + 1
+      plan.hubPolicy = hubPolicy
+      plan.maxDegree = maxDegree
+      plan.cappedRawPairs = cappedPairs(sizes, maxDegree, hubPolicy.capSize)
+      inc = hubPolicy.apply(inc, maxDegree)
+   plan.incidence = inc
+
+   plan.distinctPairs, meanLine = sampleProjection(inc, withShared, withDollars)
+   if edgeWriter.outputFormat(filename) == "bin":
+      meanLine = 16 + 8 * (int(withShared) + int(withDollars))
+   plan.outputBytes = int(plan.distinctPairs * meanLine)
+
+   # In memory: the accumulators plus one block of pair rows.
+   pairsPerRow = plan.distinctPairs / float(max(1, plan.numMembers))
+   blockRows = min(projection.BLOCK_ROWS, plan.numMembers)
+   plan.inMemoryBytes = int(plan.numMembers * ACCUMULATOR_BYTES + (blockRows * pairsPerRow + edgeWriter.BLOCK_ROWS) * PAIR_ROW_BYTES)
+   rawPairs = plan.rawPairs if plan.hubPolicy is None else plan.cappedRawPairs
+   if numWorkers > 1 and rawPairs >= PARALLEL_MIN_PAIRS:
+      plan.mode = "parallel"
+      plan.numWorkers = numWorkers
+   elif memoryBytes is not None and plan.inMemoryBytes > memoryBytes:
+      plan.mode = "partitioned"
+      plan.numPartitions = projection.numPartitionsFor(inc, memoryBytes)
+   return plan
+
+
+'''
+The blocks of dense pair rows (see projection.projectBlocks) of plan
+(from makePlan), computed the way it chose.  ordered, the pairs must come
+in (i, k) order (else a partitioned plan may hash partition).
+'''
+def pairBlocks(plan, withDollars=False, spillDir=None, ordered=True):
+   if plan.mode == "parallel":
+      return parallelProjection.parallelBlocks(plan.incidence, plan.numWorkers, withDollars, spillDir, plan.memoryBytes)
+   if plan.mode == "partitioned":
+      return projection.partitionedBlocks(plan.incidence, plan.memoryBytes, withDollars, spillDir, plan.numPartitions, ordered)
+   return projection.projectBlocks(plan.incidence, withDollars)
+
+
+'''
+Run plan (from makePlan), writing the projection to filename (see
+projection.writeProjection).  Returns the number of pairs written.
+'''
+def execute(plan, filename, comment="", withShared=False, withDollars=False, spillDir=None):
+   blocks = pairBlocks(plan, withDollars, spillDir)
+   return projection.writeProjection(filename, plan.incidence, comment, withShared, withDollars, pairBlocks=blocks)
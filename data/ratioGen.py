@@ -7,42 +7,36 @@ which are not in the upper proportion of payments made and received by
 a company/doctor (the condition must be met both ways).
 '''
 
-import os
 import math
-import itertools
 from subprocess import call
+import paymentCache
+import plotManager
+import edgeWriter
+import histograms
+import paymentGraph
+import paymentStats
+import projection
+import projectionPlanner
+import paymentFilters
 
 
 '''
 Plot a CCDF in gnuplot.
 Inputs: filename, a tab sep file for gnuplot to injest (columns 1,2)
    title, the title of the plot.
-Output: (a gnuplot .png file is created)
+Output: (a gnuplot .png file is created, in the background and only if
+   filename changed since it was last plotted; see plotManager.py)
 '''
 def plotCCDF(filename, title):
-   gnuplotarg = '-e "filenameIn=\''+filename+'\'; titleIn=\''+title+'\'"'
-   os.system( "gnuplot "+gnuplotarg+" plotCCDF.plt" )
+   plotManager.plot("plotCCDF.plt", filename, titleIn=title)
 
 
 '''
-Plot a log-log plot, provided x, y axis titles and graph title.
+Plot a log-log plot, provided x, y axis titles and graph title (in the
+background, as plotCCDF).
 '''
 def plotLogLog(filename, title, xtitle="x", ytitle="y"):
-   gnuplotarg = '-e "filenameIn=\''+filename+'\'; titleIn=\''+title+'\'; xIn=\''+xtitle+'\'; yIn=\''+ytitle+'\'"'
-   os.system( "gnuplot "+gnuplotarg+" plotLogLog.plt" )
-
-
-'''
-Write a line in a tab file (like gnuplot takes as input).
-'''
-def writeTab(fout, x, y, z=None):
-   fout.write(str(x))
-   fout.write('\t')
-   fout.write(str(y))
-   if z is not None:
-      fout.write('\t')
-      fout.write(str(z))   
-   fout.write('\n')
+   plotManager.plot("plotLogLog.plt", filename, titleIn=title, xIn=xtitle, yIn=ytitle)
 
 
 '''
@@ -54,11 +48,7 @@ Inputs: d, a dictionary of {int,float} -> {int,float}, which will be
 Outputs: a file "filename.tab", where filename is the input variable.
 '''
 def writeHistogramFile(filename, d, comment=""):
-   with open(filename+".tab", "w") as fout:
-      if len(comment) > 0:
-         fout.write('# '+comment+'\n')
-      for k in sorted(d):
-         writeTab(fout, k, d[k])
+   edgeWriter.writeRows(filename+".tab", ((k, d[k]) for k in sorted(d)), comment)
       
 
 '''
@@ -69,13 +59,7 @@ Returns: a dict: int -> int, which is a integer number of payments to the
       number of doctors who received that many payments.
 '''
 def genPaymentCountHistogram(d):
-   hist = dict()
-   for k in d:
-      numPayments = len(d[k])
-      if numPayments not in hist:
-         hist[numPayments] = 0
-      hist[numPayments] += 1
-   return hist
+   return histograms.countHistogram([len(d[k]) for k in d])
 
 
 '''
@@ -99,19 +83,14 @@ Input: d:  a dict int(doctor/companyID) -> float(total payments a doctor
       output are upper bounds (so bin 0 represents the number
       of doctors/companies involved in total payments between
       0 <= x < binsize
+   mode, "linear" (bins of binsize), or "log"/"quantile" bins (see
+      histograms.py), whose counts are densities (per dollar of bin width).
 Output: a binned dict float($) -> int(count), which is the lower bound
    of a bin (size per input), and the number of doctors/companies who
    fall in that bin.
 '''
-def paymentAmountHistogram(d, binsize):
-   assert(binsize > 0)
-   out = dict() # float -> int
-   for k in d:
-      binNum = int( d[k] / binsize )
-      if binNum*binsize not in out:
-         out[binNum*binsize] = 0
-      out[binNum*binsize] += 1
-   return out
+def paymentAmountHistogram(d, binsize, mode="linear"):
+   return histograms.binnedHistogram(d.values(), mode, binsize, density=True)
 
 
 '''
@@ -121,50 +100,28 @@ Input: hist, a dict {int,float} -> int, a histogram, where the first
    value (key) is the "y" and the second is the count of datapoints.
 '''
 def ccdfFromHistogram(hist):
-   datasize = sum( hist.values() )
-   out = dict() # {int,float whatever the key is} -> float(1-0)
-   obsdata = 0  # accumulator for observed data (discards in CCDF)
-   for k in sorted(hist):
-      out[k] = (datasize - obsdata) / float(datasize)
-      assert(out[k] >= 0. and out[k] <= 1.)
-      obsdata += hist[k]
-   return out
+   return histograms.ccdf(hist)
 
 
 '''
 Print secondary statistics.
 Inputs:
-   cosToDocs, dict() of company -> set of doctors paid
-   docsToCos, dict() of doctor -> set of companies recvd from
+   stats, the paymentStats.PaymentStats of the payments (its doctor
+      degree histogram and mean degrees)
 Outputs: (.tab files and gnuplot-generated .png images)
 '''
-def printSecondaries(cosToDocs, docsToCos):
+def printSecondaries(stats):
    # Generate a histogram
    # Note: all the input data has been coalesced into one company->doc
    #       link, so this is the same as docs_payment_count_hist.tab
    # (number of companies x) (#docs paid by exactly x companies)
-   numCoToNumDocs = dict()
-   for k in docsToCos:
-      cosToThisDoc = len(docsToCos[k])
-      if cosToThisDoc not in numCoToNumDocs:
-         numCoToNumDocs[cosToThisDoc] = 0
-      numCoToNumDocs[cosToThisDoc] += 1
-
-   writeHistogramFile("secondary_numcos_docsPaidByNumCos_hist", numCoToNumDocs, "NumberOfCompaniesX   NumberOfDocsPaidByExactlyXCompanies")
+   writeHistogramFile("secondary_numcos_docsPaidByNumCos_hist", stats.docDegreeHist, "NumberOfCompaniesX   NumberOfDocsPaidByExactlyXCompanies")
 
    # Average degree of a doctor (how many companies pay the doc).
-   docDegSum = 0.
-   for d in docsToCos:
-      docDegSum += len( docsToCos[d] )
-   docDegSum /= len(docsToCos)
-   print "Average degree of a doctor (# cos pay the doc): %f" %(docDegSum)
+   print "Average degree of a doctor (# cos pay the doc): %f" %(stats.meanDocDegree())
 
    # Average degree of a company (how many doctors they pay).
-   coDegSum = 0.
-   for d in cosToDocs:
-      coDegSum += len( cosToDocs[d] )
-   coDegSum /= len(cosToDocs)
-   print "Average degree of a company (# docs they pay): %f" %(coDegSum)
+   print "Average degree of a company (# docs they pay): %f" %(stats.meanCoDegree())
   
 
 
@@ -172,144 +129,102 @@ def printSecondaries(cosToDocs, docsToCos):
 Parse the input file, using an ignore/removal set, and process the file
 into data structures.  Optionally, writes the filtered data out to a
 file in the same input format (eg: filter the original).
-Returns:
-   cos = dict() # company -> list of payments made
-   docs = dict() # doc/providerId -> list of payments recvd
-   cosToDocs = dict() # company -> set of doctors paid
-   docsToCos = dict() # doctor -> set of companies recvd from
+numWorkers is the number of processes used to parse filename when its
+binary cache has to be (re)built.
+Returns (the dict-like structures are views onto one paymentGraph.PaymentGraph):
+   cos # company -> list of payments made
+   docs # doc/providerId -> list of payments recvd
+   cosToDocs # company -> doctors paid
+   docsToCos # doctor -> companies recvd from
    badLines = [] # integer of bad line numbers in data
    rawTotalPayments = 0.
-   cosPayments = dict()  # company -> list[ (payment, doc) tuples ]
-   docsPayments = dict() # doctor -> list[ (payment, co) tuples ]
+   cosPayments # company -> list[ (payment, doc) tuples ], descending
+   docsPayments # doctor -> list[ (payment, co) tuples ], descending
 '''
-def fileToStructures(filename, skipCos=None, skipDocs=None, fileOutPrefix="", MIN_PAYMENT=float('-inf')):
-   outFile = None
-   # A few variables used for sanity checks
-   NUM_DOCS = 0
-   NUM_COS = 0
+def fileToStructures(filename, skipCos=None, skipDocs=None, fileOutPrefix="", MIN_PAYMENT=float('-inf'), numWorkers=1):
+   printBadLines = False
+   # Typed columns, from the binary cache when it is still valid.
+   pc = paymentCache.loadPayments(filename, numWorkers=numWorkers)
+   badLines = pc.badLines # integer of bad line numbers in data
+   if(printBadLines):
+      for b in badLines:
+         print "==== Problem on line %d" %(b)
+
+   # Filters
+   pipeline = paymentFilters.FilterPipeline()
+   pipeline.add(paymentFilters.ExcludeFilter(skipCos, skipDocs)).add(paymentFilters.MinAmountFilter(MIN_PAYMENT))
+   fileOut = ""
    if fileOutPrefix != "":
-      outFile = open(fileOutPrefix + filename, "w")
+      fileOut = fileOutPrefix + filename
+
+   cos, docs, cosToDocs, docsToCos, rawTotalPayments, cosPayments, docsPayments = columnsToStructures(pipeline.run(pc), fileOut)
+   return cos, docs, cosToDocs, docsToCos, badLines, rawTotalPayments, cosPayments, docsPayments
+
+
+'''
+Process (already filtered, see paymentFilters.py) payment columns into
+data structures.  Optionally, writes them out to the file fileOut in the
+same input format, with the header line header (default: the header of
+the original payment file).
+Returns cos, docs, cosToDocs, docsToCos, rawTotalPayments, cosPayments,
+docsPayments (as for fileToStructures).
+'''
+def columnsToStructures(pc, fileOut="", header=None):
+   if fileOut != "":
+      paymentFilters.writePaymentFile(fileOut, pc, header)
 
-   i = 0
-   printBadLines = False
-   badLines = [] # integer of bad line numbers in data
    rawTotalPayments = 0.
-   cos = dict() # company -> list of payments made
-   docs = dict() # doc/providerId -> list of payments recvd
-   cosToDocs = dict() # company -> set of doctors paid
-   docsToCos = dict() # doctor -> set of companies recvd from
-   cosPayments = dict()  # company -> list[ (payment, doc) tuples ]
-   docsPayments = dict() # doctor -> list[ (payment, co) tuples ]
-   
-   with open(filename) as fin:
-      for line in fin:
-         s = line.split()
-         i += 1
-         if i == 1:
-            if outFile is not None:
-               outFile.write(line)
-            continue # header line
-         if(len(s)!=3):
-            if(printBadLines):
-               print "==== Problem on line %d" %(i)
-               print line
-               print s
-               print str(len(s))
-            badLines.append(i)
-            continue
-         doc = int(s[0])
-         co = int(s[1])
-         amount = float(s[2])
-
-         # Filters
-         if skipCos is not None and co in skipCos:
-            #print "skipping co ",str(co)
-            continue
-         if skipDocs is not None and doc in skipDocs:
-            #print "skipping doc ",str(doc)
-            continue
-         if amount < MIN_PAYMENT:
-            continue
-
-         if doc not in docs:
-            docs[doc] = []
-            docsToCos[doc] = set()
-            docsPayments[doc] = []
-            NUM_DOCS += 1
-         if co not in cos:
-            cos[co] = []
-            cosToDocs[co] = set()
-            cosPayments[co] = []
-            NUM_COS += 1
-         docs[doc].append(amount)
-         cos[co].append(amount)
-         docsToCos[doc].add(co)
-         cosToDocs[co].add(doc)
-         docsPayments[doc].append( (amount, co) )
-         cosPayments[co].append( (amount, doc) )
-         rawTotalPayments += amount
-         #print doc, " ", co, " ", amount
-         if outFile is not None:
-            writeTab(outFile, doc, co, amount)
-
-   if outFile is not None:
-      outFile.close()
-
-   # debug only
-   if skipCos is None and skipDocs is None:
-      assert(NUM_COS == len(cos))
-      assert(NUM_DOCS == len(docs))
-
-   for c in cosPayments:
-      cosPayments[c].sort(reverse=True)
-   for d in docsPayments:
-      docsPayments[d].sort(reverse=True)
+   for amount in pc.amounts:
+      rawTotalPayments += amount
 
-   return cos, docs, cosToDocs, docsToCos, badLines, rawTotalPayments, cosPayments, docsPayments
+   graph = paymentGraph.PaymentGraph.fromColumns(pc)
+   cos = graph.paymentsByCo() # company -> list of payments made
+   docs = graph.paymentsByDoc() # doc/providerId -> list of payments recvd
+   cosToDocs = graph.docsByCo() # company -> doctors paid
+   docsToCos = graph.cosByDoc() # doctor -> companies recvd from
+   cosPayments = graph.paymentsRankedByCo()  # company -> list[ (payment, doc) tuples ]
+   docsPayments = graph.paymentsRankedByDoc() # doctor -> list[ (payment, co) tuples ]
+   return cos, docs, cosToDocs, docsToCos, rawTotalPayments, cosPayments, docsPayments
 
 
 '''
 Given a cosToDocs dict, (company -> set of doctors paid), generate
 a series of edges in the doc-doc (provider-provider) network:
 A doc has an edge to another if they are paid by the same company.
-Output is a tab-sep file for snap usage, docNId docNid
+Output is a tab-sep file for snap usage, docNId docNid, named
+filePrefix+fileSuffix; a suffix ending in .bin/.gz/.bz2/.xz selects a
+binary and/or compressed file instead (see edgeWriter.py).
+withShared adds a column with the number of companies the two share,
+withDollars one with their shared dollars (cosToDocs must then be a
+paymentGraph view), see projection.py.
+The projection is planned first (see projectionPlanner.py) and the plan
+printed.  memoryBytes, if given, caps the memory used: when the in-memory
+projection would not fit, the pairs are spilled to hash-partitioned
+temporary files (under spillDir) and deduplicated one partition at a
+time.  maxPairs caps the pairs generated, by applying hubPolicy (default
+skip) to the companies paying the most doctors.  numWorkers > 1 shards
+the companies over a process pool (see parallelProjection.py).
 '''
-def writeDocDoc(cosToDocs, filePrefix=""):
-   edges = set() # set of pairs (companyID, companyID), lower integer
-   # of the tuple comes first
-   for c in cosToDocs:
-      combEdges = list(itertools.combinations(cosToDocs[c],2))
-      print "writeDocDoc edges %d" %(len(combEdges))
-      for e in combEdges:
-         edges.add(( min(e[0],e[1]), max(e[0],e[1]) ))
-
-   print "Number of nonduplicated doc-doc edges: " +str(len(edges))
-
-   with open(filePrefix+"_.tab", "w") as fout:
-      # Write title line
-      fout.write("# doctorId   doctorId")
-      fout.write('\n')
-      for e in edges:
-         writeTab(fout, e[0], e[1])
-
-
-def writeCoCo(docsToCos, filePrefix=""):
-   edges = set() # set of pairs (companyID, companyID), lower integer
-   # of the tuple comes first
-   for d in docsToCos:
-      combEdges = list(itertools.combinations(docsToCos[d],2))
-      print "writeCoCo edges %d" %(len(combEdges))
-      for e in combEdges:
-         edges.add(( min(e[0],e[1]), max(e[0],e[1]) ))
-
-   print "Number of nonduplicated co-co edges: " +str(len(edges))
-
-   with open(filePrefix+"_.tab", "w") as fout:
-      # Write title line
-      fout.write("# companyID   companyId")
-      fout.write('\n')
-      for e in edges:
-         writeTab(fout, e[0], e[1])
+def writeDocDoc(cosToDocs, filePrefix="", fileSuffix="_.tab", withShared=False, withDollars=False, memoryBytes=None, spillDir=None, maxPairs=None, hubPolicy=None, numWorkers=1):
+   # Sparse projection, pairs deduplicated as they are generated
+   inc = projection.Incidence.fromNeighbourLists(cosToDocs, withDollars)
+   comment = "doctorId   doctorId" + ("   sharedCompanies" if withShared else "") + ("   sharedDollars" if withDollars else "")
+   plan = projectionPlanner.makePlan(inc, filePrefix+fileSuffix, withShared, withDollars, memoryBytes, maxPairs, hubPolicy, numWorkers)
+   print plan.report()
+   numEdges = projectionPlanner.execute(plan, filePrefix+fileSuffix, comment, withShared, withDollars, spillDir)
+
+   print "Number of nonduplicated doc-doc edges: " +str(numEdges)
+
+
+def writeCoCo(docsToCos, filePrefix="", fileSuffix="_.tab", withShared=False, withDollars=False, memoryBytes=None, spillDir=None, maxPairs=None, hubPolicy=None, numWorkers=1):
+   # Sparse projection, pairs deduplicated as they are generated
+   inc = projection.Incidence.fromNeighbourLists(docsToCos, withDollars)
+   comment = "companyID   companyId" + ("   sharedDoctors" if withShared else "") + ("   sharedDollars" if withDollars else "")
+   plan = projectionPlanner.makePlan(inc, filePrefix+fileSuffix, withShared, withDollars, memoryBytes, maxPairs, hubPolicy, numWorkers)
+   print plan.report()
+   numEdges = projectionPlanner.execute(plan, filePrefix+fileSuffix, comment, withShared, withDollars, spillDir)
+
+   print "Number of nonduplicated co-co edges: " +str(numEdges)
 
 '''
 Filter out payments/links based on the proportion of total payments.
@@ -397,83 +312,27 @@ def percentileFilter(cosA, docsA, cosToDocsA, docsToCosA, cosPayments, docsPayme
 '''
 "Proportion" determined by the intersection of edges which meet both
 conditions:
- 1. Amount > UPPER_COS_PAYMENT_PROPORTION
- 2. Amount > UPPER_DOC_PAYMENT_PROPORTION
+ 1. Amount >= UPPER_COS_PAYMENT_PROPORTION * (company's total payments)
+ 2. Amount >= UPPER_DOC_PAYMENT_PROPORTION * (doctor's total payments)
+Identical (doctor, company, amount) payments are kept once.
+Input: pc, the payment columns (paymentCache.PaymentColumns), which are
+   filtered in memory.
+Returns cos, docs, cosToDocs, docsToCos, rawTotalPayments of the kept
+   payments.
 '''
-def proportionFilter(cosA, docsA, cosToDocsA, docsToCosA, cosPayments, docsPayments, UPPER_COS_PAYMENT_PROPORTION, UPPER_DOC_PAYMENT_PROPORTION, writeCSV=False):
+def proportionFilter(pc, UPPER_COS_PAYMENT_PROPORTION, UPPER_DOC_PAYMENT_PROPORTION, writeCSV=False):
+   pipeline = paymentFilters.FilterPipeline()
+   pipeline.add(paymentFilters.ProportionFilter(UPPER_COS_PAYMENT_PROPORTION, UPPER_DOC_PAYMENT_PROPORTION))
+   pipeline.add(paymentFilters.DistinctPaymentsFilter())
 
-   cos = dict() # company -> list of payments made
-   docs = dict() # doc/providerId -> list of payments recvd
-   cosToDocs = dict() # company -> set of doctors paid
-   docsToCos = dict() # doctor -> set of companies recvd from
-   rawTotalPayments = 0.
-   #cosPayments = dict()  # company -> list[ (payment, doc) tuples ]
-   #docsPayments = dict() # doctor -> list[ (payment, co) tuples ]
-
-   # Total payments to each doc
-   cosThresh = dict()  # companyId -> threshold$
-   for c in cosA:
-      cosThresh[c] = sum(cosA[c]) * UPPER_COS_PAYMENT_PROPORTION
-   # Total payments from each company
-   docsThresh = dict() # docId -> threshold$
-   for d in docsA:
-      docsThresh[d] = sum(docsA[d]) * UPPER_DOC_PAYMENT_PROPORTION
-   # The above are thresholds (individual total * _PROPORTION)
-
-   # Candidate sets
-   # Each set is a triple: (company, doctor, amount)
-   docsCand = set() # candidates from doc perspective
-   cosCand = set() # candidates from cos perspective
-
-   # Company thresholds
-   for co in cosPayments:
-      paylist = cosPayments[co]
-      for i in paylist:
-         payment = i[0]
-         d = i[1]
-         if payment >= cosThresh[co]:
-            cosCand.add( (co, d, payment) )
-
-   # Doctor thresholds
-   for d in docsPayments:
-      paylist = docsPayments[d]
-      for i in paylist:
-         payment = i[0]
-         co = i[1]
-         if payment >= docsThresh[d]:
-            docsCand.add( (co, d, payment) )
-
-   # Perform set intersection to find the actuals payments to keep.
-   actuals = cosCand.intersection(docsCand)
-
-   outfile = None
+   fileOut = ""
+   headerline = None
    if writeCSV:
       # Write the "csv" file.
       headerline = "Physician_Profile_ID\tApplicable_Manufacturer_or_Applicable_GPO_Making_Payment_ID\tAmount\n"
-      outfile = open("minProportion_doc_"+str(UPPER_DOC_PAYMENT_PROPORTION)+"_co_"+str(UPPER_COS_PAYMENT_PROPORTION)+"_payment_graph_physician_company.csv", "w")
-      outfile.write(headerline)
-
-   for a in actuals:
-      co = a[0]
-      d = a[1]
-      payment = a[2]
-      if outfile != None:
-         writeTab(outfile, d, co, payment)
-      rawTotalPayments += payment
-      if co not in cos:
-         cos[co] = []
-         cosToDocs[co] = set()
-      if d not in docs:
-         docs[d] = []
-         docsToCos[d] = set()
-      cos[co].append(payment)
-      docs[d].append(payment)
-      cosToDocs[co].add(d)
-      docsToCos[d].add(co)
-
-   if outfile != None:
-      outfile.close()
+      fileOut = "minProportion_doc_"+str(UPPER_DOC_PAYMENT_PROPORTION)+"_co_"+str(UPPER_COS_PAYMENT_PROPORTION)+"_payment_graph_physician_company.csv"
 
+   cos, docs, cosToDocs, docsToCos, rawTotalPayments, cosPayments, docsPayments = columnsToStructures(pipeline.run(pc), fileOut, headerline)
    return cos, docs, cosToDocs, docsToCos, rawTotalPayments
 
 
@@ -492,8 +351,10 @@ def proportionTrim(filename):
    # To be sorted in decending order after generation.
 
    #rawTotalPayments = 0.
-   # First pass, no filters.
-   cosR, docsR, cosToDocsR, docsToCosR, badLines, rawTotalPaymentsR, cosPaymentsR, docsPaymentsR = fileToStructures(filename)
+   # Parse (or load from the cache) once, no filters: each threshold of
+   # the sweep filters the in-memory columns.
+   pc = paymentCache.loadPayments(filename)
+   badLines = pc.badLines
 
 
    #UPPER_COS_PAYMENT_PROPORTION = 0.0  # top 10%
@@ -503,7 +364,7 @@ def proportionTrim(filename):
       #for UPPER_DOC_PAYMENT_PROPORTION in [0.10, 0.15, 0.20, 0.25, 0.33]:
       for UPPER_DOC_PAYMENT_PROPORTION in [0.10]:
          print "CO: "+str(UPPER_COS_PAYMENT_PROPORTION)+" DOC: "+str(UPPER_DOC_PAYMENT_PROPORTION)
-         cos, docs, cosToDocs, docsToCos, rawTotalPayments = proportionFilter(cosR, docsR, cosToDocsR, docsToCosR, cosPaymentsR, docsPaymentsR, UPPER_COS_PAYMENT_PROPORTION, UPPER_DOC_PAYMENT_PROPORTION, True)
+         cos, docs, cosToDocs, docsToCos, rawTotalPayments = proportionFilter(pc, UPPER_COS_PAYMENT_PROPORTION, UPPER_DOC_PAYMENT_PROPORTION, True)
          # Write the snap-ready doc-doc and co-co networks
          descr = "_prop_doc_"+str(UPPER_DOC_PAYMENT_PROPORTION)+"_co_"+str(UPPER_COS_PAYMENT_PROPORTION)
          writeCoCo(docsToCos, "company_company"+descr)
@@ -538,35 +399,33 @@ def proportionTrim(filename):
    cos, docs, cosToDocs, docsToCos, badLines, rawTotalPayments = fileToStructures(filename, removeCos, removeDocs, filePrefix, MIN_PAYMENT)
    '''
 
+   if len(docs) == 0:
+      print "No payments left after the filters: no statistics written"
+      return
+
+   # Every statistic below, in one pass over each side of the graph.
+   stats = paymentStats.viewStats(cos, docs, cosToDocs, docsToCos)
+
    print "==== Results ===="
    print "Bad lines in file (lines excluded): %d" %(len(badLines))
-   print "Num providers/docs: %d" %(len(docs))
-   print "Num companies/payers: %d" %(len(cos))
-   maxPayout = max([v for sub in cos.values() for v in sub])
-   print "Largest payout %f" %(maxPayout)
-   maxPayin = max([v for sub in docs.values() for v in sub])
-   print "Largest payin %f" %(maxPayin)
-
-   coTotalPayments = 0.
-   numPayments = 0
-   for c in cos:
-      for p in cos[c]:
-         numPayments += 1
-         coTotalPayments += p
-   totalPayments = sum([v for sub in docs.values() for v in sub])
-   print "Total of all payments %f" %(totalPayments)
-   print "Total of all paymentsC %f" %(coTotalPayments)
+   print "Num providers/docs: %d" %(stats.numDocs)
+   print "Num companies/payers: %d" %(stats.numCos)
+   print "Largest payout %f" %(stats.maxPayout)
+   print "Largest payin %f" %(stats.maxPayin)
+
+   print "Total of all payments %f" %(stats.docTotalPayments)
+   print "Total of all paymentsC %f" %(stats.coTotalPayments)
    print "Total of all paymentsRaw %f" %(rawTotalPayments)
-   print "Num payments (good lines): %d" %(numPayments)
+   print "Num payments (good lines): %d" %(stats.numPayments)
 
    #writeCoCo(docsToCos, "company_company_k3_1000")
    #writeDocDoc(cosToDocs, "doc_doc_k3_1000")
 
 
-   cosPaymentCountHist = genPaymentCountHistogram(cos)
+   cosPaymentCountHist = stats.coCountHist
    #assert(NUM_COS == sum( cosPaymentCountHist.values() ))
 
-   docsPaymentCountHist = genPaymentCountHistogram(docs)
+   docsPaymentCountHist = stats.docCountHist
    #assert(NUM_DOCS == sum( docsPaymentCountHist.values() ))
 
    #print "cos: Num payments, num companies making that many payments"
@@ -577,9 +436,9 @@ def proportionTrim(filename):
    #for k in sorted(docsPaymentCountHist):
    #   print "%d %d" %(k, docsPaymentCountHist[k])
 
-   cosSumPayments = sumPayments(cos)
+   cosSumPayments = stats.coTotals
    #assert(NUM_COS == len(cosSumPayments))
-   docsSumPayments = sumPayments(docs)
+   docsSumPayments = stats.docTotals
    #assert(NUM_DOCS == len(docsSumPayments))
 
    binsize = 10.
@@ -601,9 +460,13 @@ def proportionTrim(filename):
    writeHistogramFile("docs_payment_count_hist", docsPaymentCountHist, "NumberOfPayments   NumberOfDoctorsReceivingThatManyPayments")
    writeHistogramFile("cos_payment_dollars_hist", cosPaymentDollarsHist, "TotalOfPaymentsDollars   NumCompaniesMakingThatMuchInTotalPayments")
    writeHistogramFile("docs_payment_dollars_hist", docsPaymentDollarsHist, "TotalOfPaymentsDollars   NumDoctorsTakingThatMuchInTotalPayments")
+   # Log binned: the heavy tails in a few bins rather than thousands.
+   writeHistogramFile("cos_payment_dollars_loghist", paymentAmountHistogram(cosSumPayments, binsize, "log"), "TotalOfPaymentsDollars(LogBinLowerBound)   NumCompaniesPerDollarOfBinWidth")
+   writeHistogramFile("docs_payment_dollars_loghist", paymentAmountHistogram(docsSumPayments, binsize, "log"), "TotalOfPaymentsDollars(LogBinLowerBound)   NumDoctorsPerDollarOfBinWidth")
 
    # Plot histograms for gnuplot.
    plotLogLog("docs_payment_count_hist.tab", "Doctor(node) to community degree distribution histogram", "Degree", "Number of Doctors")
+   plotLogLog("docs_payment_dollars_loghist.tab", "Doctor total payments histogram (log bins)", "Total payments ($)", "Doctors per $ of bin width")
 
 
    # Create CCDF distributions (counts at or above the level).
@@ -625,7 +488,7 @@ def proportionTrim(filename):
    plotCCDF("docs_payment_dollars_ccdf.tab", "CCDF, x is total value $ of payments, y is % of doctors taking >= that total amount ($) of payments")
 
    # Secondary stastics
-   printSecondaries(cosToDocs, docsToCos)
+   printSecondaries(stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+'''
+sketches.py
+Bryan Lewandowski
+
+Bounded memory, mergeable summaries of a stream of values, for the
+streaming and multi-process statistics (see paymentAggregates.py) where
+exact per-entity sets and sorted payment lists do not fit:
+   QuantileSketch  approximate quantiles/ranks (a KLL sketch: levels of
+                   sorted compactors, each holding items of weight
+                   2^level, where half of a full level is promoted)
+   HyperLogLog     approximate number of distinct values (sparse while
+                   it holds few registers, so a low degree entity costs
+                   little)
+
+Each is built for an error bound (forError): a QuantileSketch answers
+ranks to within about rankError * n, a HyperLogLog counts to within
+about relativeError (one standard error).  Two sketches of the same
+parameters merge into the sketch of both streams, so workers can
+summarise byte ranges of a file separately (see findRanges).  state()
+is a JSON-able dict of a sketch and fromState() rebuilds it, for
+partial results written to disk or sent between processes (they also
+pickle).
+'''
+
+import math
+import random
+import hashlib
+from bisect import bisect_right
+
+QUANTILE_K = 200 # default KLL k: rank error about 1.3%
+KLL_C = 2. / 3. # capacity ratio of a KLL level to the level above it
+KLL_SEED = 240
+HLL_PRECISION = 12 # default 2^12 registers: relative error about 1.6%
+HLL_SPARSE_FRACTION = 8 # sparse until 1/HLL_SPARSE_FRACTION of the registers are set
+MASK64 = (1 << 64) - 1
+
+
+'''
+A KLL quantile sketch of (comparable) values.  k sets the accuracy (see
+forError); the sketch holds O(k) items however many values were added.
+'''
+class QuantileSketch:
+   def __init__(self, k=QUANTILE_K, seed=KLL_SEED):
+      self.k = k
+      self.levels = [[]]
+      self.n = 0 # values added
+      self.min = None
+      self.max = None
+      self.rng = random.Random(seed)
+
+   '''
+   A sketch whose ranks are within about rankError * n (eg: 0.01).
+   '''
+   @classmethod
+   def forError(cls, rankError):
+      return cls(max(8, int(math.ceil(2.66 / rankError))))
+
+   '''
+   Most items level h may hold before it is compacted.
+   '''
+   def capacity(self, h):
+      depth = len(self.levels) - h - 1
+      return int(math.ceil(self.k * KLL_C ** depth)) + 1
+
+   def size(self):
+      return sum([len(level) for level in self.levels])
+
+   def maxSize(self):
+      return sum([self.capacity(h) for h in xrange(len(self.levels))])
+
+   def add(self, x):
+      self.levels[0].append(x)
+      self.n += 1
+      if self.min is None or x < self.min:
+         self.min = x
+      if self.max is None or x > self.max:
+         self.max = x
+      if len(self.levels[0]) >= self.capacity(0):
+         self.compress()
+
+   def extend(self, values):
+      for x in values:
+         self.add(x)
+
+   '''
+   Compact full levels, lowest first, until the sketch is back under its
+   size: a full level is sorted and every other item (from a random
+   first one) is promoted to the level above, at twice the weight.
+   '''
+   def compress(self):
+      while self.size() >= self.maxSize():
+         for h in xrange(len(self.levels)):
+            level = self.levels[h]
+            if len(level) < self.capacity(h):
+               continue
+            if h + 1 == len(self.levels):
+               self.levels.append([])
+            level.sort()
+            keep = level[:len(level) % 2] # an odd item out stays
+            self.levels[h + 1].extend(level[len(keep) + self.rng.randint(0, 1)::2])
+            self.levels[h] = keep
+            break
+
+   '''
+   Merge in other, a sketch of the same k.
+   '''
+   def merge(self, other):
+      if other.k != self.k:
+         raise ValueError("merging quantile sketches of k %d and %d" %(self.k, other.k))
+      while len(self.levels) < len(other.levels):
+         self.levels.append([])
+      for h in xrange(len(other.levels)):
+         self.levels[h].extend(other.levels[h])
+      self.n += other.n
+      for x in [other.min, other.max]:
+         if x is not None:
+            if self.min is None or x < self.min:
+               self.min = x
+            if self.max is None or x > self.max:
+               self.max = x
+      self.compress()
+
+   '''
+   The items held and their cumulative weights, in increasing order.
+   '''
+   def cumulative(self):
+      items = sorted([(x, 1 << h) for h in xrange(len(self.levels)) for x in self.levels[h]])
+      values = []
+      weights = []
+      total = 0
+      for x, w in items:
+         total += w
+         values.append(x)
+         weights.append(total)
+      return values, weights
+
+   '''
+   Estimated number of values <= x.
+   '''
+   def rank(self, x):
+      values, weights = self.cumulative()
+      i = bisect_right(values, x)
+      return weights[i - 1] if i > 0 else 0
+
+   '''
+   Estimated q-quantile (0 <= q <= 1) of the values: the smallest held
+   item whose estimated rank is at least q * n (q 0 and 1 are the exact
+   minimum and maximum).  None if no value was added.
+   '''
+   def quantile(self, q):
+      if self.n == 0:
+         return None
+      if q <= 0:
+         return self.min
+      if q >= 1:
+         return self.max
+      values, weights = self.cumulative()
+      target = q * weights[-1]
+      for x, w in zip(values, weights):
+         if w >= target:
+            return x
+      return values[-1]
+
+   def quantiles(self, qs):
+      return [self.quantile(q) for q in qs]
+
+   def state(self):
+      return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": self.levels}
+
+   @classmethod
+   def fromState(cls, state):
+      sketch = cls(state["k"])
+      sketch.n = state["n"]
+      sketch.min = state["min"]
+      sketch.max = state["max"]
+      sketch.levels = [list(level) for level in state["levels"]]
+      return sketch
+
+
+'''
+A well mixed 64 bit hash of an int (the splitmix64 finalizer), or of
+the str() of anything else (md5), the same in every process.
+'''
+def hash64(x):
+   if isinstance(x, (int, long)):
+      x = (x + 0x9E3779B97F4A7C15) & MASK64
+      x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+      x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+      return x ^ (x >> 31)
+   return int(hashlib.md5(str(x)).hexdigest()[:16], 16)
+
+
+'''
+A HyperLogLog distinct counter with 2^precision registers (standard
+error about 1.04 / sqrt(2^precision)).  The registers are kept sparse,
+as a dict register -> value, until more than 1/HLL_SPARSE_FRACTION of
+them are set.
+'''
+class HyperLogLog:
+   def __init__(self, precision=HLL_PRECISION):
+      if not 4 <= precision <= 18:
+         raise ValueError("HyperLogLog precision must be 4..18, not %d" %(precision))
+      self.precision = precision
+      self.sparse = dict()
+      self.registers = None # bytearray, once dense
+
+   '''
+   A counter whose standard error is at most relativeError (eg: 0.02).
+   '''
+   @classmethod
+   def forError(cls, relativeError):
+      return cls(min(18, max(4, int(math.ceil(2 * math.log(1.04 / relativeError, 2))))))
+
+   def numRegisters(self):
+      return 1 << self.precision
+
+   def densify(self):
+      self.registers = bytearray(self.numRegisters())
+      for j, r in self.sparse.iteritems():
+         self.registers[j] = r
+      self.sparse = None
+
+   '''
+   Set register j to at least r.
+   '''
+   def update(self, j, r):
+      if self.registers is not None:
+         if r > self.registers[j]:
+            self.registers[j] = r
+         return
+      if r > self.sparse.get(j, 0):
+         self.sparse[j] = r
+         if len(self.sparse) * HLL_SPARSE_FRACTION > self.numRegisters():
+            self.densify()
+
+   def add(self, x):
+      h = hash64(x)
+      p = self.precision
+      rest = h & ((1 << (64 - p)) - 1)
+      # Register from the top p bits, value the position of the first 1
+      # in the rest.
+      self.update(h >> (64 - p), 64 - p - rest.bit_length() + 1)
+
+   '''
+   Merge in other, a counter of the same precision.
+   '''
+   def merge(self, other):
+      if other.precision != self.precision:
+         raise ValueError("merging HyperLogLogs of precision %d and %d" %(self.precision, other.precision))
+      if other.registers is None:
+         for j, r in other.sparse.iteritems():
+            self.update(j, r)
+         return
+      if self.registers is None:
+         self.densify()
+      registers = self.registers
+      for j in xrange(len(registers)):
+         if other.registers[j] > registers[j]:
+            registers[j] = other.registers[j]
+
+   '''
+   Estimated number of distinct values added (with the small range,
+   linear counting, correction).
+   '''
+   def estimate(self):
+      m = self.numRegisters()
+      if self.registers is None:
+         zeros = m - len(self.sparse)
+         inverse = zeros + sum([2. ** -r for r in self.sparse.itervalues()])
+      else:
+         zeros = self.registers.count("\x00")
+         inverse = sum([2. ** -r for r in self.registers])
+      alpha = 0.7213 / (1 + 1.079 / m)
+      if m == 16:
+         alpha = 0.673
+      elif m == 32:
+         alpha = 0.697
+      elif m == 64:
+         alpha = 0.709
+      e = alpha * m * m / inverse
+      if e <= 2.5 * m and zeros > 0:
+         e = m * math.log(m / float(zeros))
+      return e
+
+   '''
+   The estimate, rounded to a count.
+   '''
+   def count(self):
+      return int(round(self.estimate()))
+
+   def __len__(self):
+      return self.count()
+
+   def state(self):
+      if self.registers is None:
+         return {"precision": self.precision, "sparse": sorted(self.sparse.items())}
+      return {"precision": self.precision, "registers": str(self.registers).encode("hex")}
+
+   @classmethod
+   def fromState(cls, state):
+      hll = cls(state["precision"])
+      if "registers" in state:
+         hll.sparse = None
+         hll.registers = bytearray(str(state["registers"]).decode("hex"))
+      else:
+         hll.sparse = dict((j, r) for j, r in state["sparse"])
+      return hll
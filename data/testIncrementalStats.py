@@ -0,0 +1,113 @@
+'''
+testIncrementalStats.py
+Bryan Lewandowski
+
+Checks that genStats.printIncrementalStats of a payment file grown by
+appended batches writes the same .tab files as printStreamingStats of
+the whole file, also when a run is interrupted after it committed a
+batch but before it wrote the .tab files.
+Run: python -m unittest testIncrementalStats (from data/)
+'''
+
+import os
+import sys
+import glob
+import random
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import genStats
+
+HEADER = "Physician_Profile_ID\tApplicable_Manufacturer_or_Applicable_GPO_Making_Payment_ID\tAmount\n"
+
+
+'''
+numLines random payment lines (doctor, company, amount).
+'''
+def paymentLines(rng, numLines):
+   return ["%d\t%d\t%.2f\n" %(rng.randrange(500), 100000000000 + rng.randrange(40), rng.expovariate(0.01))
+           for i in xrange(numLines)]
+
+
+'''
+The .tab files of the current directory: name -> content.
+'''
+def tabFiles():
+   return dict((name, open(name).read()) for name in glob.glob("*.tab"))
+
+
+class Interrupted(Exception):
+   pass
+
+
+def interrupt(hists):
+   raise Interrupted()
+
+
+class IncrementalStatsTest(unittest.TestCase):
+   def setUp(self):
+      self.cwd = os.getcwd()
+      self.stdout = sys.stdout
+      self.dir = tempfile.mkdtemp(prefix="incrementalStats")
+      rng = random.Random(240)
+      self.batches = [paymentLines(rng, 2000) for i in xrange(3)]
+      os.mkdir(os.path.join(self.dir, "full"))
+      os.mkdir(os.path.join(self.dir, "inc"))
+      sys.stdout = StringIO()
+
+   def tearDown(self):
+      sys.stdout = self.stdout
+      os.chdir(self.cwd)
+      shutil.rmtree(self.dir, True)
+
+   '''
+   The .tab files of printStreamingStats of the whole file.
+   '''
+   def fullTabs(self):
+      os.chdir(os.path.join(self.dir, "full"))
+      with open("p.csv", "w") as fout:
+         fout.write(HEADER)
+         for batch in self.batches:
+            fout.writelines(batch)
+      genStats.printStats("p.csv", streaming=True)
+      return tabFiles()
+
+   def append(self, batch):
+      with open("p.csv", "a") as fout:
+         fout.writelines(batch)
+
+   def testAppendedBatches(self):
+      expected = self.fullTabs()
+      os.chdir(os.path.join(self.dir, "inc"))
+      with open("p.csv", "w") as fout:
+         fout.write(HEADER)
+      for batch in self.batches:
+         self.append(batch)
+         genStats.printStats("p.csv", incremental=True)
+      self.assertEqual(tabFiles(), expected)
+
+   def testInterruptedBeforeWrite(self):
+      expected = self.fullTabs()
+      os.chdir(os.path.join(self.dir, "inc"))
+      with open("p.csv", "w") as fout:
+         fout.write(HEADER)
+      self.append(self.batches[0])
+      genStats.printStats("p.csv", incremental=True)
+      for batch in self.batches[1:]:
+         self.append(batch)
+      # The batches are committed, then the run stops before the .tab files
+      # are written; the next run reads nothing new but must write them.
+      writeHistograms = genStats.writeHistograms
+      genStats.writeHistograms = interrupt
+      try:
+         self.assertRaises(Interrupted, genStats.printStats, "p.csv", incremental=True)
+      finally:
+         genStats.writeHistograms = writeHistograms
+      genStats.printStats("p.csv", incremental=True)
+      self.assertEqual(tabFiles(), expected)
+
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,54 @@
+'''
+testKGt3.py
+Bryan Lewandowski
+
+Checks that kGt3.k3Trim reports an empty (3, 3)-core, and writes no
+statistics or networks for it, rather than failing on the statistics of
+no payments.
+Run: python -m unittest testKGt3 (from data/)
+'''
+
+import os
+import sys
+import glob
+import random
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import kGt3
+
+HEADER = "Physician_Profile_ID\tApplicable_Manufacturer_or_Applicable_GPO_Making_Payment_ID\tAmount\n"
+
+
+class EmptyCoreTest(unittest.TestCase):
+   def setUp(self):
+      self.cwd = os.getcwd()
+      self.stdout = sys.stdout
+      self.dir = tempfile.mkdtemp(prefix="kGt3")
+      os.chdir(self.dir)
+      sys.stdout = StringIO()
+
+   def tearDown(self):
+      sys.stdout = self.stdout
+      os.chdir(self.cwd)
+      shutil.rmtree(self.dir, True)
+
+   def testEmptyCore(self):
+      # Many small payments, and a few large ones which no doctor or
+      # company has three of: nothing survives the peel.
+      rng = random.Random(240)
+      with open("p.csv", "w") as fout:
+         fout.write(HEADER)
+         for i in xrange(3000):
+            fout.write("%d\t%d\t%.2f\n" %(rng.randrange(300), 100000000000 + rng.randrange(20), rng.uniform(1, 999)))
+         for doc, co in [(1, 1), (2, 1), (3, 2), (4, 3)]:
+            fout.write("%d\t%d\t%.2f\n" %(doc, 100000000000 + co, 5000.))
+      kGt3.k3Trim("p.csv", writeCSV=False)
+      self.assertTrue("core is empty" in sys.stdout.getvalue())
+      self.assertEqual(glob.glob("*.tab"), [])
+
+
+if __name__ == "__main__":
+   unittest.main()